@@ -1,12 +1,33 @@
+import base64
 import boto3
+import codecs
+import gzip
+import hashlib
+import importlib.util
 import json
 import os
+import sys
+import threading
 import uuid
 import time
 from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
 
 
+# boto3 のセッションはスレッドセーフではないため、並行実行するステップはスレッド毎のセッションを使う
+_thread_local = threading.local()
+
+
+def thread_client(service_name: str, **kwargs):
+    """呼び出しスレッド専用のセッションからクライアントを作成"""
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        session = _thread_local.session = boto3.Session()
+    return session.client(service_name, **kwargs)
+
+
 # SSO プロファイル設定（~/.aws/config から抽出）
 SSO_PROFILES = {
     'crave': {
@@ -218,24 +239,19 @@ def complete_sso_login(profile_name: str, client_id: str, client_secret: str, de
         return {'error': str(e)}
 
 
-def collect_resources_with_credentials(credentials: dict, region: str = 'ap-northeast-1') -> dict:
-    """ユーザーの認証情報を使ってリソースを収集"""
-    session = boto3.Session(
+def create_user_session(credentials: dict, region: str = 'ap-northeast-1'):
+    """ユーザーの認証情報からセッションを作成（セッションはスレッド間で共有しないこと）"""
+    return boto3.Session(
         aws_access_key_id=credentials['accessKeyId'],
         aws_secret_access_key=credentials['secretAccessKey'],
         aws_session_token=credentials['sessionToken'],
         region_name=region
     )
-    
-    resources = {
-        'ec2': [],
-        'rds': [],
-        'docdb': [],
-        'redis': [],
-        'memcache': []
-    }
-    
-    # EC2
+
+
+def collect_ec2_with_session(session) -> list:
+    """ユーザーセッションでEC2を収集"""
+    items = []
     try:
         ec2 = session.client('ec2')
         response = ec2.describe_instances()
@@ -272,7 +288,7 @@ def collect_resources_with_credentials(credentials: dict, region: str = 'ap-nort
                     session, instance['InstanceId'], 'AWS/EC2', 'InstanceId'
                 )
                 
-                resources['ec2'].append({
+                items.append({
                     'name': name,
                     'instance_id': instance['InstanceId'],
                     'instance_type': instance['InstanceType'],
@@ -286,7 +302,12 @@ def collect_resources_with_credentials(credentials: dict, region: str = 'ap-nort
     except Exception as e:
         print(f"EC2 collection error: {e}")
     
-    # RDS
+    return items
+
+
+def collect_rds_with_session(session) -> list:
+    """ユーザーセッションでRDSを収集"""
+    items = []
     try:
         rds = session.client('rds')
         response = rds.describe_db_instances()
@@ -334,7 +355,7 @@ def collect_resources_with_credentials(credentials: dict, region: str = 'ap-nort
                     )
                     print(f"RDS Instance {cluster_id} CPU: {cpu_avg_max}")
                 
-                resources['rds'].append({
+                items.append({
                     'name': cluster_id,
                     'instance_type': inst['DBInstanceClass'],
                     'count': len(instances),
@@ -345,7 +366,12 @@ def collect_resources_with_credentials(credentials: dict, region: str = 'ap-nort
     except Exception as e:
         print(f"RDS collection error: {e}")
     
-    # DocumentDB
+    return items
+
+
+def collect_docdb_with_session(session) -> list:
+    """ユーザーセッションでDocumentDBを収集"""
+    items = []
     try:
         docdb = session.client('docdb')
         response = docdb.describe_db_clusters()
@@ -368,7 +394,7 @@ def collect_resources_with_credentials(credentials: dict, region: str = 'ap-nort
                 cpu_avg_max, cpu_max, timestamp = get_max_cpu_with_session(
                     session, member_id, 'AWS/DocDB', 'DBInstanceIdentifier'
                 )
-                resources['docdb'].append({
+                items.append({
                     'name': cluster_id,
                     'instance_type': inst.get('DBInstanceClass', ''),
                     'count': len(members),
@@ -379,7 +405,12 @@ def collect_resources_with_credentials(credentials: dict, region: str = 'ap-nort
     except Exception as e:
         print(f"DocumentDB collection error: {e}")
     
-    # ElastiCache (Redis)
+    return items
+
+
+def collect_redis_with_session(session) -> list:
+    """ユーザーセッションでElastiCache (Redis)を収集"""
+    items = []
     try:
         elasticache = session.client('elasticache')
         response = elasticache.describe_replication_groups()
@@ -398,7 +429,7 @@ def collect_resources_with_credentials(credentials: dict, region: str = 'ap-nort
                     )
                     total_nodes = sum(len(ng.get('NodeGroupMembers', [])) for ng in node_groups)
                     
-                    resources['redis'].append({
+                    items.append({
                         'name': rg['ReplicationGroupId'],
                         'instance_type': cc.get('CacheNodeType', ''),
                         'count': total_nodes,
@@ -409,7 +440,12 @@ def collect_resources_with_credentials(credentials: dict, region: str = 'ap-nort
     except Exception as e:
         print(f"Redis collection error: {e}")
     
-    # ElastiCache (Memcached)
+    return items
+
+
+def collect_memcache_with_session(session) -> list:
+    """ユーザーセッションでElastiCache (Memcached)を収集"""
+    items = []
     try:
         elasticache = session.client('elasticache')
         response = elasticache.describe_cache_clusters()
@@ -419,7 +455,7 @@ def collect_resources_with_credentials(credentials: dict, region: str = 'ap-nort
                 cpu_avg_max, cpu_max, timestamp = get_max_cpu_with_session(
                     session, cc['CacheClusterId'], 'AWS/ElastiCache', 'CacheClusterId'
                 )
-                resources['memcache'].append({
+                items.append({
                     'name': cc['CacheClusterId'],
                     'instance_type': cc.get('CacheNodeType', ''),
                     'count': cc.get('NumCacheNodes', 1),
@@ -430,7 +466,23 @@ def collect_resources_with_credentials(credentials: dict, region: str = 'ap-nort
     except Exception as e:
         print(f"Memcached collection error: {e}")
     
-    return resources
+    return items
+
+
+# リソースキー → ユーザーセッションでの収集関数
+SESSION_COLLECTORS = {
+    'ec2': collect_ec2_with_session,
+    'rds': collect_rds_with_session,
+    'docdb': collect_docdb_with_session,
+    'redis': collect_redis_with_session,
+    'memcache': collect_memcache_with_session
+}
+
+
+def collect_resources_with_credentials(credentials: dict, region: str = 'ap-northeast-1') -> dict:
+    """ユーザーの認証情報を使ってリソースを収集"""
+    session = create_user_session(credentials, region)
+    return {key: collect(session) for key, collect in SESSION_COLLECTORS.items()}
 
 
 def get_serverless_acu_with_session(session, cluster_id: str):
@@ -544,14 +596,173 @@ MCP_RUNTIME_ARN = os.environ.get(
     "MCP_RUNTIME_ARN",
     "arn:aws:bedrock-agentcore:ap-northeast-1:935762823806:runtime/infra_cost_reduction_pricing_mcp-M4Abq6BZRK"
 )
+# analyze_inventory ツールで価格と提案を1回の価格解決でまとめて取得（false で個別ツールのバッチ呼び出し）
+MCP_COMBINED_ANALYSIS = os.environ.get("MCP_COMBINED_ANALYSIS", "true").lower() == "true"
+# 対応ツールの結果をSSEで逐次受信する（false で一括JSON応答）
+MCP_STREAMING = os.environ.get("MCP_STREAMING", "true").lower() == "true"
+# 価格エンジンの実行場所
+#   agentcore: AgentCore 上の MCP サーバーを呼び出す
+#   local: MCP サーバーのエンジン（mcp_server/server.py）を Lambda 内で直接実行（AgentCore 不要）
+PRICING_ENGINE = os.environ.get("PRICING_ENGINE", "agentcore").lower()
+
+# ローカル価格エンジンの読み込み元（先に見つかったファイル、sys.path は使わない）
+#   Lambda パッケージに同梱した pricing_engine.py → リポジトリの mcp_server/server.py
+LOCAL_ENGINE_PATHS = (
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pricing_engine.py'),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mcp_server', 'server.py'),
+)
+LOCAL_ENGINE_MODULE = 'infra_cost_reduction_pricing_engine'
+
+_local_engine = None
+_local_engine_lock = threading.Lock()
+
+
+def get_local_engine():
+    """
+    ローカル価格エンジン（mcp_server/server.py）を取得（初回のみ読み込み）
+    同名の別モジュールを拾わないよう、LOCAL_ENGINE_PATHS のファイルをパス指定で読み込む
+    価格キャッシュ等はモジュール変数のため、ウォームなLambda呼び出し間で共有される
+    """
+    global _local_engine
+    if _local_engine is not None:
+        return _local_engine
+    with _local_engine_lock:
+        if _local_engine is None:
+            path = next((p for p in LOCAL_ENGINE_PATHS if os.path.exists(p)), None)
+            if path is None:
+                raise ImportError(f"local pricing engine not found: {', '.join(LOCAL_ENGINE_PATHS)}")
+            spec = importlib.util.spec_from_file_location(LOCAL_ENGINE_MODULE, path)
+            engine = importlib.util.module_from_spec(spec)
+            sys.modules[LOCAL_ENGINE_MODULE] = engine
+            spec.loader.exec_module(engine)
+            print(f"[Pricing Engine] local engine loaded: {engine.__file__}")
+            _local_engine = engine
+    return _local_engine
+
+
+def call_local_tool(tool_name: str, arguments: dict) -> dict:
+    """ローカル価格エンジンでツールを実行（MCPサーバーと同じ結果dictを返す）"""
+    return get_local_engine().call_tool_sync(tool_name, arguments)
+
+
+# AgentCore セッションの再利用設定（秒）
+# 同じ runtimeSessionId の呼び出しは同じ（価格キャッシュが温まった）コンテナに届く
+# アイドル上限は AgentCore のアイドルタイムアウト（15分）より短くする
+MCP_SESSION_IDLE_TIMEOUT = int(os.environ.get("MCP_SESSION_IDLE_TIMEOUT", "600"))
+MCP_SESSION_MAX_AGE = int(os.environ.get("MCP_SESSION_MAX_AGE", "3600"))
+
+
+class MCPSession:
+    """
+    AgentCore のセッションID（runtimeSessionId / mcpSessionId）を保持して再利用
+    モジュール変数として保持するため、1回の実行内の呼び出しとウォームなLambda呼び出し間で共有される
+    アイドル時間・経過時間の上限を超えた場合、または呼び出しが失敗した場合は新しいIDに切り替える
+    """
+    
+    def __init__(self, idle_timeout: int = MCP_SESSION_IDLE_TIMEOUT, max_age: int = MCP_SESSION_MAX_AGE):
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.ids = None
+        self.created_at = 0.0
+        self.last_used = 0.0
+        self.rotations = 0
+    
+    def _rotate(self, reason: str):
+        if self.ids:
+            self.rotations += 1
+            print(f"[MCP Session] rotate ({reason})")
+        self.ids = (str(uuid.uuid4()), str(uuid.uuid4()))
+        self.created_at = time.time()
+    
+    def current(self) -> tuple:
+        """(runtimeSessionId, mcpSessionId) を返す（期限切れなら切り替え）"""
+        with self.lock:
+            now = time.time()
+            if self.ids is None:
+                self._rotate("new")
+            elif now - self.last_used > self.idle_timeout:
+                self._rotate("idle")
+            elif now - self.created_at > self.max_age:
+                self._rotate("max age")
+            self.last_used = now
+            return self.ids
+    
+    def invalidate(self, ids: tuple):
+        """失敗したセッションを破棄（並行呼び出しで既に切り替え済みなら何もしない）"""
+        with self.lock:
+            if self.ids == ids:
+                self._rotate("error")
+    
+    @contextmanager
+    def use(self):
+        """セッションIDを取得し、ブロック内で例外が発生したらセッションを破棄する"""
+        ids = self.current()
+        try:
+            yield ids
+        except Exception:
+            self.invalidate(ids)
+            raise
+
+
+_mcp_session = MCPSession()
+
+
+def _invoke_mcp_response(payload_obj, session_ids: tuple):
+    """AgentCore 経由で JSON-RPC ペイロードを送信し、未読のレスポンスを返す"""
+    client = thread_client('bedrock-agentcore', region_name='ap-northeast-1')
+    runtime_session_id, mcp_session_id = session_ids
+    
+    return client.invoke_agent_runtime(
+        agentRuntimeArn=MCP_RUNTIME_ARN,
+        runtimeSessionId=runtime_session_id,
+        mcpSessionId=mcp_session_id,
+        mcpProtocolVersion="2025-06-18",  # structuredContent を定義するバージョン
+        contentType="application/json",
+        accept="application/json, text/event-stream",
+        payload=json.dumps(payload_obj).encode('utf-8')
+    )
+
+
+def _invoke_mcp(payload_obj):
+    """AgentCore 経由で JSON-RPC ペイロード（単一 / バッチ）を送信し、デコード済みレスポンスを返す"""
+    with _mcp_session.use() as session_ids:
+        response = _invoke_mcp_response(payload_obj, session_ids)
+        raw_content = b''.join(response.get("response", [])).decode('utf-8')
+    
+    # デバッグログ
+    print(f"[MCP Debug] Raw response length: {len(raw_content)}")
+    
+    return json.loads(raw_content)
+
+
+def _parse_tool_response(tool_name: str, result: dict) -> dict:
+    """tools/call の JSON-RPC レスポンスからツール結果を取り出す"""
+    # デバッグ: レスポンス構造を確認
+    print(f"[MCP Debug] Tool: {tool_name}, Response keys: {list(result.keys())}")
+    
+    tool_result = result.get("result") or {}
+    # structuredContent を優先（text は旧バージョンのMCPサーバー向けフォールバック）
+    if isinstance(tool_result.get("structuredContent"), dict):
+        return tool_result["structuredContent"]
+    
+    if tool_result.get("content"):
+        text_content = tool_result["content"][0]["text"]
+        print(f"[MCP Debug] Parsed content length: {len(text_content)}")
+        return json.loads(text_content)
+    
+    # エラー詳細をログ出力
+    print(f"[MCP Debug] Unexpected format: {json.dumps(result, ensure_ascii=False)[:500]}")
+    return {"error": "Invalid response format"}
 
 
 def call_mcp_tool(tool_name: str, arguments: dict) -> dict:
     """MCP サーバーのツールを呼び出す"""
     try:
-        client = boto3.client('bedrock-agentcore', region_name='ap-northeast-1')
+        if PRICING_ENGINE == "local":
+            return call_local_tool(tool_name, arguments)
         
-        payload = json.dumps({
+        result = _invoke_mcp({
             "jsonrpc": "2.0",
             "method": "tools/call",
             "params": {
@@ -560,44 +771,137 @@ def call_mcp_tool(tool_name: str, arguments: dict) -> dict:
             },
             "id": 1
         })
+        return _parse_tool_response(tool_name, result)
         
-        response = client.invoke_agent_runtime(
-            agentRuntimeArn=MCP_RUNTIME_ARN,
-            runtimeSessionId=str(uuid.uuid4()),
-            mcpSessionId=str(uuid.uuid4()),
-            mcpProtocolVersion="2024-11-05",
-            contentType="application/json",
-            accept="application/json, text/event-stream",
-            payload=payload.encode('utf-8')
-        )
-        
-        content = []
-        for chunk in response.get("response", []):
-            content.append(chunk.decode('utf-8'))
-        raw_content = ''.join(content)
+    except Exception as e:
+        print(f"MCP call error: {e}")
+        return {"error": str(e)}
+
+
+def _iter_sse_messages(chunks):
+    """SSEのバイト列チャンクを逐次デコードし、イベント毎の data をJSONとして返す"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    
+    def parse_event(event):
+        data = '\n'.join(line[5:].lstrip() for line in event.split('\n') if line.startswith('data:'))
+        return json.loads(data) if data else None
+    
+    for chunk in chunks:
+        buffer += decoder.decode(chunk).replace('\r\n', '\n')
+        while '\n\n' in buffer:
+            event, buffer = buffer.split('\n\n', 1)
+            message = parse_event(event)
+            if message is not None:
+                yield message
+    
+    buffer += decoder.decode(b'', final=True)
+    message = parse_event(buffer.strip())
+    if message is not None:
+        yield message
+
+
+def _merge_partial_result(result: dict, partial: dict):
+    """部分結果を結果dictに統合（リストは連結、dictはマージ）"""
+    for key, value in partial.items():
+        if isinstance(value, list):
+            result.setdefault(key, []).extend(value)
+        elif isinstance(value, dict):
+            result.setdefault(key, {}).update(value)
+        else:
+            result[key] = value
+
+
+def call_mcp_tool_stream(tool_name: str, arguments: dict) -> dict:
+    """
+    MCP サーバーのツールをストリーミングで呼び出す
+    部分結果（notifications/progress）を受信した順に統合し、最後の応答で完了とする
+    最後の応答がない、または応答の件数（partials）と受信数が異なる場合はエラーを返す
+    サーバーがSSEで応答しない場合は通常のJSON応答として処理する
+    """
+    try:
+        # ローカル実行ではネットワーク越しの逐次受信が不要なため一括で実行
+        if PRICING_ENGINE == "local":
+            return call_local_tool(tool_name, arguments)
         
-        # デバッグログ
-        print(f"[MCP Debug] Tool: {tool_name}, Raw response length: {len(raw_content)}")
+        with _mcp_session.use() as session_ids:
+            response = _invoke_mcp_response({
+                "jsonrpc": "2.0",
+                "method": "tools/call",
+                "params": {
+                    "name": tool_name,
+                    "arguments": arguments,
+                    "_meta": {"progressToken": str(uuid.uuid4())}
+                },
+                "id": 1
+            }, session_ids)
+            chunks = response.get("response", [])
         
-        result = json.loads(raw_content)
+            if "text/event-stream" not in response.get("contentType", ""):
+                return _parse_tool_response(tool_name, json.loads(b''.join(chunks).decode('utf-8')))
         
-        # デバッグ: レスポンス構造を確認
-        print(f"[MCP Debug] Response keys: {list(result.keys())}")
+            result = {}
+            partials = 0
+            final = None
+            for message in _iter_sse_messages(chunks):
+                if message.get("method") == "notifications/progress":
+                    partial = message.get("params", {}).get("partialResult")
+                    if partial:
+                        _merge_partial_result(result, partial)
+                        partials += 1
+                elif "result" in message or "error" in message:
+                    final = _parse_tool_response(tool_name, message)
+                    if "error" in final:
+                        return final
         
-        if "result" in result and "content" in result["result"]:
-            text_content = result["result"]["content"][0]["text"]
-            print(f"[MCP Debug] Parsed content length: {len(text_content)}")
-            return json.loads(text_content)
+        # 最後の応答がない・件数が合わない場合は途中で切れたストリーム（部分結果を成功として返さない）
+        if final is None:
+            print(f"[MCP Debug] Tool: {tool_name}, stream ended after {partials} partial results without final response")
+            return {"error": "Stream ended before final response"}
+        if final.get("partials") != partials:
+            print(f"[MCP Debug] Tool: {tool_name}, received {partials} of {final.get('partials')} partial results")
+            return {"error": f"Incomplete stream: received {partials} of {final.get('partials')} partial results"}
         
-        # エラー詳細をログ出力
-        print(f"[MCP Debug] Unexpected format: {raw_content[:500]}")
-        return {"error": "Invalid response format"}
+        print(f"[MCP Debug] Tool: {tool_name}, streamed {partials} partial results")
+        return result
         
     except Exception as e:
-        print(f"MCP call error: {e}")
+        print(f"MCP stream call error: {e}")
         return {"error": str(e)}
 
 
+def call_mcp_tools(calls: list) -> list:
+    """
+    複数のMCPツールを JSON-RPC バッチで1往復で呼び出す
+    calls: [(tool_name, arguments), ...] → 同じ順序で結果dictのリストを返す
+    """
+    if not calls:
+        return []
+    try:
+        if PRICING_ENGINE == "local":
+            return [call_local_tool(tool_name, arguments) for tool_name, arguments in calls]
+        
+        payload = [
+            {
+                "jsonrpc": "2.0",
+                "method": "tools/call",
+                "params": {"name": tool_name, "arguments": arguments},
+                "id": i
+            }
+            for i, (tool_name, arguments) in enumerate(calls, 1)
+        ]
+        responses = _invoke_mcp(payload)
+        # バッチ非対応サーバーは単一のエラーオブジェクトを返す
+        if isinstance(responses, dict):
+            responses = [responses]
+        by_id = {r.get("id"): r for r in responses if isinstance(r, dict)}
+        return [_parse_tool_response(tool_name, by_id.get(i, {})) for i, (tool_name, _) in enumerate(calls, 1)]
+    
+    except Exception as e:
+        print(f"MCP batch call error: {e}")
+        return [{"error": str(e)} for _ in calls]
+
+
 def get_instance_price_from_mcp(instance_type: str, service: str = "ec2", region: str = "ap-northeast-1") -> float:
     """MCPサーバーからインスタンス価格を取得"""
     result = call_mcp_tool("get_instance_price", {
@@ -611,7 +915,7 @@ def get_instance_price_from_mcp(instance_type: str, service: str = "ec2", region
 # cpu_avg_max: 5分間平均値の最大（判定用）
 # cpu_max: 5分間最大値の最大（参考）
 def get_max_cpu_utilization(instance_id, namespace='AWS/EC2', dimension_name='InstanceId'):
-    cloudwatch = boto3.client('cloudwatch')
+    cloudwatch = thread_client('cloudwatch')
 
     period = 300  # 5分の期間
     days = 30  # 取得する期間（30日）
@@ -663,7 +967,7 @@ def get_max_cpu_utilization(instance_id, namespace='AWS/EC2', dimension_name='In
 
 
 def get_ec2_instances():
-    ec2 = boto3.client("ec2")
+    ec2 = thread_client("ec2")
     
     response = ec2.describe_instances()
     instances_info = []
@@ -761,7 +1065,7 @@ def get_ec2_instances():
 
 def get_rds_clusters():
     """RDS Aurora/MySQLクラスターのみを取得（DocumentDBは除外）"""
-    rds = boto3.client("rds")
+    rds = thread_client("rds")
     clusters_info = []
 
     response = rds.describe_db_clusters()
@@ -836,7 +1140,7 @@ def get_rds_clusters():
 def get_docdb_clusters():
     """DocumentDBクラスターのみを取得（RDS Auroraは除外）"""
     # RDSクライアントを使用（docdbクライアントも同じAPI）
-    rds = boto3.client("rds")
+    rds = thread_client("rds")
     clusters_info = []
     
     response = rds.describe_db_clusters()
@@ -889,7 +1193,7 @@ def get_docdb_clusters():
 
 
 def get_redis_clusters():
-    elasticache = boto3.client("elasticache")
+    elasticache = thread_client("elasticache")
     response = elasticache.describe_replication_groups()
     clusters_info = []
 
@@ -926,7 +1230,7 @@ def get_redis_clusters():
 
 
 def get_memcache_clusters():
-    elasticache = boto3.client("elasticache")
+    elasticache = thread_client("elasticache")
     response = elasticache.describe_cache_clusters()
     clusters_info = []
 
@@ -956,15 +1260,19 @@ def get_memcache_clusters():
     return clusters_info
 
 
+# リソースキー → Lambda の IAM ロールでの収集関数
+DEFAULT_COLLECTORS = {
+    "ec2": get_ec2_instances,
+    "rds": get_rds_clusters,
+    "docdb": get_docdb_clusters,
+    "redis": get_redis_clusters,
+    "memcache": get_memcache_clusters
+}
+
+
 def collect_all_resources():
     """すべてのAWSリソース情報を収集"""
-    return {
-        "ec2": get_ec2_instances(),
-        "rds": get_rds_clusters(),
-        "docdb": get_docdb_clusters(),
-        "redis": get_redis_clusters(),
-        "memcache": get_memcache_clusters()
-    }
+    return {key: collect() for key, collect in DEFAULT_COLLECTORS.items()}
 
 
 def format_resources_for_bedrock(resources, pricing_info=None):
@@ -1057,28 +1365,10 @@ def format_resources_for_bedrock(resources, pricing_info=None):
     return "\n".join(output)
 
 
-def get_mcp_batch_recommendations(resources):
-    """MCPから全リソースの一括スケールダウン提案を取得"""
+def build_recommendation_instances(resources):
+    """get_batch_recommendations 用のインスタンス一覧を作成（CPUデータがあるもののみ）"""
     instances = []
     
-    # リストまたは辞書からフィールドを取得するヘルパー
-    def get_field(item, dict_key, list_index, is_ec2=False):
-        if isinstance(item, dict):
-            return item.get(dict_key)
-        elif isinstance(item, (list, tuple)):
-            # EC2はリストのインデックスが異なる
-            actual_index = list_index + (1 if is_ec2 and list_index >= 2 else 0)
-            return item[actual_index] if len(item) > actual_index else None
-        return None
-    
-    def get_instance_type(item, is_ec2=False):
-        if isinstance(item, dict):
-            return item.get("instance_type")
-        elif isinstance(item, (list, tuple)):
-            idx = 2 if is_ec2 else 1
-            return item[idx] if len(item) > idx else None
-        return None
-    
     def get_cpu_avg_max(item):
         if isinstance(item, dict):
             cpu = item.get("cpu_avg_max")
@@ -1087,51 +1377,16 @@ def get_mcp_batch_recommendations(resources):
             return cpu
         return None
     
-    # EC2
-    for item in resources.get("ec2", []):
-        if isinstance(item, dict):
-            name = item.get("name", "")
-            instance_type = item.get("instance_type", "")
-            cpu = get_cpu_avg_max(item)
-            if name and instance_type and cpu is not None:
-                instances.append({
-                    "name": name,
-                    "instance_type": instance_type,
-                    "cpu_avg_max": cpu,
-                    "service": "ec2"
-                })
-    
-    # RDS
-    for item in resources.get("rds", []):
-        if isinstance(item, dict):
-            name = item.get("name", "")
-            instance_type = item.get("instance_type", "")
-            cpu = get_cpu_avg_max(item)
-            if name and instance_type and cpu is not None:
-                instances.append({
-                    "name": name,
-                    "instance_type": instance_type,
-                    "cpu_avg_max": cpu,
-                    "service": "rds"
-                })
-    
-    # DocumentDB
-    for item in resources.get("docdb", []):
-        if isinstance(item, dict):
-            name = item.get("name", "")
-            instance_type = item.get("instance_type", "")
-            cpu = get_cpu_avg_max(item)
-            if name and instance_type and cpu is not None:
-                instances.append({
-                    "name": name,
-                    "instance_type": instance_type,
-                    "cpu_avg_max": cpu,
-                    "service": "docdb"
-                })
+    service_mapping = [
+        ("ec2", "ec2"),
+        ("rds", "rds"),
+        ("docdb", "docdb"),
+        ("redis", "elasticache"),
+        ("memcache", "elasticache"),
+    ]
     
-    # Redis / Memcache
-    for service_key in ["redis", "memcache"]:
-        for item in resources.get(service_key, []):
+    for resource_key, service in service_mapping:
+        for item in resources.get(resource_key, []):
             if isinstance(item, dict):
                 name = item.get("name", "")
                 instance_type = item.get("instance_type", "")
@@ -1141,9 +1396,32 @@ def get_mcp_batch_recommendations(resources):
                         "name": name,
                         "instance_type": instance_type,
                         "cpu_avg_max": cpu,
-                        "service": "elasticache"
+                        "service": service
                     })
     
+    return instances
+
+
+def parse_recommendations_result(result):
+    """get_batch_recommendations の結果を名前をキーにした辞書に変換"""
+    if "error" in result:
+        print(f"MCP batch recommendations error: {result['error']}")
+        return {}
+    
+    rec_dict = {}
+    for rec in result.get("recommendations", []):
+        name = rec.get("name", "")
+        if name:
+            rec_dict[name] = rec
+    
+    print(f"MCP batch recommendations: {len(rec_dict)} items")
+    return rec_dict
+
+
+def get_mcp_batch_recommendations(resources):
+    """MCPから全リソースの一括スケールダウン提案を取得"""
+    instances = build_recommendation_instances(resources)
+    
     if not instances:
         print("No instances with CPU data for MCP batch recommendations")
         return {}
@@ -1155,37 +1433,15 @@ def get_mcp_batch_recommendations(resources):
             "instances": instances,
             "region": "ap-northeast-1"
         })
-        
-        if "error" in result:
-            print(f"MCP batch recommendations error: {result['error']}")
-            return {}
-        
-        recommendations = result.get("recommendations", [])
-        
-        # 名前をキーにした辞書に変換
-        rec_dict = {}
-        for rec in recommendations:
-            name = rec.get("name", "")
-            if name:
-                rec_dict[name] = rec
-        
-        print(f"MCP batch recommendations: {len(rec_dict)} items")
-        return rec_dict
+        return parse_recommendations_result(result)
     except Exception as e:
         print(f"Error getting MCP batch recommendations: {e}")
     
     return {}
 
 
-def collect_pricing_info(resources):
-    """リソースの価格情報を収集（EC2/RDS/ElastiCache/DocDB）- 一括取得で高速化"""
-    pricing_info = {
-        'ec2': {},
-        'rds': {},
-        'elasticache': {},
-        'docdb': {}
-    }
-    
+def build_price_requests(resources):
+    """get_batch_prices 用のインスタンスタイプ一覧を作成（重複除去）"""
     # リストまたは辞書からinstance_typeを取得
     def get_instance_type(item, is_ec2=False):
         if isinstance(item, dict):
@@ -1197,7 +1453,6 @@ def collect_pricing_info(resources):
             return item[idx] if len(item) > idx else None
         return None
     
-    # 全インスタンスタイプを収集
     instance_types_to_fetch = []
     seen = set()
     
@@ -1219,6 +1474,32 @@ def collect_pricing_info(resources):
                     "service": service_key
                 })
     
+    return instance_types_to_fetch
+
+
+def parse_prices_result(result, instance_types_to_fetch):
+    """get_batch_prices の結果をサービス別の時間単価辞書に振り分け"""
+    pricing_info = {
+        'ec2': {},
+        'rds': {},
+        'elasticache': {},
+        'docdb': {}
+    }
+    prices = result.get("prices", {})
+    for item in instance_types_to_fetch:
+        instance_type = item["instance_type"]
+        service_key = item["service"]
+        price_info = prices.get(instance_type, {})
+        hourly_price = price_info.get("hourly_price_usd")
+        if hourly_price and hourly_price > 0:
+            pricing_info[service_key][instance_type] = hourly_price
+    return pricing_info
+
+
+def collect_pricing_info(resources):
+    """リソースの価格情報を収集（EC2/RDS/ElastiCache/DocDB）- 一括取得で高速化"""
+    instance_types_to_fetch = build_price_requests(resources)
+    
     # MCPサーバーで一括取得
     if instance_types_to_fetch:
         try:
@@ -1226,25 +1507,63 @@ def collect_pricing_info(resources):
                 "instance_types": instance_types_to_fetch,
                 "region": "ap-northeast-1"
             })
-            prices = result.get("prices", {})
-            
-            # 結果をサービス別に振り分け
-            for item in instance_types_to_fetch:
-                instance_type = item["instance_type"]
-                service_key = item["service"]
-                price_info = prices.get(instance_type, {})
-                hourly_price = price_info.get("hourly_price_usd")
-                if hourly_price and hourly_price > 0:
-                    pricing_info[service_key][instance_type] = hourly_price
+            return parse_prices_result(result, instance_types_to_fetch)
         except Exception as e:
             print(f"Error getting batch prices: {e}")
     
-    return pricing_info
+    return parse_prices_result({}, [])
+
+
+def build_inventory(resources):
+    """analyze_inventory 用のインベントリを作成（CPUデータがない行は価格のみ対象）"""
+    price_services = {item["instance_type"]: item["service"] for item in build_price_requests(resources)}
+    recommendation_instances = build_recommendation_instances(resources)
+    
+    inventory = list(recommendation_instances)
+    covered = {inst["instance_type"] for inst in recommendation_instances}
+    for instance_type, service in price_services.items():
+        if instance_type not in covered:
+            inventory.append({"instance_type": instance_type, "service": service})
+    return inventory
+
+
+def collect_pricing_and_recommendations(resources):
+    """価格情報とスケールダウン提案を1往復でまとめて取得"""
+    instance_types_to_fetch = build_price_requests(resources)
+    instances = build_recommendation_instances(resources)
+    
+    if not instances:
+        print("No instances with CPU data for MCP batch recommendations")
+    
+    if MCP_COMBINED_ANALYSIS and instance_types_to_fetch:
+        inventory = build_inventory(resources)
+        print(f"Calling MCP analyze_inventory with {len(inventory)} items")
+        call = call_mcp_tool_stream if MCP_STREAMING else call_mcp_tool
+        result = call("analyze_inventory", {"instances": inventory, "region": "ap-northeast-1"})
+        if "error" not in result:
+            pricing_info = parse_prices_result(result, instance_types_to_fetch)
+            mcp_recommendations = parse_recommendations_result(result) if instances else {}
+            return pricing_info, mcp_recommendations
+        # 旧バージョンのMCPサーバー（analyze_inventory 未対応）は個別ツールにフォールバック
+        print(f"MCP analyze_inventory error, falling back to batch tools: {result['error']}")
+    
+    calls = []
+    if instance_types_to_fetch:
+        calls.append(("get_batch_prices", {"instance_types": instance_types_to_fetch, "region": "ap-northeast-1"}))
+    if instances:
+        calls.append(("get_batch_recommendations", {"instances": instances, "region": "ap-northeast-1"}))
+    
+    print(f"Calling MCP batch: {[name for name, _ in calls]}")
+    results = dict(zip([name for name, _ in calls], call_mcp_tools(calls)))
+    
+    pricing_info = parse_prices_result(results.get("get_batch_prices", {}), instance_types_to_fetch)
+    mcp_recommendations = parse_recommendations_result(results["get_batch_recommendations"]) if instances else {}
+    return pricing_info, mcp_recommendations
 
 
 def get_bedrock_analysis(resource_text):
     """Bedrockにリソース情報を送信して分析を取得（トークン使用量も返す）"""
-    bedrock_runtime = boto3.client("bedrock-runtime", region_name=os.environ.get("AWS_REGION_NAME", "ap-northeast-1"))
+    bedrock_runtime = thread_client("bedrock-runtime", region_name=os.environ.get("AWS_REGION_NAME", "ap-northeast-1"))
     model_id = os.environ.get("BEDROCK_MODEL_ID", "amazon.nova-lite-v1:0")
 
     prompt = f"""あなたはAWSのコスト削減に特化した提案を行うAIです。
@@ -1407,6 +1726,512 @@ def get_bedrock_analysis(resource_text):
         "token_usage": token_info
     }
 
+# 分析パイプラインで同時に実行するステップ数
+ANALYSIS_MAX_WORKERS = int(os.environ.get("ANALYSIS_MAX_WORKERS", "8"))
+
+
+def run_dag(steps: dict, max_workers: int = ANALYSIS_MAX_WORKERS, on_step=None):
+    """
+    依存関係グラフに沿ってステップを実行（依存が揃ったステップから並行実行）
+    steps: {名前: (依存ステップ名のタプル, fn(results) -> 値)}
+    on_step: ステップ完了毎に on_step(名前, results) を呼び出す（呼び出し元スレッドで実行）
+    戻り値: (results, timings)  timings はパイプライン開始からの相対時刻（ms）
+    ステップが例外を送出した場合は、実行中のステップの完了を待ってから再送出する
+    """
+    for name, (deps, _) in steps.items():
+        unknown = [dep for dep in deps if dep not in steps]
+        if unknown:
+            raise ValueError(f"Unknown dependency for {name}: {unknown}")
+    
+    results = {}
+    timings = {}
+    origin = time.perf_counter()
+    
+    def run_step(name):
+        start = time.perf_counter()
+        try:
+            return steps[name][1](results)
+        finally:
+            timings[name] = {
+                'start_ms': round((start - origin) * 1000, 1),
+                'elapsed_ms': round((time.perf_counter() - start) * 1000, 1)
+            }
+    
+    remaining = dict(steps)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis") as executor:
+        while remaining or running:
+            ready = [name for name, (deps, _) in remaining.items() if all(dep in results for dep in deps)]
+            for name in ready:
+                del remaining[name]
+                running[executor.submit(run_step, name)] = name
+            if not running:
+                raise ValueError(f"Dependency cycle: {sorted(remaining)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+                if on_step:
+                    on_step(name, results)
+    
+    return results, timings
+
+
+def build_analysis_steps(collectors: dict) -> dict:
+    """
+    分析パイプラインのステップ定義
+    サービス毎のリソース収集（並行）→ MCP（価格 + スケールダウン提案）→ Bedrock用フォーマット → Bedrock分析
+    collectors: {リソースキー: 収集関数()}
+    """
+    steps = {key: ((), lambda results, collect=collect: collect()) for key, collect in collectors.items()}
+    steps['resources'] = (tuple(collectors), lambda results: {key: results[key] for key in collectors})
+    steps['mcp'] = (('resources',), lambda results: collect_pricing_and_recommendations(results['resources']))
+    steps['format'] = (('resources', 'mcp'), lambda results: format_resources_for_bedrock(results['resources'], results['mcp'][0]))
+    steps['bedrock'] = (('format',), lambda results: get_bedrock_analysis(results['format']))
+    return steps
+
+
+def run_analysis_pipeline(collectors: dict, on_step=None) -> dict:
+    """分析パイプラインを実行（on_step はステップ完了毎の通知、run_dag 参照）"""
+    results, timings = run_dag(build_analysis_steps(collectors), on_step=on_step)
+    for name, timing in sorted(timings.items(), key=lambda item: item[1]['start_ms']):
+        print(f"[Pipeline] {name}: start={timing['start_ms']}ms elapsed={timing['elapsed_ms']}ms")
+    
+    pricing_info, mcp_recommendations = results['mcp']
+    return {
+        'resources': results['resources'],
+        'pricing': pricing_info,
+        'analysis_result': results['bedrock'],
+        'mcp_recommendations': mcp_recommendations,
+        'timings': timings
+    }
+
+
+def analysis_collectors(credentials: dict = None) -> dict:
+    """
+    分析に使うリソース収集関数
+    credentials あり: ユーザーの認証情報（セッションはスレッド間で共有できないため収集ステップ毎に作成）
+    credentials なし: Lambda の IAM ロール
+    """
+    if not credentials:
+        return DEFAULT_COLLECTORS
+    return {
+        key: (lambda collect=collect: collect(create_user_session(credentials)))
+        for key, collect in SESSION_COLLECTORS.items()
+    }
+
+
+def build_analysis_response(result: dict, profile: str = None) -> dict:
+    """分析パイプラインの結果からAPIレスポンスのボディを作成"""
+    response = {
+        'resources': result['resources'],
+        'pricing': result['pricing'],
+        'analysis': result['analysis_result']['text'],
+        'token_usage': result['analysis_result']['token_usage'],
+        'mcp_recommendations': result['mcp_recommendations'],
+        'timings': result['timings']
+    }
+    if profile:
+        response['profile'] = profile
+    return response
+
+
+# リソースキー → 価格情報（pricing）のサービスキー
+PRICE_SERVICE_KEYS = {
+    'ec2': 'ec2',
+    'rds': 'rds',
+    'docdb': 'docdb',
+    'redis': 'elasticache',
+    'memcache': 'elasticache'
+}
+
+
+def compact_analysis_response(response: dict) -> dict:
+    """
+    分析レスポンスをコンパクト形式に変換（format=compact）
+    リソースはサービス毎に列名（fields）+ 行（rows）の表形式にし、
+    各行に時間単価（_price）と提案（_rec: recommendation / reason）を畳み込む
+    → pricing / mcp_recommendations は出力しない（名前・タイプの重複を除去、展開はブラウザ側）
+    """
+    pricing = response.get('pricing') or {}
+    recommendations = response.get('mcp_recommendations') or {}
+    tables = {}
+    for key, items in (response.get('resources') or {}).items():
+        if not all(isinstance(item, dict) for item in items):
+            tables[key] = {'items': items}
+            continue
+        fields = list(dict.fromkeys(field for item in items for field in item))
+        prices = pricing.get(PRICE_SERVICE_KEYS.get(key), {})
+        rows = []
+        for item in items:
+            rec = recommendations.get(item.get('name'))
+            rows.append([item.get(field) for field in fields] + [
+                prices.get(item.get('instance_type')),
+                {'recommendation': rec.get('recommendation'), 'reason': rec.get('reason')} if rec else None
+            ])
+        tables[key] = {'fields': fields + ['_price', '_rec'], 'rows': rows}
+    
+    compact = {k: v for k, v in response.items() if k not in ('resources', 'pricing', 'mcp_recommendations')}
+    compact.update(format='compact', resources=tables, price_services=PRICE_SERVICE_KEYS)
+    return compact
+
+
+def format_analysis_response(response: dict, response_format: str = None) -> dict:
+    """リクエストの format（full / compact）に応じて分析レスポンスを変換"""
+    return compact_analysis_response(response) if response_format == 'compact' else response
+
+
+def analysis_step_events(name: str, results: dict) -> list:
+    """
+    完了したステップを表示用イベントに変換（get_job で部分結果として公開）
+    section: サービス毎のリソース / pricing: 価格・提案 / analysis: Bedrock分析
+    """
+    if name in SESSION_COLLECTORS:
+        return [{'type': 'section', 'key': name, 'items': results[name]}]
+    if name == 'mcp':
+        pricing_info, mcp_recommendations = results['mcp']
+        return [{'type': 'pricing', 'pricing': pricing_info, 'mcp_recommendations': mcp_recommendations}]
+    if name == 'bedrock':
+        return [{'type': 'analysis', 'analysis': results['bedrock']['text'], 'token_usage': results['bedrock']['token_usage']}]
+    return []
+
+
+# JSONレスポンスの gzip 圧縮（Accept-Encoding: gzip のクライアントのみ、小さい応答は非圧縮）
+RESPONSE_GZIP_MIN_BYTES = int(os.environ.get("RESPONSE_GZIP_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.environ.get("RESPONSE_GZIP_LEVEL", "6"))
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Accept-Encoding ヘッダーが gzip を受け付けるか（q=0 は拒否扱い）"""
+    for token in accept_encoding.split(","):
+        coding, _, params = token.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "*"):
+            q = params.strip()
+            if q.startswith("q="):
+                try:
+                    return float(q[2:]) > 0
+                except ValueError:
+                    return False
+            return True
+    return False
+
+
+def json_response(status_code: int, headers: dict, payload, event: dict) -> dict:
+    """
+    JSONレスポンスを作成（区切り文字の空白なし）
+    クライアントが gzip を受け付ける場合は圧縮し、Base64 で返す（Function URL がバイナリに戻す）
+    """
+    body = json.dumps(payload, ensure_ascii=False, default=str, separators=(',', ':'))
+    request_headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    response_headers = dict(headers, Vary='Accept-Encoding')
+    encoded = body.encode('utf-8')
+    if len(encoded) >= RESPONSE_GZIP_MIN_BYTES and accepts_gzip(request_headers.get('accept-encoding', '')):
+        response_headers['Content-Encoding'] = 'gzip'
+        return {
+            'statusCode': status_code,
+            'headers': response_headers,
+            'body': base64.b64encode(gzip.compress(encoded, compresslevel=RESPONSE_GZIP_LEVEL)).decode('ascii'),
+            'isBase64Encoded': True
+        }
+    return {
+        'statusCode': status_code,
+        'headers': response_headers,
+        'body': body
+    }
+
+
+# 非同期ジョブ設定
+# ジョブ状態の保存先: JOB_BUCKET 指定時は S3、未指定時はローカルファイル（JOB_STORE_DIR、テスト用）
+JOB_BUCKET = os.environ.get("JOB_BUCKET", "")
+JOB_STORE = os.environ.get("JOB_STORE", "s3" if JOB_BUCKET else "file")
+JOB_STORE_DIR = os.environ.get("JOB_STORE_DIR", "/tmp/analysis_jobs")
+# ジョブ状態の保持期間（秒）
+JOB_TTL = int(os.environ.get("JOB_TTL", "86400"))
+# ワーカーの実行方法: lambda（自分自身を非同期呼び出し）/ thread（同一プロセスのスレッド、ローカル実行用）
+JOB_WORKER = os.environ.get("JOB_WORKER", "lambda")
+# 未完了（queued/running）のまま更新がないジョブを失敗とみなすまでの秒数
+# ワーカーは関数のタイムアウト（300秒）で必ず終了するため、それを超えて更新がなければタイムアウト・異常終了
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", "330"))
+
+# 分析結果キャッシュ（アカウント・リージョン・オプション毎）
+# 保存先: JOB_BUCKET 指定時は S3、未指定時はローカルファイル（RESULT_CACHE_DIR）
+RESULT_CACHE = os.environ.get("RESULT_CACHE", "s3" if JOB_BUCKET else "file")
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "/tmp/analysis_results")
+# 有効期間（秒、0 で無効）
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", "900"))
+
+
+class FileStore:
+    """ローカルファイルに JSON を保存（1キー1ファイル、テスト・ローカル実行用）"""
+    
+    def __init__(self, directory: str, ttl: int):
+        self.directory = directory
+        self.ttl = ttl
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+    
+    def put(self, key: str, value: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+    
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+class S3Store:
+    """S3 に JSON を保存（受付とワーカーが別の実行環境でも共有される）"""
+    
+    def __init__(self, prefix: str, ttl: int, bucket: str = JOB_BUCKET):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.ttl = ttl
+    
+    def put(self, key: str, value: dict):
+        thread_client('s3').put_object(
+            Bucket=self.bucket,
+            Key=f"{self.prefix}{key}.json",
+            Body=json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'),
+            ContentType='application/json'
+        )
+    
+    def get(self, key: str):
+        try:
+            obj = thread_client('s3').get_object(Bucket=self.bucket, Key=f"{self.prefix}{key}.json")
+        except Exception as e:
+            print(f"Store get error ({self.prefix}{key}): {e}")
+            return None
+        if (datetime.now(timezone.utc) - obj['LastModified']).total_seconds() > self.ttl:
+            return None
+        return json.loads(obj['Body'].read().decode('utf-8'))
+
+
+def create_store(backend: str, directory: str, prefix: str, ttl: int):
+    """保存先の種類（file / s3）に応じたストアを作成"""
+    if backend == 's3':
+        return S3Store(prefix, ttl)
+    return FileStore(directory, ttl)
+
+
+_job_store = None
+_result_cache = None
+
+
+def get_job_store():
+    """ジョブストアを取得（JOB_STORE で選択）"""
+    global _job_store
+    if _job_store is None:
+        _job_store = create_store(JOB_STORE, JOB_STORE_DIR, "jobs/", JOB_TTL)
+    return _job_store
+
+
+def get_result_cache():
+    """分析結果キャッシュを取得（RESULT_CACHE で選択）"""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = create_store(RESULT_CACHE, RESULT_CACHE_DIR, "results/", RESULT_CACHE_TTL)
+    return _result_cache
+
+
+_role_account_id = None
+
+
+def get_account_id(credentials: dict = None) -> str:
+    """
+    分析対象のアカウントIDを取得
+    ユーザーの認証情報は毎回 STS で検証する（キャッシュ済み結果を返す前の認証を兼ねるため記憶しない）
+    Lambda の IAM ロールのアカウントIDのみ初回の結果を再利用
+    """
+    global _role_account_id
+    if credentials:
+        return create_user_session(credentials).client('sts').get_caller_identity()['Account']
+    if _role_account_id is None:
+        _role_account_id = thread_client('sts').get_caller_identity()['Account']
+    return _role_account_id
+
+
+def analysis_cache_key(credentials: dict = None):
+    """
+    分析結果キャッシュのキー（アカウントID・リージョン・オプションのハッシュ）
+    アカウントIDが取得できない場合（認証情報が無効な場合を含む）は None（キャッシュを参照しない）
+    """
+    try:
+        account_id = get_account_id(credentials)
+    except Exception as e:
+        print(f"[ResultCache] account lookup failed, cache disabled: {e}")
+        return None
+    scope = {
+        'account': account_id,
+        'region': 'ap-northeast-1' if credentials else os.environ.get("AWS_REGION", "ap-northeast-1"),
+        'options': {
+            'source': 'sso' if credentials else 'role',
+            'model_id': os.environ.get("BEDROCK_MODEL_ID", "amazon.nova-lite-v1:0"),
+            'pricing_engine': PRICING_ENGINE
+        }
+    }
+    return hashlib.sha256(json.dumps(scope, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_cached_analysis(cache_key, profile: str = None):
+    """キャッシュ済みの分析結果を取得（なければ None）"""
+    if not cache_key or RESULT_CACHE_TTL <= 0:
+        return None
+    response = get_result_cache().get(cache_key)
+    if response is None:
+        return None
+    print(f"[ResultCache] hit {cache_key[:12]} (analyzed_at={response.get('analyzed_at')})")
+    response['cached'] = True
+    if profile:
+        response['profile'] = profile
+    return response
+
+
+def run_analysis(credentials: dict = None, profile: str = None, force_refresh: bool = False,
+                 on_step=None, cache_key=None) -> dict:
+    """
+    分析を実行してAPIレスポンスのボディを返す（結果キャッシュ経由）
+    force_refresh: キャッシュを使わずに再分析（結果はキャッシュを更新）
+    cache_key: 計算済みのキャッシュキー（省略時は計算）
+    """
+    cache_key = cache_key or analysis_cache_key(credentials)
+    if not force_refresh:
+        response = get_cached_analysis(cache_key, profile)
+        if response is not None:
+            return response
+    
+    result = run_analysis_pipeline(analysis_collectors(credentials), on_step=on_step)
+    response = build_analysis_response(result, profile)
+    response['analyzed_at'] = datetime.now(timezone.utc).isoformat()
+    if cache_key and RESULT_CACHE_TTL > 0:
+        try:
+            get_result_cache().put(cache_key, response)
+        except Exception as e:
+            print(f"[ResultCache] put failed: {e}")
+    response['cached'] = False
+    return response
+
+
+def response_events(response: dict) -> list:
+    """APIレスポンスのボディを表示用イベントに変換（キャッシュ済み結果の返却用）"""
+    events = [
+        {'type': 'section', 'key': key, 'items': response['resources'].get(key, [])}
+        for key in SESSION_COLLECTORS
+    ]
+    events.append({'type': 'pricing', 'pricing': response['pricing'], 'mcp_recommendations': response['mcp_recommendations']})
+    events.append({'type': 'analysis', 'analysis': response['analysis'], 'token_usage': response['token_usage']})
+    return events
+
+
+def is_valid_job_id(job_id) -> bool:
+    """ジョブIDの形式チェック（ストアのキー・ファイル名に使うため）"""
+    try:
+        return isinstance(job_id, str) and str(uuid.UUID(job_id)) == job_id
+    except ValueError:
+        return False
+
+
+def submit_analysis_job(credentials: dict = None, profile: str = None, context=None,
+                        force_refresh: bool = False) -> dict:
+    """
+    分析ジョブを登録してワーカーを起動し、ジョブ状態を返す
+    結果キャッシュがあればワーカーを起動せず、完了済みのジョブ（全イベント付き）を返す
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    job = {
+        'job_id': str(uuid.uuid4()),
+        'status': 'queued',
+        'created_at': now,
+        'updated_at': now,
+        'progress': {'completed': [], 'total': len(build_analysis_steps(analysis_collectors(credentials)))},
+        'events': []
+    }
+    store = get_job_store()
+    
+    cache_key = analysis_cache_key(credentials)
+    cached = None if force_refresh else get_cached_analysis(cache_key, profile)
+    if cached is not None:
+        job.update(status='done', result=cached, events=response_events(cached), cached=True)
+        store.put(job['job_id'], job)
+        print(f"[Job] {job['job_id']} served from result cache")
+        return job
+    
+    store.put(job['job_id'], job)
+    
+    worker_args = {'job_id': job['job_id'], 'credentials': credentials, 'profile': profile, 'cache_key': cache_key}
+    if JOB_WORKER == 'thread' or context is None:
+        threading.Thread(target=run_analysis_job, kwargs=worker_args, daemon=True).start()
+    else:
+        # 認証情報はジョブストアに保存せず、ワーカー起動のペイロードでのみ渡す
+        thread_client('lambda').invoke(
+            FunctionName=context.function_name,
+            InvocationType='Event',
+            Payload=json.dumps({'job_worker': worker_args}).encode('utf-8')
+        )
+    print(f"[Job] submitted {job['job_id']} (worker={JOB_WORKER if context else 'thread'})")
+    return job
+
+
+def run_analysis_job(job_id: str, credentials: dict = None, profile: str = None, cache_key: str = None):
+    """
+    分析ジョブのワーカー
+    ステップ完了毎に進捗と表示用イベント（analysis_step_events）を保存し、get_job で部分結果として公開
+    キャッシュの確認は受付時に済んでいるため常に分析し、結果でキャッシュを更新する
+    """
+    store = get_job_store()
+    job = store.get(job_id)
+    if job is None:
+        print(f"[Job] not found: {job_id}")
+        return
+    # 再配信された呼び出しで同じジョブを再実行しない（イベントが重複するため）
+    if job['status'] != 'queued':
+        print(f"[Job] skip {job_id}: already {job['status']}")
+        return
+    
+    def save(**fields):
+        job.update(fields, updated_at=datetime.now(timezone.utc).isoformat())
+        store.put(job_id, job)
+    
+    def on_step(name, results):
+        job['progress']['completed'].append(name)
+        job['events'].extend(analysis_step_events(name, results))
+        save()
+    
+    save(status='running')
+    try:
+        response = run_analysis(credentials, profile, force_refresh=True, on_step=on_step, cache_key=cache_key)
+        save(status='done', result=response)
+        print(f"[Job] done {job_id}")
+    except Exception as e:
+        import traceback
+        print(f"[Job] error {job_id}: {e}\n{traceback.format_exc()}")
+        save(status='error', error=str(e))
+
+
+def expire_stale_job(job: dict, store) -> dict:
+    """未完了のまま JOB_STALE_SECONDS 以上更新のないジョブをエラーとして保存（ワーカーのタイムアウト・異常終了）"""
+    if job.get('status') not in ('queued', 'running'):
+        return job
+    updated_at = datetime.fromisoformat(job['updated_at'])
+    if (datetime.now(timezone.utc) - updated_at).total_seconds() < JOB_STALE_SECONDS:
+        return job
+    job.update(status='error', error='analysis timed out', updated_at=datetime.now(timezone.utc).isoformat())
+    store.put(job['job_id'], job)
+    print(f"[Job] expired {job['job_id']}")
+    return job
+
+
 def get_html_template():
     """フロントエンドHTMLを返す"""
     return '''<!DOCTYPE html>
@@ -2171,6 +2996,10 @@ def get_html_template():
                     <span>🔍</span>
                     分析を実行
                 </button>
+                <button class="btn btn-secondary" onclick="runAnalysis(true)" id="refreshBtn" title="キャッシュを使わずに再分析">
+                    <span>🔄</span>
+                    再分析
+                </button>
                 <button class="btn btn-secondary" onclick="clearResults()" id="clearBtn">
                     <span>🗑️</span>
                     結果をクリア
@@ -2372,27 +3201,72 @@ def get_html_template():
             });
         }
 
-        // サイズ順序定義（共通）
-        const SIZE_ORDER = {
-            'nano': 0.25, 'micro': 0.5, 'small': 1, 'medium': 2, 
-            'large': 4, 'xlarge': 8, '2xlarge': 16, '4xlarge': 32, 
-            '8xlarge': 64, '12xlarge': 96, '16xlarge': 128, '24xlarge': 192
+        // サイズ順序定義（共通、metalは同ファミリー最大サイズ以上）
+        const SIZE_NAMES = ['nano', 'micro', 'small', 'medium', 'large', 'xlarge', '2xlarge', '3xlarge', '4xlarge',
+                            '6xlarge', '8xlarge', '9xlarge', '12xlarge', '16xlarge', '18xlarge', '24xlarge',
+                            '32xlarge', '48xlarge', 'metal'];
+        
+        // インスタンス性能テーブル（MCPサーバーの get_vcpus / exceeds_credit_baseline と同じ規則）
+        // T系: size -> [vCPU, vCPUあたりベースライン%]
+        const T3_CLASS = {
+            'nano': [2, 5], 'micro': [2, 10], 'small': [2, 20], 'medium': [2, 20],
+            'large': [2, 30], 'xlarge': [4, 40], '2xlarge': [8, 40]
+        };
+        const BURSTABLE_CAPABILITIES = {
+            't3': T3_CLASS, 't3a': T3_CLASS, 't4g': T3_CLASS,
+            't2': {
+                'nano': [1, 5], 'micro': [1, 10], 'small': [1, 20], 'medium': [2, 20],
+                'large': [2, 30], 'xlarge': [4, 22.5], '2xlarge': [8, 17]
+            }
+        };
+        // 非バースト系のサイズ別vCPU
+        const SIZE_VCPUS = {
+            'medium': 1, 'large': 2, 'xlarge': 4, '2xlarge': 8, '3xlarge': 12, '4xlarge': 16,
+            '6xlarge': 24, '8xlarge': 32, '9xlarge': 36, '12xlarge': 48, '16xlarge': 64,
+            '18xlarge': 72, '24xlarge': 96, '32xlarge': 128, '48xlarge': 192
+        };
+        // metal の実vCPU（ファミリー毎）
+        const METAL_VCPUS = {
+            'c5': 96, 'c5d': 96, 'c5n': 72, 'c6g': 64, 'c6gd': 64, 'c6i': 128, 'c6id': 128, 'c6a': 192,
+            'c7g': 64, 'c7gd': 64, 'c7i': 192, 'c7a': 192,
+            'm5': 96, 'm5d': 96, 'm5zn': 48, 'm6g': 64, 'm6gd': 64, 'm6i': 128, 'm6id': 128, 'm6a': 192,
+            'm7g': 64, 'm7gd': 64, 'm7i': 192, 'm7a': 192,
+            'r5': 96, 'r5d': 96, 'r5b': 96, 'r6g': 64, 'r6gd': 64, 'r6i': 128, 'r6id': 128, 'r6a': 192,
+            'r7g': 64, 'r7gd': 64, 'r7i': 192, 'r7a': 192,
+            'i3': 72, 'i3en': 96, 'i4i': 128, 'x2iezn': 48, 'z1d': 48
         };
-        const SIZE_NAMES = ['nano', 'micro', 'small', 'medium', 'large', 'xlarge', '2xlarge', '4xlarge', '8xlarge', '12xlarge', '16xlarge', '24xlarge'];
+        
+        // 予測CPU計算用のvCPU数（CPU使用率は全vCPUに対する割合のため、バースト可能タイプも実vCPU数）
+        function getVcpus(type) {
+            if (!type) return null;
+            const parts = type.split('.');
+            if (parts.length < 2) return null;
+            const size = parts[parts.length - 1];
+            const baseFamily = parts[parts.length - 2];  // db.t3 -> t3, cache.r6g -> r6g
+            
+            const burstable = BURSTABLE_CAPABILITIES[baseFamily];
+            if (burstable) {
+                const spec = burstable[size];
+                return spec ? spec[0] : null;
+            }
+            if (size === 'metal') return METAL_VCPUS[baseFamily] || null;
+            return SIZE_VCPUS[size] || null;
+        }
+        
+        // バースト可能タイプで予測CPUがベースラインを超える（CPUクレジットを消費し続ける）か
+        function exceedsCreditBaseline(type, predictedCpu) {
+            const parts = type.split('.');
+            const burstable = BURSTABLE_CAPABILITIES[parts[parts.length - 2]];
+            const spec = burstable ? burstable[parts[parts.length - 1]] : null;
+            return spec ? predictedCpu > spec[1] : false;
+        }
         
         // インスタンスタイプからサイズ係数を推定（CPU予測用）
         function getInstanceSizeRatio(fromType, toType) {
             if (!fromType || !toType || fromType === '-' || toType === '-') return null;
             
-            // タイプからサイズを抽出 (例: t3.medium -> medium, db.r5.large -> large)
-            const getSize = (type) => {
-                const parts = type.split('.');
-                const sizePart = parts[parts.length - 1];
-                return SIZE_ORDER[sizePart] || null;
-            };
-            
-            const fromSize = getSize(fromType);
-            const toSize = getSize(toType);
+            const fromSize = getVcpus(fromType);
+            const toSize = getVcpus(toType);
             
             if (fromSize && toSize && toSize > 0) {
                 return fromSize / toSize;
@@ -2407,13 +3281,14 @@ def get_html_template():
             'c5': 'large', 'c5a': 'large', 'c5n': 'large', 'c6i': 'large', 'c6a': 'large', 'c6g': 'large', 'c7g': 'large',
             'm5': 'large', 'm5a': 'large', 'm5n': 'large', 'm6i': 'large', 'm6a': 'large', 'm6g': 'large', 'm7g': 'large',
             'r5': 'large', 'r5a': 'large', 'r5n': 'large', 'r6i': 'large', 'r6a': 'large', 'r6g': 'large', 'r7g': 'large',
+            'c7i': 'large', 'c7a': 'large', 'm7i': 'large', 'm7a': 'large', 'r7i': 'large', 'r7a': 'large',
             // EC2 T系は nano が最小
             't3': 'nano', 't3a': 'nano', 't4g': 'nano',
             // RDS/DocumentDB - R/M系は large が最小、T系は medium が最小
-            'db.r5': 'large', 'db.r6g': 'large', 'db.m5': 'large', 'db.m6g': 'large',
+            'db.r5': 'large', 'db.r6g': 'large', 'db.r7g': 'large', 'db.m5': 'large', 'db.m6g': 'large', 'db.m7g': 'large',
             'db.t3': 'medium', 'db.t4g': 'medium',
             // ElastiCache - R/M系は large が最小、T系は micro が最小
-            'cache.r5': 'large', 'cache.r6g': 'large', 'cache.m5': 'large', 'cache.m6g': 'large',
+            'cache.r5': 'large', 'cache.r6g': 'large', 'cache.r7g': 'large', 'cache.m5': 'large', 'cache.m6g': 'large', 'cache.m7g': 'large',
             'cache.t3': 'micro', 'cache.t4g': 'micro',
         };
         
@@ -2428,7 +3303,7 @@ def get_html_template():
             
             const prefix = parts.slice(0, -1).join('.');  // db.t3, cache.t3, t3a など
             const currentSize = parts[parts.length - 1];
-            const currentSizeValue = SIZE_ORDER[currentSize];
+            const currentSizeValue = getVcpus(instanceType);
             if (!currentSizeValue) return null;
             
             // ファミリーの最小サイズを取得
@@ -2445,12 +3320,16 @@ def get_html_template():
             for (let i = currentSizeIndex - 1; i >= minSizeIndex; i--) {
                 const candidateSize = SIZE_NAMES[i];
                 const candidateType = prefix + '.' + candidateSize;
-                const candidateSizeValue = SIZE_ORDER[candidateSize];
+                const candidateSizeValue = getVcpus(candidateType);
+                if (!candidateSizeValue) continue;
                 
                 // 予測CPU計算
                 const ratio = currentSizeValue / candidateSizeValue;
                 const predictedCpu = cpuAvgMax * ratio;
                 
+                // CPUクレジットが不足する候補はスキップ
+                if (exceedsCreditBaseline(candidateType, predictedCpu)) continue;
+                
                 // 価格が取得できるか確認
                 const candidatePrice = getInstancePrice(candidateType, service);
                 const currentPrice = getInstancePrice(instanceType, service);
@@ -2941,6 +3820,14 @@ def get_html_template():
             return recommendations;
         }
 
+        const RESOURCE_SECTIONS = [
+            { key: 'ec2', title: 'EC2 インスタンス', emoji: '💻' },
+            { key: 'rds', title: 'RDS クラスター', emoji: '🗄️' },
+            { key: 'redis', title: 'Redis (ElastiCache)', emoji: '⚡' },
+            { key: 'memcache', title: 'Memcached (ElastiCache)', emoji: '🚀' },
+            { key: 'docdb', title: 'DocumentDB', emoji: '📑' }
+        ];
+
         function renderResources(resources, aiRecommendations = null) {
             const container = document.getElementById('resourceCards');
             container.innerHTML = '';
@@ -2951,36 +3838,9 @@ def get_html_template():
                 globalAiRecommendations = aiRecommendations;
             }
 
-            const sections = [
-                { key: 'ec2', title: 'EC2 インスタンス', emoji: '💻' },
-                { key: 'rds', title: 'RDS クラスター', emoji: '🗄️' },
-                { key: 'redis', title: 'Redis (ElastiCache)', emoji: '⚡' },
-                { key: 'memcache', title: 'Memcached (ElastiCache)', emoji: '🚀' },
-                { key: 'docdb', title: 'DocumentDB', emoji: '📑' }
-            ];
-
-            sections.forEach(section => {
-                const data = resources[section.key];
-                if (data && data.length > 0) {
-                    const recs = globalAiRecommendations[section.key] || [];
-                    const card = document.createElement('div');
-                    card.className = 'resource-card';
-                    card.dataset.sectionKey = section.key;
-                    card.innerHTML = `
-                        <div class="resource-card-header">
-                            <div class="section-title">
-                                <div class="icon ${section.key}">${section.emoji}</div>
-                                ${section.title}
-                                <span style="color: var(--text-secondary); font-weight: 400; font-size: 0.9rem;">(${data.length}件)</span>
-                            </div>
-                            <button class="copy-btn" onclick="copySectionData('${section.key}', this)" title="データをコピー">
-                                📋 コピー
-                            </button>
-                        </div>
-                        <div class="resource-card-body">
-                            ${createCostTable(data, section.key, recs)}
-                        </div>
-                    `;
+            RESOURCE_SECTIONS.forEach(section => {
+                const card = createResourceCard(section, resources[section.key]);
+                if (card) {
                     container.appendChild(card);
                 }
             });
@@ -2988,6 +3848,54 @@ def get_html_template():
             document.getElementById('resultsSection').classList.add('visible');
         }
 
+        // 1サービス分のリソースを表示（届いた順に呼ばれても表示順は RESOURCE_SECTIONS の順）
+        function renderResourceSection(key, data) {
+            const container = document.getElementById('resourceCards');
+            globalResources = globalResources || {};
+            globalResources[key] = data;
+
+            const index = RESOURCE_SECTIONS.findIndex(section => section.key === key);
+            const existing = container.querySelector(`[data-section-key="${key}"]`);
+            const card = createResourceCard(RESOURCE_SECTIONS[index], data);
+            if (existing) {
+                existing.remove();
+            }
+            if (card) {
+                const next = Array.from(container.children).find(
+                    child => RESOURCE_SECTIONS.findIndex(section => section.key === child.dataset.sectionKey) > index
+                );
+                container.insertBefore(card, next || null);
+            }
+
+            document.getElementById('resultsSection').classList.add('visible');
+        }
+
+        function createResourceCard(section, data) {
+            if (!data || data.length === 0) {
+                return null;
+            }
+            const recs = globalAiRecommendations[section.key] || [];
+            const card = document.createElement('div');
+            card.className = 'resource-card';
+            card.dataset.sectionKey = section.key;
+            card.innerHTML = `
+                <div class="resource-card-header">
+                    <div class="section-title">
+                        <div class="icon ${section.key}">${section.emoji}</div>
+                        ${section.title}
+                        <span style="color: var(--text-secondary); font-weight: 400; font-size: 0.9rem;">(${data.length}件)</span>
+                    </div>
+                    <button class="copy-btn" onclick="copySectionData('${section.key}', this)" title="データをコピー">
+                        📋 コピー
+                    </button>
+                </div>
+                <div class="resource-card-body">
+                    ${createCostTable(data, section.key, recs)}
+                </div>
+            `;
+            return card;
+        }
+
         function renderAnalysis(text, tokenUsage = null) {
             const card = document.getElementById('analysisCard');
             const content = document.getElementById('analysisContent');
@@ -3190,64 +4098,145 @@ def get_html_template():
             }
         }
 
-        async function runAnalysis() {
+        // 分析ジョブの状態確認間隔・打ち切りまでの時間（サーバー側のタイムアウト判定より長く）
+        const JOB_POLL_INTERVAL_MS = 2000;
+        const JOB_POLL_TIMEOUT_MS = 6 * 60 * 1000;
+
+        async function postAction(requestBody) {
+            const response = await fetch(window.location.href, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify(requestBody)
+            });
+
+            if (!response.ok) {
+                throw new Error('API request failed');
+            }
+            return response.json();
+        }
+
+        // 分析イベント（サービス毎のリソース / 価格・提案 / AI分析）を表示に反映
+        function applyAnalysisEvent(event) {
+            if (event.type === 'section') {
+                renderResourceSection(event.key, event.items);
+            } else if (event.type === 'pricing') {
+                // MCP から取得した価格データ・推奨を設定し、表示済みのセクションを価格付きで再描画
+                setPricingData(event.pricing);
+                globalMcpRecommendations = event.mcp_recommendations || {};
+                console.log('MCP recommendations loaded:', Object.keys(globalMcpRecommendations).length, 'items');
+                renderResources(globalResources || {});
+            } else if (event.type === 'analysis') {
+                renderAnalysis(event.analysis, event.token_usage);
+            }
+        }
+
+        // コンパクト形式（format=compact）のレスポンスを resources / pricing / mcp_recommendations に展開
+        function expandCompactResponse(data) {
+            if (!data || data.format !== 'compact') {
+                return data;
+            }
+            const resources = {};
+            const pricing = { ec2: {}, rds: {}, elasticache: {}, docdb: {} };
+            const recommendations = {};
+            Object.entries(data.resources).forEach(([key, table]) => {
+                if (table.items) {
+                    resources[key] = table.items;
+                    return;
+                }
+                const serviceKey = data.price_services[key];
+                resources[key] = table.rows.map(row => {
+                    const item = {};
+                    table.fields.forEach((field, i) => { item[field] = row[i]; });
+                    const price = item._price;
+                    const rec = item._rec;
+                    delete item._price;
+                    delete item._rec;
+                    if (price && serviceKey) {
+                        pricing[serviceKey][item.instance_type] = price;
+                    }
+                    if (rec) {
+                        recommendations[item.name] = Object.assign({ name: item.name, instance_type: item.instance_type }, rec);
+                    }
+                    return item;
+                });
+            });
+            return Object.assign({}, data, { resources: resources, pricing: pricing, mcp_recommendations: recommendations });
+        }
+
+        // 分析レスポンス全体を表示に反映
+        function applyAnalysisResponse(data) {
+            applyAnalysisEvent({ type: 'pricing', pricing: data.pricing, mcp_recommendations: data.mcp_recommendations });
+            renderResources(data.resources);
+            if (data.analysis) {
+                renderAnalysis(data.analysis, data.token_usage);
+            }
+        }
+
+        // forceRefresh: 分析結果キャッシュを使わずに再分析
+        async function runAnalysis(forceRefresh = false) {
             const analyzeBtn = document.getElementById('analyzeBtn');
+            const refreshBtn = document.getElementById('refreshBtn');
             analyzeBtn.disabled = true;
+            refreshBtn.disabled = true;
 
             try {
                 showStatus('AWSリソース情報を収集中...', 'loading');
                 
                 // SSO 認証情報がある場合はそれを使用
-                let requestBody = { action: 'analyze' };
+                let requestBody = { action: 'submit_analysis', force_refresh: forceRefresh, format: 'compact' };
                 console.log('currentCredentials:', currentCredentials);
                 console.log('currentProfile:', currentProfile);
                 
                 if (currentCredentials && currentCredentials.accessKeyId) {
                     console.log('Using SSO credentials for analysis');
-                    requestBody = {
-                        action: 'analyze_with_credentials',
-                        credentials: currentCredentials,
-                        profile: currentProfile
-                    };
+                    requestBody.credentials = currentCredentials;
+                    requestBody.profile = currentProfile;
                 } else {
                     console.log('No SSO credentials, using Lambda role');
                 }
                 
-                console.log('Request body:', JSON.stringify(requestBody));
+                // 分析ジョブを登録（ジョブIDが即時に返る）
+                const submitted = await postAction(requestBody);
+                console.log('Job submitted:', submitted.job_id);
                 
-                const response = await fetch(window.location.href, {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify(requestBody)
-                });
-
-                if (!response.ok) {
-                    throw new Error('API request failed');
+                // 完了までポーリング（サービス毎のリソース・価格・AI分析を届いた順に表示）
+                // キャッシュ済みの結果は登録時点で完了しているため、そのまま表示
+                globalResources = {};
+                document.getElementById('resourceCards').innerHTML = '';
+                let received = 0;
+                const pollDeadline = Date.now() + JOB_POLL_TIMEOUT_MS;
+                if (submitted.status === 'done') {
+                    applyAnalysisResponse(expandCompactResponse(submitted.result));
                 }
-
-                const data = await response.json();
-                
-                // MCP から取得した価格データを設定
-                if (data.pricing) {
-                    setPricingData(data.pricing);
-                }
-                
-                // MCP から取得した推奨を設定
-                if (data.mcp_recommendations) {
-                    globalMcpRecommendations = data.mcp_recommendations;
-                    console.log('MCP recommendations loaded:', Object.keys(globalMcpRecommendations).length, 'items');
+                while (submitted.status !== 'done') {
+                    if (Date.now() > pollDeadline) {
+                        throw new Error('分析がタイムアウトしました');
+                    }
+                    await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+                    const job = await postAction({ action: 'get_job', job_id: submitted.job_id, after: received, include_result: false });
+                    
+                    (job.events || []).forEach(applyAnalysisEvent);
+                    received += (job.events || []).length;
+                    
+                    if (job.status === 'error') {
+                        throw new Error(job.error || 'analysis failed');
+                    }
+                    if (job.status === 'done') {
+                        break;
+                    }
+                    
+                    const progress = job.progress || { completed: [], total: 0 };
+                    showStatus('分析中... (' + progress.completed.length + '/' + progress.total + ' ステップ完了)', 'loading');
                 }
-                
-                showStatus('リソース情報を表示中...', 'loading');
-                renderResources(data.resources);
 
-                if (data.analysis) {
-                    renderAnalysis(data.analysis, data.token_usage);
+                if (submitted.status === 'done') {
+                    const analyzedAt = submitted.result.analyzed_at ? new Date(submitted.result.analyzed_at).toLocaleString() : '-';
+                    showStatus('キャッシュ済みの分析結果を表示しました（' + analyzedAt + ' 時点、最新化は「再分析」）', 'success');
+                } else {
+                    showStatus('分析が完了しました', 'success');
                 }
-
-                showStatus('分析が完了しました', 'success');
                 setTimeout(hideStatus, 3000);
 
             } catch (error) {
@@ -3255,6 +4244,7 @@ def get_html_template():
                 showStatus('エラーが発生しました: ' + error.message, 'error');
             } finally {
                 analyzeBtn.disabled = false;
+                refreshBtn.disabled = false;
             }
         }
 
@@ -3426,9 +4416,68 @@ ALLOWED_IPS = [
 ]
 
 
+# HTML はモジュール初期化時に1回だけ生成（ETag は内容のハッシュ、gzip 版も事前に作成）
+# キャッシュ方針: 既定は毎回 ETag で再検証（変更がなければ 304 で本文なし）
+HTML_CACHE_CONTROL = os.environ.get("HTML_CACHE_CONTROL", "no-cache")
+HTML_PAGE = get_html_template()
+HTML_ETAG = '"' + hashlib.sha256(HTML_PAGE.encode('utf-8')).hexdigest()[:32] + '"'
+HTML_PAGE_GZIP = base64.b64encode(gzip.compress(HTML_PAGE.encode('utf-8'), compresslevel=9)).decode('ascii')
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match ヘッダーが ETag に一致するか（弱い比較、* は常に一致）"""
+    for token in if_none_match.split(","):
+        token = token.strip()
+        if token == "*" or token.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def html_response(event: dict, api_headers: dict) -> dict:
+    """
+    事前生成したHTMLを返す（If-None-Match 一致時は 304、gzip 対応クライアントには圧縮版）
+    api_headers からは CORS ヘッダーのみ引き継ぐ（キャッシュ無効化ヘッダーは JSON API 用）
+    """
+    request_headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    headers = {k: v for k, v in api_headers.items() if k.startswith('Access-Control-')}
+    headers.update({
+        'Content-Type': 'text/html; charset=utf-8',
+        'Cache-Control': HTML_CACHE_CONTROL,
+        'ETag': HTML_ETAG,
+        'Vary': 'Accept-Encoding'
+    })
+    
+    if etag_matches(request_headers.get('if-none-match', ''), HTML_ETAG):
+        return {
+            'statusCode': 304,
+            'headers': headers,
+            'body': ''
+        }
+    
+    if accepts_gzip(request_headers.get('accept-encoding', '')):
+        headers['Content-Encoding'] = 'gzip'
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': HTML_PAGE_GZIP,
+            'isBase64Encoded': True
+        }
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': HTML_PAGE
+    }
+
+
 def lambda_handler(event, context):
     """Lambda関数のメインハンドラー"""
     
+    # 非同期ジョブのワーカー（submit_analysis からの自己呼び出し）
+    if 'job_worker' in event:
+        run_analysis_job(**event['job_worker'])
+        return {'status': 'ok'}
+    
     # Function URLからのリクエストを処理
     http_method = event.get('requestContext', {}).get('http', {}).get('method', 'GET')
     
@@ -3461,17 +4510,9 @@ def lambda_handler(event, context):
             'body': ''
         }
     
-    # GETリクエスト - HTMLまたはスクリプトを返す
+    # GETリクエスト - 事前生成したHTMLを返す（HTMLのみキャッシュ可、JSON API は従来通りキャッシュ無効）
     if http_method == 'GET':
-        # パスをチェック
-        path = event.get('rawPath', '') or event.get('requestContext', {}).get('http', {}).get('path', '')
-        
-        # 通常のHTMLページ
-        return {
-            'statusCode': 200,
-            'headers': headers,
-            'body': get_html_template()
-        }
+        return html_response(event, headers)
     
     # POSTリクエスト - 分析を実行
     if http_method == 'POST':
@@ -3551,71 +4592,66 @@ def lambda_handler(event, context):
                         'body': json.dumps({'error': 'credentials is required'})
                     }
                 
-                # ユーザーの認証情報でリソース収集
-                print("Step 1: Collecting resources with credentials...")
-                resources = collect_resources_with_credentials(credentials)
-                print(f"Step 1 done: EC2={len(resources.get('ec2', []))}, RDS={len(resources.get('rds', []))}")
-                
-                # MCP サーバーから価格情報を取得
-                print("Step 2: Collecting pricing info...")
-                pricing_info = collect_pricing_info(resources)
-                print(f"Step 2 done: pricing keys = {list(pricing_info.keys())}")
-                
-                # MCP サーバーから一括スケールダウン提案を取得
-                print("Step 2.5: Getting MCP batch recommendations...")
-                mcp_recommendations = get_mcp_batch_recommendations(resources)
-                print(f"Step 2.5 done: {len(mcp_recommendations)} recommendations")
-                
-                # Bedrock用にフォーマット（価格情報含む）
-                print("Step 3: Formatting for Bedrock...")
-                resource_text = format_resources_for_bedrock(resources, pricing_info)
-                print(f"Step 3 done: text length = {len(resource_text)}")
-                
-                # Bedrockで分析（サマリーのみ使用）
-                print("Step 4: Getting Bedrock analysis...")
-                analysis_result = get_bedrock_analysis(resource_text)
-                print(f"Step 4 done: analysis length = {len(analysis_result.get('text', ''))}")
+                # ユーザーの認証情報でリソース収集 → 価格・提案 → Bedrock分析（サービス毎の収集は並行）
+                # 同じアカウント・リージョン・オプションの結果がキャッシュにあれば再利用（force_refresh で再分析）
+                print("Running analysis pipeline with credentials...")
+                response = run_analysis(credentials, profile, force_refresh=bool(body.get('force_refresh')))
+                resources = response['resources']
+                print(f"Pipeline done: EC2={len(resources.get('ec2', []))}, RDS={len(resources.get('rds', []))}, "
+                      f"{len(response['mcp_recommendations'])} recommendations, cached={response['cached']}")
                 
-                print("Step 5: Preparing response...")
+                return json_response(200, headers, format_analysis_response(response, body.get('format')), event)
+            
+            # 非同期分析の受付（ジョブIDを即時返却し、結果は get_job でポーリング）
+            if action == 'submit_analysis':
+                job = submit_analysis_job(body.get('credentials'), body.get('profile'), context,
+                                          force_refresh=bool(body.get('force_refresh')))
+                # キャッシュ済みの場合はポーリング不要（全イベントをそのまま返す）
+                # format=compact では重複するイベントを省略し、コンパクト形式の結果のみ返す
+                if job['status'] == 'done':
+                    if body.get('format') == 'compact':
+                        job = dict(job, events=[], result=compact_analysis_response(job['result']))
+                    return json_response(200, headers, job, event)
                 return {
-                    'statusCode': 200,
+                    'statusCode': 202,
                     'headers': headers,
-                    'body': json.dumps({
-                        'resources': resources,
-                        'pricing': pricing_info,
-                        'analysis': analysis_result['text'],
-                        'token_usage': analysis_result['token_usage'],
-                        'profile': profile,
-                        'mcp_recommendations': mcp_recommendations
-                    }, ensure_ascii=False, default=str)
+                    'body': json.dumps({'job_id': job['job_id'], 'status': job['status']})
                 }
             
-            # デフォルト: Lambda の IAM ロールでリソース収集
-            resources = collect_all_resources()
-            
-            # MCP サーバーから価格情報を取得
-            pricing_info = collect_pricing_info(resources)
-            
-            # MCP サーバーから一括スケールダウン提案を取得
-            mcp_recommendations = get_mcp_batch_recommendations(resources)
-            
-            # Bedrock用にフォーマット（価格情報含む）
-            resource_text = format_resources_for_bedrock(resources, pricing_info)
+            # 非同期分析の状態取得（進捗・表示用イベント・完了時は結果）
+            # after: 受信済みのイベント数（それ以降のイベントのみ返す）
+            if action == 'get_job':
+                job_id = body.get('job_id')
+                after = body.get('after', 0)
+                if not isinstance(after, int) or isinstance(after, bool) or after < 0:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'after must be a non-negative integer'})
+                    }
+                store = get_job_store()
+                job = store.get(job_id) if is_valid_job_id(job_id) else None
+                if job is None:
+                    return {
+                        'statusCode': 404,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'job not found'})
+                    }
+                job = expire_stale_job(job, store)
+                # include_result=false: 結果を省略（イベントで表示済みのクライアント向け）
+                job['events_offset'] = after
+                job['events'] = job.get('events', [])[after:]
+                if 'result' in job:
+                    if body.get('include_result', True):
+                        job['result'] = format_analysis_response(job['result'], body.get('format'))
+                    else:
+                        del job['result']
+                return json_response(200, headers, job, event)
             
-            # Bedrockで分析（サマリーのみ使用）
-            analysis_result = get_bedrock_analysis(resource_text)
+            # デフォルト: Lambda の IAM ロールでリソース収集 → 価格・提案 → Bedrock分析（結果キャッシュ経由）
+            response = run_analysis(force_refresh=bool(body.get('force_refresh')))
             
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps({
-                    'resources': resources,
-                    'pricing': pricing_info,
-                    'analysis': analysis_result['text'],
-                    'token_usage': analysis_result['token_usage'],
-                    'mcp_recommendations': mcp_recommendations
-                }, ensure_ascii=False, default=str)
-            }
+            return json_response(200, headers, format_analysis_response(response, body.get('format')), event)
             
         except Exception as e:
             import traceback
@@ -0,0 +1,63 @@
+"""Lambda ハンドラーのテスト共通設定（AWS API は呼ばず、ジョブ・結果はテスト毎の一時ディレクトリに保存）"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+@pytest.fixture
+def handler(tmp_path, monkeypatch):
+    """ファイルストア・スレッドワーカー・AgentCore 経由の設定で handler を読み込む"""
+    pytest.importorskip("boto3")
+    import handler as module
+
+    monkeypatch.setattr(module, "JOB_STORE", "file")
+    monkeypatch.setattr(module, "JOB_STORE_DIR", str(tmp_path / "jobs"))
+    monkeypatch.setattr(module, "JOB_WORKER", "thread")
+    monkeypatch.setattr(module, "RESULT_CACHE", "file")
+    monkeypatch.setattr(module, "RESULT_CACHE_DIR", str(tmp_path / "results"))
+    monkeypatch.setattr(module, "PRICING_ENGINE", "agentcore")
+    monkeypatch.setattr(module, "_job_store", None)
+    monkeypatch.setattr(module, "_result_cache", None)
+    monkeypatch.setattr(module, "_role_account_id", None)
+    return module
+
+
+@pytest.fixture
+def api(handler):
+    """Function URL のイベント形式で lambda_handler を呼ぶ（許可IPから）"""
+    def call(body: dict = None, method: str = "POST", headers: dict = None):
+        event = {
+            "requestContext": {"http": {"method": method, "sourceIp": handler.ALLOWED_IPS[0]}},
+            "headers": headers or {},
+            "body": json.dumps(body) if body is not None else None,
+        }
+        return handler.lambda_handler(event, None)
+    return call
+
+
+@pytest.fixture
+def pipeline(handler, monkeypatch):
+    """分析パイプラインの AWS・MCP・Bedrock 呼び出しを固定値に差し替え（IAM ロールのアカウントは固定）"""
+    state = {"runs": 0, "bedrock_gate": None}
+
+    def bedrock(text):
+        if state["bedrock_gate"] is not None:
+            state["bedrock_gate"].wait(5)
+        state["runs"] += 1
+        return {"text": f"analysis #{state['runs']}", "token_usage": {"input": 1, "output": 1}}
+
+    monkeypatch.setattr(handler, "DEFAULT_COLLECTORS", {
+        "ec2": lambda: [{"name": "web-1", "instance_type": "m5.large"}],
+        "rds": lambda: [],
+    })
+    monkeypatch.setattr(handler, "collect_pricing_and_recommendations",
+                        lambda resources: ({"ec2": {"m5.large": 0.124}}, {}))
+    monkeypatch.setattr(handler, "format_resources_for_bedrock", lambda resources, pricing: "resources")
+    monkeypatch.setattr(handler, "get_bedrock_analysis", bedrock)
+    monkeypatch.setattr(handler, "_role_account_id", "111111111111")
+    return state
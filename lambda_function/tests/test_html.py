@@ -0,0 +1,39 @@
+"""HTML 配信（ETag による再検証・gzip）のテスト"""
+
+import base64
+import gzip
+
+import pytest
+
+
+def test_get_returns_page_with_etag(handler, api):
+    response = api(method="GET")
+    assert response["statusCode"] == 200
+    assert response["body"] == handler.HTML_PAGE
+    assert response["headers"]["ETag"] == handler.HTML_ETAG
+    assert response["headers"]["Cache-Control"] == handler.HTML_CACHE_CONTROL
+    assert "Pragma" not in response["headers"]
+
+
+@pytest.mark.parametrize("if_none_match", ["{etag}", "W/{etag}", '"other", {etag}', "*"])
+def test_matching_etag_returns_not_modified(handler, api, if_none_match):
+    response = api(method="GET", headers={"If-None-Match": if_none_match.format(etag=handler.HTML_ETAG)})
+    assert response["statusCode"] == 304
+    assert response["body"] == ""
+    assert response["headers"]["ETag"] == handler.HTML_ETAG
+
+
+def test_changed_etag_returns_full_page(handler, api):
+    response = api(method="GET", headers={"if-none-match": '"stale"'})
+    assert response["statusCode"] == 200
+    assert response["body"] == handler.HTML_PAGE
+
+
+def test_gzip_client_gets_compressed_page(handler, api):
+    response = api(method="GET", headers={"Accept-Encoding": "gzip, br"})
+    assert response["isBase64Encoded"] is True
+    assert response["headers"]["Content-Encoding"] == "gzip"
+    assert gzip.decompress(base64.b64decode(response["body"])).decode("utf-8") == handler.HTML_PAGE
+
+    response = api(method="GET", headers={"Accept-Encoding": "gzip;q=0"})
+    assert "Content-Encoding" not in response["headers"]
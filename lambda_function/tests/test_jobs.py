@@ -0,0 +1,107 @@
+"""非同期分析ジョブ（ジョブストア・ワーカー・get_job）のテスト"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+
+def wait_for_status(handler, job_id: str, statuses: tuple, timeout: float = 5.0) -> dict:
+    deadline = time.time() + timeout
+    while True:
+        job = handler.get_job_store().get(job_id)
+        if job and job["status"] in statuses:
+            return job
+        assert time.time() < deadline, f"job stayed {job and job['status']}"
+        time.sleep(0.01)
+
+
+def test_file_store_round_trip_and_ttl(handler, tmp_path):
+    store = handler.FileStore(str(tmp_path / "store"), ttl=60)
+    store.put("a", {"status": "queued", "name": "日本語"})
+    assert store.get("a") == {"status": "queued", "name": "日本語"}
+    assert store.get("missing") is None
+
+    path = tmp_path / "store" / "a.json"
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    assert store.get("a") is None
+    assert not path.exists()
+
+
+def test_submitted_job_runs_to_done_with_step_events(handler, pipeline, api):
+    response = api({"action": "submit_analysis"})
+    assert response["statusCode"] == 202
+    job_id = json.loads(response["body"])["job_id"]
+
+    job = wait_for_status(handler, job_id, ("done", "error"))
+    assert job["status"] == "done"
+    assert sorted(job["progress"]["completed"]) == sorted(["ec2", "rds", "resources", "mcp", "format", "bedrock"])
+    assert [event["type"] for event in job["events"]].count("section") == 2
+    assert job["events"][-1] == {"type": "analysis", "analysis": "analysis #1", "token_usage": {"input": 1, "output": 1}}
+    assert job["result"]["cached"] is False
+
+
+def test_get_job_returns_only_events_after_offset(handler, pipeline, api):
+    job_id = json.loads(api({"action": "submit_analysis"})["body"])["job_id"]
+    total = len(wait_for_status(handler, job_id, ("done",))["events"])
+
+    body = json.loads(api({"action": "get_job", "job_id": job_id, "after": total - 1, "include_result": False})["body"])
+    assert body["events_offset"] == total - 1
+    assert [event["type"] for event in body["events"]] == ["analysis"]
+    assert "result" not in body
+
+
+def test_running_job_exposes_partial_progress(handler, pipeline, api):
+    pipeline["bedrock_gate"] = threading.Event()
+    job_id = json.loads(api({"action": "submit_analysis"})["body"])["job_id"]
+    try:
+        deadline = time.time() + 5
+        while "mcp" not in handler.get_job_store().get(job_id)["progress"]["completed"]:
+            assert time.time() < deadline
+            time.sleep(0.01)
+        body = json.loads(api({"action": "get_job", "job_id": job_id})["body"])
+        assert body["status"] == "running"
+        assert "pricing" in [event["type"] for event in body["events"]]
+        assert "result" not in body
+    finally:
+        pipeline["bedrock_gate"].set()
+    wait_for_status(handler, job_id, ("done",))
+
+
+def test_worker_skips_job_that_is_not_queued(handler, pipeline):
+    job_id = str(uuid.uuid4())
+    job = {"job_id": job_id, "status": "done", "events": [], "progress": {"completed": [], "total": 0},
+           "updated_at": datetime.now(timezone.utc).isoformat()}
+    handler.get_job_store().put(job_id, job)
+    # 再配信された非同期呼び出し
+    handler.lambda_handler({"job_worker": {"job_id": job_id}}, None)
+    assert handler.get_job_store().get(job_id) == job
+    assert pipeline["runs"] == 0
+
+
+def test_stale_job_is_reported_as_timed_out(handler, api, monkeypatch):
+    monkeypatch.setattr(handler, "JOB_STALE_SECONDS", 60)
+    store = handler.get_job_store()
+    fresh, stale = str(uuid.uuid4()), str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
+    store.put(fresh, {"job_id": fresh, "status": "running", "events": [], "updated_at": now.isoformat()})
+    store.put(stale, {"job_id": stale, "status": "running", "events": [],
+                      "updated_at": (now - timedelta(seconds=120)).isoformat()})
+
+    assert json.loads(api({"action": "get_job", "job_id": fresh})["body"])["status"] == "running"
+    body = json.loads(api({"action": "get_job", "job_id": stale})["body"])
+    assert (body["status"], body["error"]) == ("error", "analysis timed out")
+    assert store.get(stale)["status"] == "error"
+
+
+def test_get_job_rejects_invalid_after_and_unknown_ids(handler, api):
+    job_id = str(uuid.uuid4())
+    handler.get_job_store().put(job_id, {"job_id": job_id, "status": "done", "events": []})
+    for after in (-1, "x", 1.5, True):
+        assert api({"action": "get_job", "job_id": job_id, "after": after})["statusCode"] == 400
+    assert api({"action": "get_job", "job_id": job_id, "after": 5})["statusCode"] == 200
+    assert api({"action": "get_job", "job_id": str(uuid.uuid4())})["statusCode"] == 404
+    assert api({"action": "get_job", "job_id": "../etc/passwd"})["statusCode"] == 404
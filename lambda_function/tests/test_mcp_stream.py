@@ -0,0 +1,67 @@
+"""call_mcp_tool_stream（SSEの部分結果の統合と途中切断の検出）のテスト"""
+
+import json
+
+import pytest
+
+
+def progress(count: int, partial: dict) -> dict:
+    return {"jsonrpc": "2.0", "method": "notifications/progress",
+            "params": {"progressToken": "t", "progress": count, "partialResult": partial}}
+
+
+def final(summary: dict) -> dict:
+    return {"jsonrpc": "2.0", "id": 1, "result": {"content": [], "structuredContent": summary}}
+
+
+def sse(*messages) -> bytes:
+    return "".join(f"event: message\ndata: {json.dumps(m, ensure_ascii=False)}\n\n" for m in messages).encode("utf-8")
+
+
+@pytest.fixture
+def mcp_stream(handler, monkeypatch):
+    """AgentCore の応答を指定のバイト列（細かいチャンクに分割）に差し替える"""
+    def install(body: bytes, content_type: str = "text/event-stream", chunk_size: int = 7):
+        chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+        monkeypatch.setattr(handler, "_invoke_mcp_response",
+                            lambda payload, session_ids: {"response": iter(chunks), "contentType": content_type})
+    return install
+
+
+PARTIALS = [
+    {"prices": {"m5.large": {"hourly_price_usd": 0.124}}},
+    {"recommendations": [{"name": "web-1", "reason": "変更推奨"}]},
+    {"recommendations": [{"name": "web-2", "reason": "過剰（更に削減余地あり）"}]},
+]
+
+
+def test_partials_are_merged_when_the_stream_completes(handler, mcp_stream):
+    mcp_stream(sse(*(progress(i + 1, p) for i, p in enumerate(PARTIALS)), final({"streamed": True, "partials": 3})))
+    result = handler.call_mcp_tool_stream("analyze_inventory", {"instances": []})
+    assert result == {
+        "prices": {"m5.large": {"hourly_price_usd": 0.124}},
+        "recommendations": [{"name": "web-1", "reason": "変更推奨"}, {"name": "web-2", "reason": "過剰（更に削減余地あり）"}],
+    }
+
+
+def test_stream_without_final_response_is_an_error(handler, mcp_stream):
+    mcp_stream(sse(*(progress(i + 1, p) for i, p in enumerate(PARTIALS))))
+    result = handler.call_mcp_tool_stream("analyze_inventory", {"instances": []})
+    assert "error" in result
+    assert "recommendations" not in result
+
+
+def test_missing_partial_is_an_error(handler, mcp_stream):
+    mcp_stream(sse(progress(1, PARTIALS[0]), progress(3, PARTIALS[2]), final({"streamed": True, "partials": 3})))
+    result = handler.call_mcp_tool_stream("analyze_inventory", {"instances": []})
+    assert result == {"error": "Incomplete stream: received 2 of 3 partial results"}
+
+
+def test_tool_error_in_final_response_is_returned(handler, mcp_stream):
+    mcp_stream(sse(progress(1, PARTIALS[0]), final({"error": "Internal error: boom"})))
+    assert handler.call_mcp_tool_stream("analyze_inventory", {"instances": []}) == {"error": "Internal error: boom"}
+
+
+def test_plain_json_response_is_accepted(handler, mcp_stream):
+    mcp_stream(json.dumps(final({"recommendations": []})).encode("utf-8"), content_type="application/json")
+    assert handler.call_mcp_tool_stream("get_batch_recommendations", {"instances": []}) == {"recommendations": []}
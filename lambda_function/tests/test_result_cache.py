@@ -0,0 +1,60 @@
+"""分析結果キャッシュ（アカウント・リージョン・オプション毎）のテスト"""
+
+import json
+
+
+def test_cache_key_depends_on_account_and_options(handler, monkeypatch):
+    monkeypatch.setattr(handler, "_role_account_id", "111111111111")
+    key = handler.analysis_cache_key()
+    assert key == handler.analysis_cache_key()
+
+    monkeypatch.setattr(handler, "_role_account_id", "222222222222")
+    assert handler.analysis_cache_key() != key
+
+    monkeypatch.setattr(handler, "_role_account_id", "111111111111")
+    monkeypatch.setattr(handler, "PRICING_ENGINE", "local")
+    assert handler.analysis_cache_key() != key
+
+
+def test_cache_key_is_none_when_account_lookup_fails(handler, monkeypatch):
+    def fail(credentials=None):
+        raise RuntimeError("ExpiredToken")
+
+    monkeypatch.setattr(handler, "get_account_id", fail)
+    assert handler.analysis_cache_key({"accessKeyId": "x"}) is None
+    assert handler.get_cached_analysis(None) is None
+
+
+def test_second_analysis_is_served_from_cache(handler, pipeline):
+    first = handler.run_analysis()
+    second = handler.run_analysis()
+    assert pipeline["runs"] == 1
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert second["analysis"] == first["analysis"]
+    assert second["analyzed_at"] == first["analyzed_at"]
+
+
+def test_force_refresh_reanalyzes_and_updates_cache(handler, pipeline):
+    handler.run_analysis()
+    refreshed = handler.run_analysis(force_refresh=True)
+    assert pipeline["runs"] == 2
+    assert refreshed["cached"] is False
+    assert handler.run_analysis()["analysis"] == "analysis #2"
+
+
+def test_disabled_cache_always_reanalyzes(handler, pipeline, monkeypatch):
+    monkeypatch.setattr(handler, "RESULT_CACHE_TTL", 0)
+    handler.run_analysis()
+    assert handler.run_analysis()["cached"] is False
+    assert pipeline["runs"] == 2
+
+
+def test_cached_submit_returns_completed_job(handler, pipeline, api):
+    handler.run_analysis()
+    response = api({"action": "submit_analysis", "profile": "dev"})
+    assert response["statusCode"] == 200
+    job = json.loads(response["body"])
+    assert (job["status"], job["cached"]) == ("done", True)
+    assert job["result"]["profile"] == "dev"
+    assert [event["type"] for event in job["events"]][-2:] == ["pricing", "analysis"]
+    assert pipeline["runs"] == 1
@@ -3,9 +3,18 @@ AWS Pricing MCP Server - Lightweight
 AgentCore用 - 純粋JSON-RPC（起動高速化版）
 """
 
+import atexit
+import bisect
+import gzip
 import json
+import os
+import signal
 import sys
-from functools import lru_cache
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from functools import wraps
 
 # 起動高速化: boto3は遅延インポート
 _boto3 = None
@@ -17,24 +26,234 @@ def get_boto3():
         _boto3 = boto3
     return _boto3
 
+# NumPyは任意依存（ベクトル化エンジン用）: 未インストールならNone
+_numpy = None
+
+def get_numpy():
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
 # 標準ライブラリのみ使用（最速起動のため）
 
+# リージョンコード → Pricing API の location 値（商用リージョン）
+# REGION_LOCATIONS_FILE（JSON: {"region": "location"}）で追加・上書き可能
+# 表にないリージョンは botocore のリージョン説明から導出する
 REGION_MAPPING = {
-    "ap-northeast-1": "Asia Pacific (Tokyo)",
-    "ap-northeast-2": "Asia Pacific (Seoul)",
     "us-east-1": "US East (N. Virginia)",
+    "us-east-2": "US East (Ohio)",
+    "us-west-1": "US West (N. California)",
     "us-west-2": "US West (Oregon)",
-    "eu-west-1": "Europe (Ireland)",
+    "ca-central-1": "Canada (Central)",
+    "ca-west-1": "Canada West (Calgary)",
+    "mx-central-1": "Mexico (Central)",
+    "sa-east-1": "South America (Sao Paulo)",
+    "eu-central-1": "EU (Frankfurt)",
+    "eu-central-2": "EU (Zurich)",
+    "eu-west-1": "EU (Ireland)",
+    "eu-west-2": "EU (London)",
+    "eu-west-3": "EU (Paris)",
+    "eu-south-1": "EU (Milan)",
+    "eu-south-2": "EU (Spain)",
+    "eu-north-1": "EU (Stockholm)",
+    "il-central-1": "Israel (Tel Aviv)",
+    "me-south-1": "Middle East (Bahrain)",
+    "me-central-1": "Middle East (UAE)",
+    "af-south-1": "Africa (Cape Town)",
+    "ap-east-1": "Asia Pacific (Hong Kong)",
+    "ap-east-2": "Asia Pacific (Taipei)",
+    "ap-south-1": "Asia Pacific (Mumbai)",
+    "ap-south-2": "Asia Pacific (Hyderabad)",
+    "ap-southeast-1": "Asia Pacific (Singapore)",
+    "ap-southeast-2": "Asia Pacific (Sydney)",
+    "ap-southeast-3": "Asia Pacific (Jakarta)",
+    "ap-southeast-4": "Asia Pacific (Melbourne)",
+    "ap-southeast-5": "Asia Pacific (Malaysia)",
+    "ap-southeast-6": "Asia Pacific (New Zealand)",
+    "ap-southeast-7": "Asia Pacific (Thailand)",
+    "ap-northeast-1": "Asia Pacific (Tokyo)",
+    "ap-northeast-2": "Asia Pacific (Seoul)",
+    "ap-northeast-3": "Asia Pacific (Osaka)",
+}
+REGION_LOCATIONS_FILE = os.environ.get("REGION_LOCATIONS_FILE", "")
+
+_region_locations = None
+_region_locations_lock = threading.Lock()
+
+
+def _load_region_locations() -> dict:
+    """組み込み表 + REGION_LOCATIONS_FILE の上書きを読み込む"""
+    locations = dict(REGION_MAPPING)
+    if REGION_LOCATIONS_FILE:
+        try:
+            with open(REGION_LOCATIONS_FILE, encoding="utf-8") as f:
+                locations.update(json.load(f))
+        except Exception as e:
+            print(f"[Region] Failed to load {REGION_LOCATIONS_FILE}: {e}", file=sys.stderr)
+    return locations
+
+
+def _botocore_region_location(region: str) -> str | None:
+    """botocore のエンドポイント定義からリージョン説明を取得（Pricing API の表記に合わせる）"""
+    try:
+        from botocore.loaders import create_loader
+        for partition in create_loader().load_data("endpoints").get("partitions", []):
+            description = partition.get("regions", {}).get(region, {}).get("description")
+            if description:
+                # botocore は "Europe (Ireland)"、Pricing API は "EU (Ireland)"
+                return description.replace("Europe (", "EU (")
+    except Exception as e:
+        print(f"[Region] botocore lookup failed for {region}: {e}", file=sys.stderr)
+    return None
+
+
+def get_region_location(region: str) -> str | None:
+    """リージョンコードを Pricing API の location 値に変換（不明ならNone）"""
+    global _region_locations
+    if _region_locations is None:
+        with _region_locations_lock:
+            if _region_locations is None:
+                _region_locations = _load_region_locations()
+    location = _region_locations.get(region)
+    if location is None:
+        location = _botocore_region_location(region)
+        if location is None:
+            print(f"[Region] Unknown region: {region}", file=sys.stderr)
+            return None
+        with _region_locations_lock:
+            _region_locations[region] = location
+    return location
+
+# サイズ順序（小さい順、metalは同ファミリー最大サイズ以上）
+SIZE_ORDER = [
+    'nano', 'micro', 'small', 'medium', 'large', 'xlarge', '2xlarge', '3xlarge', '4xlarge',
+    '6xlarge', '8xlarge', '9xlarge', '12xlarge', '16xlarge', '18xlarge', '24xlarge',
+    '32xlarge', '48xlarge', 'metal'
+]
+SIZE_INDEX = {size: i for i, size in enumerate(SIZE_ORDER)}
+
+# ---- インスタンス性能テーブル（vCPU / メモリ / バースト可否） ----
+# 同梱データ: T系は全サイズ、その他は「サイズ→vCPU」規則 + metalの実vCPU
+# EC2は describe_instance_types の結果で上書きされる（list_instance_types 参照）
+
+# T系（バースト可能）: size -> (vCPU, メモリGiB, vCPUあたりベースライン%)
+_T3_CLASS = {
+    'nano': (2, 0.5, 5), 'micro': (2, 1, 10), 'small': (2, 2, 20), 'medium': (2, 4, 20),
+    'large': (2, 8, 30), 'xlarge': (4, 16, 40), '2xlarge': (8, 32, 40),
+}
+BURSTABLE_CAPABILITIES = {
+    't3': _T3_CLASS,
+    't3a': _T3_CLASS,
+    't4g': _T3_CLASS,
+    't2': {
+        'nano': (1, 0.5, 5), 'micro': (1, 1, 10), 'small': (1, 2, 20), 'medium': (2, 4, 20),
+        'large': (2, 8, 30), 'xlarge': (4, 16, 22.5), '2xlarge': (8, 32, 17),
+    },
+}
+
+# 非バースト系のサイズ別vCPU（medium以上）
+SIZE_VCPUS = {
+    'medium': 1, 'large': 2, 'xlarge': 4, '2xlarge': 8, '3xlarge': 12, '4xlarge': 16,
+    '6xlarge': 24, '8xlarge': 32, '9xlarge': 36, '12xlarge': 48, '16xlarge': 64,
+    '18xlarge': 72, '24xlarge': 96, '32xlarge': 128, '48xlarge': 192,
 }
 
-# サイズ順序（小さい順）
-SIZE_ORDER = ['nano', 'micro', 'small', 'medium', 'large', 'xlarge', '2xlarge', '4xlarge', '8xlarge', '12xlarge', '16xlarge', '24xlarge']
-SIZE_MULTIPLIERS = {
-    'nano': 0.25, 'micro': 0.5, 'small': 1, 'medium': 2, 'large': 4, 
-    'xlarge': 8, '2xlarge': 16, '4xlarge': 32, '8xlarge': 64, 
-    '12xlarge': 96, '16xlarge': 128, '24xlarge': 192
+# metal の実vCPU（ファミリー毎に異なる）
+METAL_VCPUS = {
+    'c5': 96, 'c5d': 96, 'c5n': 72, 'c6g': 64, 'c6gd': 64, 'c6i': 128, 'c6id': 128, 'c6a': 192,
+    'c7g': 64, 'c7gd': 64, 'c7i': 192, 'c7a': 192,
+    'm5': 96, 'm5d': 96, 'm5zn': 48, 'm6g': 64, 'm6gd': 64, 'm6i': 128, 'm6id': 128, 'm6a': 192,
+    'm7g': 64, 'm7gd': 64, 'm7i': 192, 'm7a': 192,
+    'r5': 96, 'r5d': 96, 'r5b': 96, 'r6g': 64, 'r6gd': 64, 'r6i': 128, 'r6id': 128, 'r6a': 192,
+    'r7g': 64, 'r7gd': 64, 'r7i': 192, 'r7a': 192,
+    'i3': 72, 'i3en': 96, 'i4i': 128, 'x2iezn': 48, 'z1d': 48,
 }
 
+# ファミリー先頭文字ごとの vCPUあたりメモリ（GiB）
+MEMORY_PER_VCPU = {'c': 2, 'm': 4, 'r': 8, 'x': 16, 'z': 8, 'i': 8, 'd': 8, 'a': 2}
+
+# 実データ（describe_instance_types 等で登録）: instance_type -> capability dict
+# 同梱テーブルからの推定は都度計算し、クライアント入力の任意の文字列でこの表が増えないようにする
+_capabilities = {}
+_capabilities_lock = threading.Lock()
+
+
+def _builtin_capability(instance_type: str) -> dict | None:
+    """同梱テーブルから性能情報を推定（db./cache. は同名EC2ファミリーとみなす）"""
+    family, size = parse_instance_type(instance_type)
+    base_family = family.split('.')[-1]
+    
+    if base_family in BURSTABLE_CAPABILITIES:
+        spec = BURSTABLE_CAPABILITIES[base_family].get(size)
+        if not spec:
+            return None
+        vcpus, memory_gib, baseline = spec
+        return {"vcpus": vcpus, "memory_gib": memory_gib, "burstable": True, "baseline_percent": baseline}
+    
+    if size == 'metal':
+        vcpus = METAL_VCPUS.get(base_family)
+    else:
+        vcpus = SIZE_VCPUS.get(size)
+    if not vcpus:
+        return None
+    memory_per_vcpu = MEMORY_PER_VCPU.get(base_family[:1])
+    return {
+        "vcpus": vcpus,
+        "memory_gib": vcpus * memory_per_vcpu if memory_per_vcpu else None,
+        "burstable": False,
+        "baseline_percent": None,
+    }
+
+
+def register_instance_capability(instance_type: str, vcpus: int, memory_gib: float, burstable: bool):
+    """describe_instance_types 等で得た実データを登録（同梱テーブルより優先）"""
+    baseline = None
+    if burstable:
+        builtin = _builtin_capability(instance_type)
+        baseline = builtin["baseline_percent"] if builtin else None
+    with _capabilities_lock:
+        _capabilities[instance_type] = {
+            "vcpus": vcpus, "memory_gib": memory_gib, "burstable": burstable, "baseline_percent": baseline
+        }
+
+
+def get_instance_capability(instance_type: str) -> dict | None:
+    """インスタンスの性能情報（vcpus, memory_gib, burstable, baseline_percent）を取得"""
+    capability = _capabilities.get(instance_type)
+    if capability is not None:
+        return capability
+    return _builtin_capability(instance_type)
+
+
+def get_vcpus(instance_type: str) -> float | None:
+    """
+    予測CPU計算用のvCPU数
+    CloudWatch の CPU使用率は全vCPUに対する割合のため、バースト可能タイプも実vCPU数で比較する
+    （ベースラインは exceeds_credit_baseline で別途確認）
+    """
+    capability = get_instance_capability(instance_type)
+    if not capability:
+        return None
+    return capability["vcpus"]
+
+
+def exceeds_credit_baseline(instance_type: str, predicted_cpu: float) -> bool:
+    """
+    バースト可能タイプのCPUクレジット制約
+    予測CPUがベースライン（vCPUあたりの継続性能）を超える候補はクレジットを消費し続けるため提案しない
+    非バースト系・ベースライン不明は False
+    """
+    capability = get_instance_capability(instance_type)
+    if not capability or not capability["burstable"] or not capability["baseline_percent"]:
+        return False
+    return predicted_cpu > capability["baseline_percent"]
+
+
 def get_family_min_size_simple(family: str, service: str = "ec2") -> str:
     """
     ファミリーの最小サイズを判定（シンプルルール）
@@ -62,14 +281,619 @@ def get_family_min_size_simple(family: str, service: str = "ec2") -> str:
     return 'large'
 
 
+# 価格キャッシュ設定
+# - 正の結果: PRICE_CACHE_TTL 秒保持（価格改定を拾うため定期的に再取得）
+# - 負の結果（該当SKUなし）: PRICE_CACHE_NEGATIVE_TTL 秒だけ保持
+# - 例外（スロットリング等）: キャッシュしない
+PRICE_CACHE_TTL = float(os.environ.get("PRICE_CACHE_TTL", "86400"))
+PRICE_CACHE_NEGATIVE_TTL = float(os.environ.get("PRICE_CACHE_NEGATIVE_TTL", "300"))
+PRICE_CACHE_MAXSIZE = int(os.environ.get("PRICE_CACHE_MAXSIZE", "4096"))
+# 空文字ならディスク層は無効
+PRICE_CACHE_FILE = os.environ.get("PRICE_CACHE_FILE", "")
+# ディスク層への書き出し間隔（秒）: 変更があった場合のみ、まとめて書き出す（終了時にも書き出す）
+PRICE_CACHE_FLUSH_INTERVAL = float(os.environ.get("PRICE_CACHE_FLUSH_INTERVAL", "30"))
+
+
+class PriceCache:
+    """TTL付き価格キャッシュ（メモリ + 任意のディスク層）"""
+
+    def __init__(self, ttl: float, negative_ttl: float, maxsize: int, path: str = "",
+                 flush_interval: float = PRICE_CACHE_FLUSH_INTERVAL):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.maxsize = maxsize
+        self.path = path
+        self.flush_interval = flush_interval
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._disk_loaded = False
+        self._dirty = False
+        self._flush_lock = threading.Lock()  # 書き出し同士の直列化（キャッシュのロックとは別）
+        self._flusher = None
+        if path:
+            atexit.register(self.flush)
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.stale_hits = 0
+
+    @staticmethod
+    def _disk_key(key: tuple) -> str:
+        return "|".join(key)
+
+    def _load_disk(self):
+        """ディスク層を初回アクセス時に読み込む（ロック取得済みで呼ぶ）"""
+        self._disk_loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            now = time.time()
+            for disk_key, (value, expires_at) in data.items():
+                if expires_at > now:
+                    self._entries[tuple(disk_key.split("|"))] = (value, expires_at)
+            print(f"[PriceCache] Loaded {len(self._entries)} entries from {self.path}", file=sys.stderr)
+        except Exception as e:
+            print(f"[PriceCache] Failed to load {self.path}: {e}", file=sys.stderr)
+
+    def flush(self):
+        """
+        変更があれば正の結果をディスクに書き出す
+        ロック内ではスナップショットの作成のみ行い、ファイル書き込みはロック外で行う
+        """
+        if not self.path:
+            return
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = {
+                    self._disk_key(key): [value, expires_at]
+                    for key, (value, expires_at) in self._entries.items()
+                    if value is not None
+                }
+                self._dirty = False
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"[PriceCache] Failed to save {self.path}: {e}", file=sys.stderr)
+                with self._lock:
+                    self._dirty = True
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _mark_dirty(self):
+        """ディスク層への書き出しを予約（ロック取得済みで呼ぶ、書き出しスレッドは初回に起動）"""
+        self._dirty = True
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="price-cache-flush", daemon=True)
+            self._flusher.start()
+
+    def get(self, key: tuple) -> tuple:
+        """(hit, value) を返す。期限切れはミス扱い"""
+        with self._lock:
+            if not self._disk_loaded:
+                self._load_disk()
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                if entry[0] is None:
+                    self.negative_hits += 1
+                return True, entry[0]
+            # 期限切れのエントリはAPI障害時のフォールバック用に残す（maxsizeで追い出される）
+            self.misses += 1
+            return False, None
+
+    def get_stale(self, key: tuple) -> float | None:
+        """期限切れを含めて保持している価格を返す（API障害時のフォールバック用）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] is None:
+                return None
+            self.stale_hits += 1
+            return entry[0]
+
+    def set(self, key: tuple, value: float | None):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            if self.path and value is not None:
+                self._mark_dirty()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.negative_hits = self.stale_hits = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "negative_hits": self.negative_hits,
+                "stale_hits": self.stale_hits,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "disk_path": self.path or None,
+            }
+
+
+_price_cache = PriceCache(PRICE_CACHE_TTL, PRICE_CACHE_NEGATIVE_TTL, PRICE_CACHE_MAXSIZE, PRICE_CACHE_FILE)
+
+
+class SingleFlight:
+    """同一キーの同時呼び出しを1回にまとめ、後続の呼び出し元はその結果を待って共有する"""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.value = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+        try:
+            call.value = fn()
+            return call.value
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+_price_flight = SingleFlight()
+
+# API障害時の最終フォールバック価格（"service|instance_type|region": 価格）
+# PRICE_CACHE_FILE で書き出したファイルもそのまま指定できる（有効期限は無視）
+PRICE_SNAPSHOT_FILE = os.environ.get("PRICE_SNAPSHOT_FILE", "")
+
+
+class PriceSnapshot:
+    """読み取り専用の価格スナップショット（初回参照時に読み込む）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._prices = None
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def _load(self) -> dict:
+        prices = {}
+        if not self.path or not os.path.exists(self.path):
+            return prices
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            for disk_key, value in data.items():
+                # ディスクキャッシュ形式 [価格, 有効期限] も受け付ける
+                price = value[0] if isinstance(value, list) else value
+                if price is not None:
+                    prices[tuple(disk_key.split("|"))] = float(price)
+            print(f"[PriceSnapshot] Loaded {len(prices)} prices from {self.path}", file=sys.stderr)
+        except Exception as e:
+            print(f"[PriceSnapshot] Failed to load {self.path}: {e}", file=sys.stderr)
+        return prices
+
+    def get(self, key: tuple) -> float | None:
+        with self._lock:
+            if self._prices is None:
+                self._prices = self._load()
+            price = self._prices.get(key)
+            if price is not None:
+                self.hits += 1
+            return price
+
+
+_price_snapshot = PriceSnapshot(PRICE_SNAPSHOT_FILE)
+
+
+def cached_price(service: str):
+    """
+    get_*_price 用デコレータ（lru_cacheの置き換え）
+    デコレート対象は「該当なし=None」「API失敗=例外」で返すこと
+    同じキーの同時ミスは1回のAPI呼び出しにまとめる（single-flight）
+    API失敗時は期限切れキャッシュ・スナップショットの価格で代替する
+    """
+    def decorator(fetch):
+        @wraps(fetch)
+        def wrapper(instance_type: str, region: str) -> float | None:
+            key = (service, instance_type, region)
+            hit, value = _price_cache.get(key)
+            if hit:
+                return value
+            
+            def load():
+                value = fetch(instance_type, region)
+                _price_cache.set(key, value)
+                return value
+            
+            try:
+                return _price_flight.do(key, load)
+            except Exception as e:
+                # 一時的な失敗はキャッシュせず、次回再取得させる
+                # 期限切れキャッシュ → スナップショットの順にフォールバック
+                fallback = _price_cache.get_stale(key)
+                source = "stale cache"
+                if fallback is None:
+                    fallback = _price_snapshot.get(key)
+                    source = "snapshot"
+                if fallback is not None:
+                    print(f"Error getting {service} price for {instance_type}: {e} (using {source}: ${fallback}/hr)", file=sys.stderr)
+                    return fallback
+                print(f"Error getting {service} price for {instance_type}: {e}", file=sys.stderr)
+                return None
+        wrapper.cache_clear = _price_cache.clear
+        return wrapper
+    return decorator
+
+
+def get_price_cache_stats() -> dict:
+    """価格キャッシュの統計を取得（coalesced: 実行中の同一取得に相乗りした回数）"""
+    stats = _price_cache.stats()
+    stats["coalesced"] = _price_flight.coalesced
+    stats["snapshot_hits"] = _price_snapshot.hits
+    return stats
+
+
+# 運用メトリクス（GET /metrics で公開）
+METRICS_LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+_started_at = time.time()
+
+
+class LatencyHistogram:
+    """固定バケットのレイテンシヒストグラム（ms）"""
+
+    def __init__(self, buckets: tuple = METRICS_LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # 最後は上限なし
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, elapsed_ms: float, error: bool = False):
+        idx = bisect.bisect_left(self.buckets, elapsed_ms)
+        with self._lock:
+            self._counts[idx] += 1
+            self.calls += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            if error:
+                self.errors += 1
+
+    def percentile(self, q: float) -> float | None:
+        """q分位点の概算（該当バケットの上限。最大値を超えない）"""
+        with self._lock:
+            if not self.calls:
+                return None
+            rank = q * self.calls
+            seen = 0
+            for idx, count in enumerate(self._counts):
+                seen += count
+                if seen >= rank and count:
+                    bound = self.buckets[idx] if idx < len(self.buckets) else self.max_ms
+                    return min(bound, self.max_ms)
+            return self.max_ms
+
+    def snapshot(self) -> dict:
+        p50, p95, p99 = (self.percentile(q) for q in (0.5, 0.95, 0.99))
+        with self._lock:
+            buckets = {f"le_{bound}": count for bound, count in zip(self.buckets, self._counts)}
+            buckets["le_inf"] = self._counts[-1]
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "avg_ms": round(self.total_ms / self.calls, 1) if self.calls else None,
+                "max_ms": round(self.max_ms, 1),
+                "p50_ms": round(p50, 1) if p50 is not None else None,
+                "p95_ms": round(p95, 1) if p95 is not None else None,
+                "p99_ms": round(p99, 1) if p99 is not None else None,
+                "buckets_ms": buckets,
+            }
+
+
+class MetricsRegistry:
+    """名前毎のレイテンシヒストグラム"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def observe(self, name: str, elapsed_ms: float, error: bool = False):
+        self.histogram(name).observe(elapsed_ms, error)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            items = list(self._histograms.items())
+        return {name: histogram.snapshot() for name, histogram in sorted(items)}
+
+
+# Pricing APIクライアント設定（プロセス全体で1つを共有）
+PRICING_MAX_POOL_CONNECTIONS = int(os.environ.get("PRICING_MAX_POOL_CONNECTIONS", "32"))
+PRICING_RETRY_MODE = os.environ.get("PRICING_RETRY_MODE", "adaptive")
+PRICING_MAX_ATTEMPTS = int(os.environ.get("PRICING_MAX_ATTEMPTS", "4"))
+PRICING_CONNECT_TIMEOUT = float(os.environ.get("PRICING_CONNECT_TIMEOUT", "3"))
+PRICING_READ_TIMEOUT = float(os.environ.get("PRICING_READ_TIMEOUT", "10"))
+
+_pricing_client = None
+_pricing_client_lock = threading.Lock()
+
+# get_products 呼び出しのレイテンシ計測（全体 + ServiceCode毎）
+_pricing_latency = LatencyHistogram()
+_pricing_metrics = MetricsRegistry()
+
+
 def get_pricing_client():
-    """Pricing APIクライアントを取得"""
+    """Pricing APIクライアントを取得（初回のみ生成、以降は再利用）"""
+    global _pricing_client
+    if _pricing_client is not None:
+        return _pricing_client
+    with _pricing_client_lock:
+        if _pricing_client is None:
+            try:
+                from botocore.config import Config
+                config = Config(
+                    max_pool_connections=PRICING_MAX_POOL_CONNECTIONS,
+                    retries={"mode": PRICING_RETRY_MODE, "max_attempts": PRICING_MAX_ATTEMPTS},
+                    tcp_keepalive=True,
+                    connect_timeout=PRICING_CONNECT_TIMEOUT,
+                    read_timeout=PRICING_READ_TIMEOUT,
+                )
+                _pricing_client = get_boto3().client("pricing", region_name="us-east-1", config=config)
+            except Exception as e:
+                print(f"[ERROR] Failed to create pricing client: {e}", file=sys.stderr)
+                raise
+    return _pricing_client
+
+
+# ヘッジ: 応答がこの時間を超えたら同じリクエストをもう1本投げ、先に成功した方を使う
+# "p95"（既定）: 直近 PRICING_HEDGE_WINDOW 件のAPI実行時間のp95（PRICING_HEDGE_MIN_SAMPLES件以上計測後）
+# 数値: 固定ms / "off": 無効
+PRICING_HEDGE_DELAY_MS = os.environ.get("PRICING_HEDGE_DELAY_MS", "p95")
+PRICING_HEDGE_MIN_DELAY_MS = float(os.environ.get("PRICING_HEDGE_MIN_DELAY_MS", "50"))
+PRICING_HEDGE_MIN_SAMPLES = int(os.environ.get("PRICING_HEDGE_MIN_SAMPLES", "20"))
+PRICING_HEDGE_WINDOW = int(os.environ.get("PRICING_HEDGE_WINDOW", "200"))
+
+# サーキットブレーカー: 直近 WINDOW 件のエラー率が ERROR_RATE 以上で遮断し、COOLDOWN 秒後に1件だけ試行
+PRICING_BREAKER_WINDOW = int(os.environ.get("PRICING_BREAKER_WINDOW", "20"))
+PRICING_BREAKER_MIN_CALLS = int(os.environ.get("PRICING_BREAKER_MIN_CALLS", "10"))
+PRICING_BREAKER_ERROR_RATE = float(os.environ.get("PRICING_BREAKER_ERROR_RATE", "0.5"))
+PRICING_BREAKER_COOLDOWN = float(os.environ.get("PRICING_BREAKER_COOLDOWN", "30"))
+
+
+class CircuitOpenError(Exception):
+    """サーキットブレーカー遮断中（APIを呼ばずに即失敗）"""
+
+
+class CircuitBreaker:
+    """エラー率ベースのサーキットブレーカー（closed → open → half_open → closed）"""
+
+    def __init__(self, name: str, window: int, min_calls: int, error_rate: float, cooldown: float):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self._outcomes = deque(maxlen=window)  # True=成功
+        self._lock = threading.Lock()
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.state = "closed"
+        self.opened = 0
+        self.rejected = 0
+
+    def before_call(self):
+        """呼び出し可否を判定（遮断中は CircuitOpenError）"""
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open" and time.time() - self._opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f"{self.name} circuit open")
+
+    def record(self, success: bool):
+        with self._lock:
+            if self.state == "half_open":
+                if success:
+                    self.state = "closed"
+                    self._outcomes.clear()
+                    print(f"[Breaker] {self.name} closed", file=sys.stderr)
+                else:
+                    self._open()
+                return
+            if self.state == "open":
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.error_rate:
+                self._open()
+
+    def _open(self):
+        """遮断状態にする（ロック取得済みで呼ぶ）"""
+        self.state = "open"
+        self._opened_at = time.time()
+        self.opened += 1
+        print(f"[Breaker] {self.name} opened for {self.cooldown}s", file=sys.stderr)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "opened": self.opened, "rejected": self.rejected}
+
+
+_pricing_breaker = CircuitBreaker("pricing", PRICING_BREAKER_WINDOW, PRICING_BREAKER_MIN_CALLS,
+                                  PRICING_BREAKER_ERROR_RATE, PRICING_BREAKER_COOLDOWN)
+
+class LatencyWindow:
+    """直近 size 件のレイテンシ（ms）のスライディングウィンドウ"""
+
+    def __init__(self, size: int):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+    def observe(self, elapsed_ms: float):
+        with self._lock:
+            self._samples.append(elapsed_ms)
+
+    def percentile(self, q: float) -> float | None:
+        """q分位点（ウィンドウ内の実測値）"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+# ヘッジ判定用: get_products 自体の実行時間（スレッドプールの実行待ち・ヘッジ込みの全体時間は含まない）
+_hedge_latency = LatencyWindow(PRICING_HEDGE_WINDOW)
+
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+_hedge_stats = {"hedged": 0, "hedge_wins": 0}
+_hedge_stats_lock = threading.Lock()
+
+
+def get_hedge_executor() -> ThreadPoolExecutor:
+    """ヘッジ実行用スレッドプールを取得（初回のみ生成、接続プールと同じ並列度）"""
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_executor_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(max_workers=PRICING_MAX_POOL_CONNECTIONS,
+                                                     thread_name_prefix="pricing-hedge")
+    return _hedge_executor
+
+
+def get_hedge_delay() -> float | None:
+    """ヘッジまでの待ち時間（秒）。無効・計測不足ならNone"""
+    if PRICING_HEDGE_DELAY_MS == "off":
+        return None
+    if PRICING_HEDGE_DELAY_MS != "p95":
+        return float(PRICING_HEDGE_DELAY_MS) / 1000
+    if len(_hedge_latency) < PRICING_HEDGE_MIN_SAMPLES:
+        return None
+    return max(_hedge_latency.percentile(0.95), PRICING_HEDGE_MIN_DELAY_MS) / 1000
+
+
+def _timed_get_products(kwargs: dict, started: threading.Event = None) -> dict:
+    """get_products を呼び、成功時の実行時間をヘッジ判定用ウィンドウに記録"""
+    if started is not None:
+        started.set()
+    start = time.perf_counter()
+    response = get_pricing_client().get_products(**kwargs)
+    _hedge_latency.observe((time.perf_counter() - start) * 1000)
+    return response
+
+
+def _hedged_get_products(kwargs: dict) -> dict:
+    """get_products を呼び、遅い場合はヘッジ（2本目）を投げて先に成功した結果を返す"""
+    delay = get_hedge_delay()
+    if delay is None:
+        return _timed_get_products(kwargs)
+    
+    executor = get_hedge_executor()
+    started = threading.Event()
+    primary = executor.submit(_timed_get_products, kwargs, started)
+    # ヘッジの待ち時間は1本目の実行開始から数える（プールが飽和して実行待ちの間はヘッジを積まない）
+    started.wait()
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+    
+    with _hedge_stats_lock:
+        _hedge_stats["hedged"] += 1
+    hedge = executor.submit(_timed_get_products, kwargs)
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    with _hedge_stats_lock:
+                        _hedge_stats["hedge_wins"] += 1
+                # 負けた方は完了まで実行されるが結果は捨てる
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def pricing_get_products(**kwargs) -> dict:
+    """get_products をレイテンシ計測・ヘッジ・サーキットブレーカー付きで呼び出す"""
+    _pricing_breaker.before_call()
+    start = time.perf_counter()
+    error = None
     try:
-        client = get_boto3().client("pricing", region_name="us-east-1")
-        return client
+        return _hedged_get_products(kwargs)
     except Exception as e:
-        print(f"[ERROR] Failed to create pricing client: {e}", file=sys.stderr)
+        error = e
         raise
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        _pricing_breaker.record(error is None)
+        _pricing_latency.observe(elapsed_ms, error is not None)
+        _pricing_metrics.observe(kwargs.get('ServiceCode', 'unknown'), elapsed_ms, error is not None)
+        print(f"[Pricing] {kwargs.get('ServiceCode')} get_products {elapsed_ms:.1f}ms"
+              f"{' (error)' if error is not None else ''}", file=sys.stderr)
+
+
+def get_pricing_api_stats() -> dict:
+    """Pricing API 呼び出し統計を取得"""
+    stats = _pricing_latency.snapshot()
+    stats["by_service"] = _pricing_metrics.snapshot()
+    stats["breaker"] = _pricing_breaker.stats()
+    hedge_p95 = _hedge_latency.percentile(0.95)
+    stats["hedge_window_p95_ms"] = round(hedge_p95, 1) if hedge_p95 is not None else None
+    with _hedge_stats_lock:
+        stats.update(_hedge_stats)
+    return stats
 
 
 def parse_instance_type(instance_type: str) -> tuple:
@@ -98,135 +922,243 @@ def get_family_min_size(family: str, region: str = "ap-northeast-1", service: st
     return get_family_min_size_simple(family, service)
 
 
-@lru_cache(maxsize=1000)
+# Pricing APIのサービスコード
+PRICING_SERVICE_CODES = {
+    "ec2": "AmazonEC2",
+    "rds": "AmazonRDS",
+    "docdb": "AmazonDocDB",
+    "elasticache": "AmazonElastiCache",
+}
+
+SIZE_LADDER_TTL = float(os.environ.get("SIZE_LADDER_TTL", str(PRICE_CACHE_TTL)))
+
+
+def list_instance_types(service: str, region: str) -> list:
+    """
+    実在するインスタンスタイプ一覧を取得
+    - EC2: describe_instance_types（リージョン単位で正確）
+    - その他 / EC2失敗時: Pricing API の instanceType 属性値（全リージョン共通）
+    """
+    if service == "ec2":
+        try:
+            ec2 = get_boto3().client("ec2", region_name=region)
+            types = []
+            for page in ec2.get_paginator("describe_instance_types").paginate():
+                for info in page.get("InstanceTypes", []):
+                    types.append(info["InstanceType"])
+                    register_instance_capability(
+                        info["InstanceType"],
+                        info.get("VCpuInfo", {}).get("DefaultVCpus"),
+                        info.get("MemoryInfo", {}).get("SizeInMiB", 0) / 1024,
+                        info.get("BurstablePerformanceSupported", False),
+                    )
+            return types
+        except Exception as e:
+            print(f"[SizeLadder] describe_instance_types failed in {region}, using price data: {e}", file=sys.stderr)
+    
+    pricing = get_pricing_client()
+    types = []
+    kwargs = {"ServiceCode": PRICING_SERVICE_CODES[service], "AttributeName": "instanceType"}
+    while True:
+        response = pricing.get_attribute_values(**kwargs)
+        types.extend(v["Value"] for v in response.get("AttributeValues", []))
+        if not response.get("NextToken"):
+            return types
+        kwargs["NextToken"] = response["NextToken"]
+
+
+class SizeLadderIndex:
+    """(service, region) 毎の「ファミリー → 実在するサイズ」索引"""
+
+    def __init__(self, ttl: float, negative_ttl: float):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._ladders = {}  # (service, region) -> (dict[family, frozenset] | None, expires_at)
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()  # 同じキーの同時構築は1回にまとめる
+
+    def _build(self, service: str, region: str) -> dict | None:
+        try:
+            types = list_instance_types(service, region)
+        except Exception as e:
+            print(f"[SizeLadder] Failed to list {service} types: {e}", file=sys.stderr)
+            return None
+        ladder = {}
+        for instance_type in types:
+            family, size = parse_instance_type(instance_type)
+            if size:
+                ladder.setdefault(family, set()).add(size)
+        print(f"[SizeLadder] {service}/{region}: {len(ladder)} families from {len(types)} types", file=sys.stderr)
+        return {family: frozenset(sizes) for family, sizes in ladder.items()}
+
+    def sizes(self, family: str, service: str, region: str) -> frozenset | None:
+        """実在するサイズ集合を返す。索引が作れない・未知のファミリーはNone（全サイズ探索）"""
+        key = (service, region)
+        with self._lock:
+            entry = self._ladders.get(key)
+        if entry is None or entry[1] <= time.time():
+            # 構築（ページングされたAPI呼び出し）はロック外で行い、他のキーの参照を待たせない
+            entry = self._flight.do(key, lambda: self._refresh(key))
+        ladder = entry[0]
+        if ladder is None:
+            return None
+        return ladder.get(family)
+
+    def _refresh(self, key: tuple) -> tuple:
+        """索引を構築して登録（同じキーの待機中に他スレッドが構築済みならそれを使う）"""
+        with self._lock:
+            entry = self._ladders.get(key)
+        if entry is not None and entry[1] > time.time():
+            return entry
+        service, region = key
+        ladder = self._build(service, region) if service in PRICING_SERVICE_CODES else None
+        ttl = self.ttl if ladder is not None else self.negative_ttl
+        entry = (ladder, time.time() + ttl)
+        with self._lock:
+            self._ladders[key] = entry
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._ladders.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                f"{service}/{region}": len(ladder) if ladder is not None else None
+                for (service, region), (ladder, _) in self._ladders.items()
+            }
+
+
+_size_ladder_index = SizeLadderIndex(SIZE_LADDER_TTL, PRICE_CACHE_NEGATIVE_TTL)
+
+
+def get_available_sizes(family: str, service: str = "ec2", region: str = "ap-northeast-1") -> frozenset | None:
+    """ファミリーで実在するサイズ集合を取得（不明ならNone）"""
+    return _size_ladder_index.sizes(family, service, region)
+
+
+@cached_price("ec2")
 def get_ec2_price(instance_type: str, region: str) -> float | None:
     """EC2インスタンスの時間単価を取得（USD）"""
-    try:
-        pricing = get_pricing_client()
-        location = REGION_MAPPING.get(region, "Asia Pacific (Tokyo)")
-        response = pricing.get_products(
-            ServiceCode="AmazonEC2",
-            Filters=[
-                {"Type": "TERM_MATCH", "Field": "instanceType", "Value": instance_type},
-                {"Type": "TERM_MATCH", "Field": "location", "Value": location},
-                {"Type": "TERM_MATCH", "Field": "operatingSystem", "Value": "Linux"},
-                {"Type": "TERM_MATCH", "Field": "tenancy", "Value": "Shared"},
-                {"Type": "TERM_MATCH", "Field": "preInstalledSw", "Value": "NA"},
-                {"Type": "TERM_MATCH", "Field": "capacitystatus", "Value": "Used"},
-            ],
-            MaxResults=1
-        )
-        
-        if response["PriceList"]:
-            price_data = json.loads(response["PriceList"][0])
-            on_demand = price_data["terms"]["OnDemand"]
-            for term in on_demand.values():
-                for price_dimension in term["priceDimensions"].values():
-                    price = float(price_dimension["pricePerUnit"]["USD"])
-                    if price > 0:
-                        return price
-    except Exception as e:
-        print(f"Error getting EC2 price: {e}", file=sys.stderr)
+    location = get_region_location(region)
+    if location is None:
+        return None
+    response = pricing_get_products(
+        ServiceCode="AmazonEC2",
+        Filters=[
+            {"Type": "TERM_MATCH", "Field": "instanceType", "Value": instance_type},
+            {"Type": "TERM_MATCH", "Field": "location", "Value": location},
+            {"Type": "TERM_MATCH", "Field": "operatingSystem", "Value": "Linux"},
+            {"Type": "TERM_MATCH", "Field": "tenancy", "Value": "Shared"},
+            {"Type": "TERM_MATCH", "Field": "preInstalledSw", "Value": "NA"},
+            {"Type": "TERM_MATCH", "Field": "capacitystatus", "Value": "Used"},
+        ],
+        MaxResults=1
+    )
+    
+    if response["PriceList"]:
+        price_data = json.loads(response["PriceList"][0])
+        on_demand = price_data["terms"]["OnDemand"]
+        for term in on_demand.values():
+            for price_dimension in term["priceDimensions"].values():
+                price = float(price_dimension["pricePerUnit"]["USD"])
+                if price > 0:
+                    return price
     
     return None
 
 
-@lru_cache(maxsize=1000)
+@cached_price("rds")
 def get_rds_price(instance_type: str, region: str) -> float | None:
     """RDSインスタンスの時間単価を取得（USD）"""
-    try:
-        pricing = get_pricing_client()
-        location = REGION_MAPPING.get(region, "Asia Pacific (Tokyo)")
-        response = pricing.get_products(
-            ServiceCode="AmazonRDS",
-            Filters=[
-                {"Type": "TERM_MATCH", "Field": "instanceType", "Value": instance_type},
-                {"Type": "TERM_MATCH", "Field": "location", "Value": location},
-                {"Type": "TERM_MATCH", "Field": "databaseEngine", "Value": "Aurora MySQL"},
-                {"Type": "TERM_MATCH", "Field": "deploymentOption", "Value": "Single-AZ"},
-            ],
-            MaxResults=5
-        )
-        
-        if response["PriceList"]:
-            for price_item in response["PriceList"]:
-                price_data = json.loads(price_item)
-                on_demand = price_data.get("terms", {}).get("OnDemand", {})
-                for term in on_demand.values():
-                    for price_dimension in term.get("priceDimensions", {}).values():
-                        price = float(price_dimension.get("pricePerUnit", {}).get("USD", 0))
-                        if price > 0:
-                            return price
-    except Exception as e:
-        print(f"Error getting RDS price: {e}", file=sys.stderr)
+    location = get_region_location(region)
+    if location is None:
+        return None
+    response = pricing_get_products(
+        ServiceCode="AmazonRDS",
+        Filters=[
+            {"Type": "TERM_MATCH", "Field": "instanceType", "Value": instance_type},
+            {"Type": "TERM_MATCH", "Field": "location", "Value": location},
+            {"Type": "TERM_MATCH", "Field": "databaseEngine", "Value": "Aurora MySQL"},
+            {"Type": "TERM_MATCH", "Field": "deploymentOption", "Value": "Single-AZ"},
+        ],
+        MaxResults=5
+    )
+    
+    if response["PriceList"]:
+        for price_item in response["PriceList"]:
+            price_data = json.loads(price_item)
+            on_demand = price_data.get("terms", {}).get("OnDemand", {})
+            for term in on_demand.values():
+                for price_dimension in term.get("priceDimensions", {}).values():
+                    price = float(price_dimension.get("pricePerUnit", {}).get("USD", 0))
+                    if price > 0:
+                        return price
     
     return None
 
 
-@lru_cache(maxsize=1000)
+@cached_price("elasticache")
 def get_elasticache_price(instance_type: str, region: str) -> float | None:
     """ElastiCacheインスタンスの時間単価を取得（USD）"""
-    try:
-        pricing = get_pricing_client()
-        location = REGION_MAPPING.get(region, "Asia Pacific (Tokyo)")
-        response = pricing.get_products(
-            ServiceCode="AmazonElastiCache",
-            Filters=[
-                {"Type": "TERM_MATCH", "Field": "instanceType", "Value": instance_type},
-                {"Type": "TERM_MATCH", "Field": "location", "Value": location},
-                {"Type": "TERM_MATCH", "Field": "cacheEngine", "Value": "Redis"},
-            ],
-            MaxResults=5
-        )
-        
-        if response["PriceList"]:
-            for price_item in response["PriceList"]:
-                price_data = json.loads(price_item)
-                on_demand = price_data.get("terms", {}).get("OnDemand", {})
-                for term in on_demand.values():
-                    for price_dimension in term.get("priceDimensions", {}).values():
-                        price = float(price_dimension.get("pricePerUnit", {}).get("USD", 0))
-                        if price > 0:
-                            return price
-    except Exception as e:
-        print(f"Error getting ElastiCache price: {e}", file=sys.stderr)
+    location = get_region_location(region)
+    if location is None:
+        return None
+    response = pricing_get_products(
+        ServiceCode="AmazonElastiCache",
+        Filters=[
+            {"Type": "TERM_MATCH", "Field": "instanceType", "Value": instance_type},
+            {"Type": "TERM_MATCH", "Field": "location", "Value": location},
+            {"Type": "TERM_MATCH", "Field": "cacheEngine", "Value": "Redis"},
+        ],
+        MaxResults=5
+    )
+    
+    if response["PriceList"]:
+        for price_item in response["PriceList"]:
+            price_data = json.loads(price_item)
+            on_demand = price_data.get("terms", {}).get("OnDemand", {})
+            for term in on_demand.values():
+                for price_dimension in term.get("priceDimensions", {}).values():
+                    price = float(price_dimension.get("pricePerUnit", {}).get("USD", 0))
+                    if price > 0:
+                        return price
     
     return None
 
 
-@lru_cache(maxsize=1000)
+@cached_price("docdb")
 def get_docdb_price(instance_type: str, region: str) -> float | None:
     """DocumentDBインスタンスの時間単価を取得（USD）"""
-    try:
-        pricing = get_pricing_client()
-        location = REGION_MAPPING.get(region, "Asia Pacific (Tokyo)")
-        # DocumentDBのPricing APIはinstanceTypeフィールドを使用
-        response = pricing.get_products(
-            ServiceCode="AmazonDocDB",
-            Filters=[
-                {"Type": "TERM_MATCH", "Field": "instanceType", "Value": instance_type},
-                {"Type": "TERM_MATCH", "Field": "location", "Value": location},
-            ],
-            MaxResults=10
-        )
-        
-        print(f"[DocDB Pricing] {instance_type} in {location}: {len(response.get('PriceList', []))} results", file=sys.stderr)
-        
-        if response["PriceList"]:
-            for price_item in response["PriceList"]:
-                price_data = json.loads(price_item)
-                on_demand = price_data.get("terms", {}).get("OnDemand", {})
-                for term in on_demand.values():
-                    for price_dimension in term.get("priceDimensions", {}).values():
-                        # 時間単価のみ取得（ストレージ料金などを除外）
-                        unit = price_dimension.get("unit", "")
-                        if "Hrs" in unit or "Hour" in unit:
-                            price = float(price_dimension.get("pricePerUnit", {}).get("USD", 0))
-                            if price > 0:
-                                print(f"[DocDB Pricing] Found price for {instance_type}: ${price}/hr", file=sys.stderr)
-                                return price
-    except Exception as e:
-        print(f"Error getting DocumentDB price for {instance_type}: {e}", file=sys.stderr)
+    location = get_region_location(region)
+    if location is None:
+        return None
+    # DocumentDBのPricing APIはinstanceTypeフィールドを使用
+    response = pricing_get_products(
+        ServiceCode="AmazonDocDB",
+        Filters=[
+            {"Type": "TERM_MATCH", "Field": "instanceType", "Value": instance_type},
+            {"Type": "TERM_MATCH", "Field": "location", "Value": location},
+        ],
+        MaxResults=10
+    )
+    
+    print(f"[DocDB Pricing] {instance_type} in {location}: {len(response.get('PriceList', []))} results", file=sys.stderr)
+    
+    if response["PriceList"]:
+        for price_item in response["PriceList"]:
+            price_data = json.loads(price_item)
+            on_demand = price_data.get("terms", {}).get("OnDemand", {})
+            for term in on_demand.values():
+                for price_dimension in term.get("priceDimensions", {}).values():
+                    # 時間単価のみ取得（ストレージ料金などを除外）
+                    unit = price_dimension.get("unit", "")
+                    if "Hrs" in unit or "Hour" in unit:
+                        price = float(price_dimension.get("pricePerUnit", {}).get("USD", 0))
+                        if price > 0:
+                            print(f"[DocDB Pricing] Found price for {instance_type}: ${price}/hr", file=sys.stderr)
+                            return price
     
     print(f"[DocDB Pricing] No price found for {instance_type}", file=sys.stderr)
     return None
@@ -234,6 +1166,7 @@ def get_docdb_price(instance_type: str, region: str) -> float | None:
 
 def get_price(instance_type: str, region: str, service: str = "ec2") -> float | None:
     """サービス種別に応じた価格を取得"""
+    _price_warmup.record(instance_type, service, region)
     if service == "ec2":
         return get_ec2_price(instance_type, region)
     elif service == "rds":
@@ -267,21 +1200,23 @@ def calculate_scale_down_recommendation(
         }
     
     family, current_size = parse_instance_type(instance_type)
-    if not current_size or current_size not in SIZE_ORDER:
+    if not current_size or current_size not in SIZE_INDEX:
         return {"recommendation": None, "reason": "不明なインスタンスサイズ", "current_cpu": cpu_avg_max}
     
-    current_multiplier = SIZE_MULTIPLIERS.get(current_size)
-    if not current_multiplier:
+    # 実在サイズ索引（EC2は索引作成時に性能テーブルも実データで更新されるため先に取得）
+    available_sizes = get_available_sizes(family, service, region)
+    current_vcpus = get_vcpus(instance_type)
+    if not current_vcpus:
         return {"recommendation": None, "reason": "サイズ係数不明", "current_cpu": cpu_avg_max}
     
     current_price = get_price(instance_type, region, service)
     if not current_price:
         return {"recommendation": None, "reason": "価格取得失敗", "current_cpu": cpu_avg_max}
     
-    current_size_index = SIZE_ORDER.index(current_size)
+    current_size_index = SIZE_INDEX[current_size]
     # 動的に最小サイズを検出（サービス毎に異なる）
     min_size = get_family_min_size(family, region, service)
-    min_size_index = SIZE_ORDER.index(min_size) if min_size in SIZE_ORDER else 0
+    min_size_index = SIZE_INDEX.get(min_size, 0)
     
     if current_size_index <= min_size_index:
         return {
@@ -294,15 +1229,22 @@ def calculate_scale_down_recommendation(
     
     for i in range(current_size_index - 1, min_size_index - 1, -1):
         candidate_size = SIZE_ORDER[i]
+        # 実在しないサイズ（例: db.r6g.small）は価格APIを呼ばずにスキップ
+        if available_sizes is not None and candidate_size not in available_sizes:
+            continue
         candidate_type = f"{family}.{candidate_size}"
-        candidate_multiplier = SIZE_MULTIPLIERS.get(candidate_size)
+        candidate_vcpus = get_vcpus(candidate_type)
         
-        if not candidate_multiplier:
+        if not candidate_vcpus:
             continue
         
-        ratio = current_multiplier / candidate_multiplier
+        ratio = current_vcpus / candidate_vcpus
         predicted_cpu = cpu_avg_max * ratio
         
+        # CPUクレジットが不足する候補は価格を取得せずにスキップし、より小さいサイズの探索を続ける
+        if exceeds_credit_baseline(candidate_type, predicted_cpu):
+            continue
+        
         candidate_price = get_price(candidate_type, region, service)
         if not candidate_price:
             continue
@@ -336,22 +1278,236 @@ def calculate_scale_down_recommendation(
     }
 
 
-def get_batch_recommendations(instances: list, region: str = "ap-northeast-1") -> list:
-    """複数インスタンスの一括提案を取得（価格APIを最小化）"""
+# この件数以上のバッチはNumPyでまとめて計算する（NumPy未インストール時はスカラー計算）
+VECTORIZE_MIN_BATCH = int(os.environ.get("VECTORIZE_MIN_BATCH", "200"))
+
+
+def calculate_scale_down_recommendations_vectorized(rows: list, region: str = "ap-northeast-1") -> list:
+    """
+    calculate_scale_down_recommendation のベクトル化版
+    rows: [(instance_type, cpu_avg_max, service), ...]
+    各行の結果はスカラー版と完全に一致する
+    """
+    np = get_numpy()
+    results = [None] * len(rows)
+    size_count = len(SIZE_ORDER)
+    
+    # 1. 行ごとの前処理（スカラー版と同じ順序で判定）
+    vec_rows = []  # 候補探索が必要な行: (row_idx, family, service, cpu, current_idx, min_idx, current_price, current_vcpus)
+    for row_idx, (instance_type, cpu_avg_max, service) in enumerate(rows):
+        if cpu_avg_max is None:
+            results[row_idx] = {"recommendation": None, "reason": "CPU取得不可", "current_cpu": None}
+            continue
+        if cpu_avg_max >= 40:
+            results[row_idx] = {
+                "recommendation": None,
+                "reason": "適正" if cpu_avg_max <= 70 else "スペック不足",
+                "current_cpu": cpu_avg_max
+            }
+            continue
+        family, current_size = parse_instance_type(instance_type)
+        if not current_size or current_size not in SIZE_INDEX:
+            results[row_idx] = {"recommendation": None, "reason": "不明なインスタンスサイズ", "current_cpu": cpu_avg_max}
+            continue
+        get_available_sizes(family, service, region)  # 性能テーブルを先に実データで更新
+        current_vcpus = get_vcpus(instance_type)
+        if not current_vcpus:
+            results[row_idx] = {"recommendation": None, "reason": "サイズ係数不明", "current_cpu": cpu_avg_max}
+            continue
+        current_price = get_price(instance_type, region, service)
+        if not current_price:
+            results[row_idx] = {"recommendation": None, "reason": "価格取得失敗", "current_cpu": cpu_avg_max}
+            continue
+        current_idx = SIZE_INDEX[current_size]
+        min_size = get_family_min_size(family, region, service)
+        min_idx = SIZE_INDEX.get(min_size, 0)
+        if current_idx <= min_idx:
+            results[row_idx] = {"recommendation": None, "reason": "最小構成", "current_cpu": cpu_avg_max}
+            continue
+        vec_rows.append((row_idx, family, service, cpu_avg_max, current_idx, min_idx, current_price, current_vcpus))
+    
+    if not vec_rows:
+        return results
+    
+    # 2. ファミリー毎の価格・vCPUラダー（実在SKUのみ、欠損はNaN）
+    # vCPU・ベースラインは性能テーブル参照のみのため探索範囲全体を埋める
+    ladder_ids = {}
+    ladder_rows = {}
+    for row in vec_rows:
+        ladder_rows.setdefault((row[1], row[2]), []).append(row)
+    ladder_prices = np.full((len(ladder_rows), size_count), np.nan)
+    ladder_vcpus = np.full((len(ladder_rows), size_count), np.nan)
+    ladder_baselines = np.full((len(ladder_rows), size_count), np.nan)  # バースト可能タイプのみ
+    for ladder_id, ((family, service), rows_in_ladder) in enumerate(ladder_rows.items()):
+        ladder_ids[(family, service)] = ladder_id
+        available_sizes = get_available_sizes(family, service, region)
+        low = min(r[5] for r in rows_in_ladder)
+        high = max(r[4] for r in rows_in_ladder)
+        for i in range(low, high):
+            if available_sizes is not None and SIZE_ORDER[i] not in available_sizes:
+                continue
+            candidate_type = f"{family}.{SIZE_ORDER[i]}"
+            candidate_vcpus = get_vcpus(candidate_type)
+            if not candidate_vcpus:
+                continue
+            ladder_vcpus[ladder_id, i] = candidate_vcpus
+            capability = get_instance_capability(candidate_type)
+            if capability["burstable"] and capability["baseline_percent"]:
+                ladder_baselines[ladder_id, i] = capability["baseline_percent"]
+        
+        # 価格はスカラー版と同じ順序で探索し、選ばれ得るサイズのみ取得する
+        # （予測CPUが70%超・クレジット不足の候補は取得しない、40%以上の候補が見つかった時点で打ち切る）
+        for _, _, _, cpu_avg_max, current_idx, min_idx, current_price, current_vcpus in rows_in_ladder:
+            for i in range(current_idx - 1, min_idx - 1, -1):
+                candidate_vcpus = ladder_vcpus[ladder_id, i]
+                if np.isnan(candidate_vcpus):
+                    continue
+                predicted_cpu = cpu_avg_max * current_vcpus / candidate_vcpus
+                if predicted_cpu > 70 or predicted_cpu > ladder_baselines[ladder_id, i]:
+                    continue
+                if np.isnan(ladder_prices[ladder_id, i]):
+                    ladder_prices[ladder_id, i] = get_price(f"{family}.{SIZE_ORDER[i]}", region, service) or np.inf
+                if ladder_prices[ladder_id, i] < current_price and predicted_cpu >= 40:
+                    break
+        ladder_prices[ladder_id, np.isinf(ladder_prices[ladder_id])] = np.nan
+    
+    # 3. 全行・全候補を一括計算
+    row_ladders = np.array([ladder_ids[(r[1], r[2])] for r in vec_rows])
+    cpu = np.array([r[3] for r in vec_rows], dtype=float)
+    current_idx = np.array([r[4] for r in vec_rows])
+    min_idx = np.array([r[5] for r in vec_rows])
+    current_price = np.array([r[6] for r in vec_rows], dtype=float)
+    current_vcpus = np.array([r[7] for r in vec_rows], dtype=float)
+    
+    prices = ladder_prices[row_ladders]                                   # (rows, sizes)
+    ratio = current_vcpus[:, None] / ladder_vcpus[row_ladders]
+    predicted = cpu[:, None] * ratio
+    columns = np.arange(size_count)[None, :]
+    in_window = (columns >= min_idx[:, None]) & (columns < current_idx[:, None])
+    with np.errstate(invalid="ignore"):
+        # vCPUが不明な候補は予測CPUがNaNになり、比較で除外される
+        # ベースラインを超える候補（CPUクレジット不足）も除外（非バースト系はNaNで比較が偽）
+        exceeds_baseline = predicted > ladder_baselines[row_ladders]
+        feasible = (in_window & ~np.isnan(prices) & (prices < current_price[:, None]) & (predicted <= 70)
+                    & ~exceeds_baseline)
+    target = feasible & (predicted >= 40)
+    
+    # スカラー版は大きいサイズから探索し、予測CPU40%以上の候補で打ち切る
+    # → 40%以上の候補があれば最大インデックス、なければ候補中の最小インデックス
+    has_target = target.any(axis=1)
+    has_feasible = feasible.any(axis=1)
+    target_pick = size_count - 1 - np.argmax(target[:, ::-1], axis=1)
+    feasible_pick = np.argmax(feasible, axis=1)
+    pick = np.where(has_target, target_pick, feasible_pick)
+    
+    # 4. 結果をスカラー版と同じ形式で組み立て
+    for k, (row_idx, family, _, cpu_avg_max, _, _, cur_price, _) in enumerate(vec_rows):
+        if not has_feasible[k]:
+            results[row_idx] = {"recommendation": None, "reason": "スケールダウン候補なし", "current_cpu": cpu_avg_max}
+            continue
+        i = int(pick[k])
+        predicted_cpu = float(predicted[k, i])
+        candidate_price = float(prices[k, i])
+        candidate_type = f"{family}.{SIZE_ORDER[i]}"
+        best_candidate = {
+            "recommended_type": candidate_type,
+            "predicted_cpu": round(predicted_cpu, 2),
+            "current_price": round(cur_price, 4),
+            "recommended_price": round(candidate_price, 4),
+            "hourly_savings": round(cur_price - candidate_price, 4),
+            "monthly_savings": round((cur_price - candidate_price) * 730, 2),
+            "savings_percent": round((1 - candidate_price / cur_price) * 100, 1)
+        }
+        results[row_idx] = {
+            "recommendation": best_candidate,
+            "reason": "変更推奨" if best_candidate["predicted_cpu"] >= 40 else "過剰（更に削減余地あり）",
+            "current_cpu": cpu_avg_max
+        }
+    
+    return results
+
+
+# 同一入力判定に使うCPU丸め幅（%）。0以下なら丸めずに完全一致で判定
+RECOMMENDATION_CPU_QUANTUM = float(os.environ.get("RECOMMENDATION_CPU_QUANTUM", "0.01"))
+
+
+def recommendation_memo_key(instance_type: str, cpu_avg_max: float, service: str, region: str,
+                            cpu_quantum: float = RECOMMENDATION_CPU_QUANTUM) -> tuple:
+    """提案計算のメモ化キー（同じキーの行は同じ提案結果になる）"""
+    cpu_key = round(cpu_avg_max / cpu_quantum) if cpu_quantum > 0 else cpu_avg_max
+    return (instance_type, cpu_key, service, region)
+
+
+def _compute_recommendations(rows: list, region: str) -> list:
+    """スケールダウン計算（大きいバッチはベクトル化、失敗時・小バッチはスカラー）"""
+    if get_numpy() is not None and len(rows) >= VECTORIZE_MIN_BATCH:
+        try:
+            return calculate_scale_down_recommendations_vectorized(rows, region)
+        except Exception as e:
+            print(f"[Batch] Vectorized engine failed, falling back to scalar: {e}", file=sys.stderr)
+    
     results = []
-    # 価格キャッシュ（同じインスタンスタイプの再取得を防ぐ）
-    price_cache = {}
+    for instance_type, cpu_avg_max, service in rows:
+        try:
+            results.append(calculate_scale_down_recommendation(instance_type, cpu_avg_max, region, service))
+        except Exception as e:
+            print(f"[Batch] Error processing {instance_type}: {e}", file=sys.stderr)
+            results.append({"recommendation": None, "reason": f"エラー: {str(e)}"})
+    return results
+
+
+# 複数リージョンを含むバッチで、リージョン毎の価格解決を並行実行するワーカー数
+MULTI_REGION_WORKERS = int(os.environ.get("MULTI_REGION_WORKERS", "4"))
+
+
+def map_unordered(fn, tasks: list, max_workers: int = MULTI_REGION_WORKERS):
+    """tasks を並行実行し、完了した順に結果を返す（1件ならその場で実行）"""
+    if len(tasks) <= 1:
+        for task in tasks:
+            yield fn(task)
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tasks)), thread_name_prefix="region") as executor:
+        futures = [executor.submit(fn, task) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+# ストリーミング時にまとめて計算する行数（小さいほど最初の結果が早く届く）
+RECOMMENDATION_STREAM_CHUNK = int(os.environ.get("RECOMMENDATION_STREAM_CHUNK", "25"))
+
+
+def iter_batch_recommendations(instances: list, region: str = "ap-northeast-1",
+                               cpu_quantum: float = RECOMMENDATION_CPU_QUANTUM,
+                               chunk_size: int = 0):
+    """
+    一括提案を計算済みのものから順に (入力内の位置, 結果) で返す
+    計算不要な行を先に返し、スケールダウン計算はリージョン毎に chunk_size 行ずつ（0以下なら一括）並行して行う
+    各行の region（省略時は引数の region、指定時は結果にも含める）で価格を解決する
+    (instance_type, 丸めたCPU, service, region) が同じ行は1回だけ計算し、結果を共有する
+    """
+    # スケールダウン計算が必要な行: (入力内の位置, 結果, instance_type, cpu_avg_max, service, region)
+    pending = []
+    # メモ化キー -> pending内の位置 / pending内の位置 -> 重複行 [(入力内の位置, 結果), ...]
+    memo = {}
+    duplicates = {}
+    reused = 0
     
-    for inst in instances:
+    for idx, inst in enumerate(instances):
         try:
             name = inst.get("name", "")
             instance_type = inst.get("instance_type", "")
             cpu_avg_max = inst.get("cpu_avg_max")
             service = inst.get("service", "ec2")
+            item_region = inst.get("region") or region
+            
+            def with_region(row: dict) -> dict:
+                if inst.get("region"):
+                    row["region"] = item_region
+                return row
             
             # CPU使用率がない場合はスキップ
             if cpu_avg_max is None:
-                results.append({
+                yield idx, with_region({
                     "name": name,
                     "instance_type": instance_type,
                     "cpu_avg_max": None,
@@ -364,7 +1520,7 @@ def get_batch_recommendations(instances: list, region: str = "ap-northeast-1") -
             # CPU使用率が適正範囲以上の場合はスキップ（提案不要）
             if cpu_avg_max >= 40:
                 reason = "適正" if cpu_avg_max <= 70 else "スペック不足"
-                results.append({
+                yield idx, with_region({
                     "name": name,
                     "instance_type": instance_type,
                     "cpu_avg_max": cpu_avg_max,
@@ -376,12 +1532,12 @@ def get_batch_recommendations(instances: list, region: str = "ap-northeast-1") -
             
             # 最小構成チェック（価格API不要）
             family, current_size = parse_instance_type(instance_type)
-            min_size = get_family_min_size(family, region, service)
-            if current_size and current_size in SIZE_ORDER:
-                current_idx = SIZE_ORDER.index(current_size)
-                min_idx = SIZE_ORDER.index(min_size) if min_size in SIZE_ORDER else 0
+            min_size = get_family_min_size(family, item_region, service)
+            if current_size and current_size in SIZE_INDEX:
+                current_idx = SIZE_INDEX[current_size]
+                min_idx = SIZE_INDEX.get(min_size, 0)
                 if current_idx <= min_idx:
-                    results.append({
+                    yield idx, with_region({
                         "name": name,
                         "instance_type": instance_type,
                         "cpu_avg_max": cpu_avg_max,
@@ -391,41 +1547,81 @@ def get_batch_recommendations(instances: list, region: str = "ap-northeast-1") -
                     })
                     continue
             
-            # スケールダウン計算（必要な場合のみ）
-            rec = calculate_scale_down_recommendation(instance_type, cpu_avg_max, region, service)
-            if rec is None:
-                rec = {"recommendation": None, "reason": "計算エラー", "current_cpu": cpu_avg_max}
-            
-            results.append({
+            # スケールダウン計算（必要な場合のみ、ループ後にまとめて実行）
+            row = with_region({
                 "name": name,
                 "instance_type": instance_type,
-                "cpu_avg_max": cpu_avg_max,
-                **rec
+                "cpu_avg_max": cpu_avg_max
             })
+            key = recommendation_memo_key(instance_type, cpu_avg_max, service, item_region, cpu_quantum)
+            if key in memo:
+                duplicates.setdefault(memo[key], []).append((idx, row))
+                continue
+            memo[key] = len(pending)
+            pending.append((idx, row, instance_type, cpu_avg_max, service, item_region))
         except Exception as e:
             print(f"[Batch] Error processing {inst}: {e}", file=sys.stderr)
-            results.append({
+            yield idx, {
                 "name": inst.get("name", "unknown"),
                 "instance_type": inst.get("instance_type", ""),
                 "cpu_avg_max": inst.get("cpu_avg_max", 0),
                 "recommendation": None,
                 "reason": f"エラー: {str(e)}"
-            })
+            }
+    
+    # リージョン毎に chunk_size 行ずつのタスクに分け、完了したタスクから順に返す
+    groups = {}
+    for pending_idx, entry in enumerate(pending):
+        groups.setdefault(entry[5], []).append(pending_idx)
+    tasks = []
+    for task_region, indices in groups.items():
+        size = chunk_size if chunk_size > 0 else len(indices)
+        for start in range(0, len(indices), size):
+            tasks.append((task_region, indices[start:start + size]))
+    
+    def compute(task: tuple) -> tuple:
+        task_region, indices = task
+        return indices, _compute_recommendations([pending[i][2:5] for i in indices], task_region)
+    
+    for indices, recs in map_unordered(compute, tasks):
+        for pending_idx, rec in zip(indices, recs):
+            idx, row, _, cpu_avg_max, _, _ = pending[pending_idx]
+            if rec is None:
+                rec = {"recommendation": None, "reason": "計算エラー", "current_cpu": cpu_avg_max}
+            row.update(rec)
+            yield idx, row
+            # 重複行は代表行の結果を再利用（nameなど行固有の項目はそのまま）
+            for dup_idx, dup_row in duplicates.get(pending_idx, ()):
+                dup_row.update({k: v for k, v in row.items() if k not in ("name", "cpu_avg_max")})
+                reused += 1
+                yield dup_idx, dup_row
     
-    print(f"[Batch] Completed {len(results)} recommendations", file=sys.stderr)
+    print(f"[Batch] Completed {len(instances)} recommendations ({len(pending)} computed, {reused} reused)", file=sys.stderr)
+
+
+def get_batch_recommendations(instances: list, region: str = "ap-northeast-1",
+                              cpu_quantum: float = RECOMMENDATION_CPU_QUANTUM) -> list:
+    """
+    複数インスタンスの一括提案を取得（価格APIを最小化）
+    結果は入力と同じ順序で返す
+    """
+    results = [None] * len(instances)
+    for idx, result in iter_batch_recommendations(instances, region, cpu_quantum):
+        results[idx] = result
     return results
 
 
-def get_batch_prices(instance_types: list, region: str = "ap-northeast-1") -> dict:
-    """複数インスタンスタイプの価格を一括取得"""
+def _get_region_prices(task: tuple) -> tuple:
+    """1リージョン分の価格を取得"""
+    region, items = task
     results = {}
-    for item in instance_types:
+    for item in items:
         try:
             instance_type = item.get("instance_type", "")
             service = item.get("service", "ec2")
             
             if instance_type and instance_type not in results:
-                print(f"[BatchPrice] Getting price for {instance_type} ({service})", file=sys.stderr)
+                print(f"[BatchPrice] Getting price for {instance_type} ({service}, {region})", file=sys.stderr)
                 price = get_price(instance_type, region, service)
                 results[instance_type] = {
                     "hourly_price_usd": round(price, 4) if price else None,
@@ -441,8 +1637,93 @@ def get_batch_prices(instance_types: list, region: str = "ap-northeast-1") -> di
                 "service": item.get("service", "ec2"),
                 "error": str(e)
             }
+    return region, results
+
+
+def get_batch_prices_by_region(instance_types: list, region: str = "ap-northeast-1") -> dict:
+    """
+    複数インスタンスタイプの価格をリージョン別に一括取得
+    各要素の region（省略時は引数の region）でまとめ、リージョン毎に並行して解決する
+    """
+    groups = {}
+    for item in instance_types:
+        groups.setdefault(item.get("region") or region, []).append(item)
+    return dict(map_unordered(_get_region_prices, list(groups.items())))
+
+
+def get_batch_prices(instance_types: list, region: str = "ap-northeast-1") -> dict:
+    """複数インスタンスタイプの価格を一括取得（引数の region 分のみ。全リージョンは get_batch_prices_by_region）"""
+    return get_batch_prices_by_region(instance_types, region).get(region, {})
+
+
+def _inventory_price_requests(instances: list, region: str) -> list:
+    """インベントリから価格取得対象（instance_type, service, region の重複除去）を抽出"""
+    price_requests = []
+    seen = set()
+    for inst in instances:
+        instance_type = inst.get("instance_type", "")
+        service = inst.get("service", "ec2")
+        item_region = inst.get("region") or region
+        if instance_type and (instance_type, service, item_region) not in seen:
+            seen.add((instance_type, service, item_region))
+            price_requests.append({"instance_type": instance_type, "service": service, "region": item_region})
+    return price_requests
+
+
+def build_price_result(prices_by_region: dict, region: str) -> dict:
+    """
+    価格の返却形式を作成
+    prices: 引数の region 分（従来形式）/ prices_by_region: 他リージョンを含む場合のみ全リージョン分
+    """
+    result = {"prices": prices_by_region.get(region, {})}
+    if any(price_region != region for price_region in prices_by_region):
+        result["prices_by_region"] = prices_by_region
+    return result
+
+
+def _inventory_recommendation_targets(instances: list) -> list:
+    """インベントリから提案計算の対象（name と cpu_avg_max がある行）を抽出"""
+    return [inst for inst in instances if inst.get("name") and inst.get("cpu_avg_max") is not None]
+
+
+def analyze_inventory(instances: list, region: str = "ap-northeast-1",
+                      cpu_quantum: float = RECOMMENDATION_CPU_QUANTUM) -> dict:
+    """
+    インベントリ全体の価格マップとスケールダウン提案をまとめて取得
+    現行タイプの価格を1回だけ解決し、提案計算はそのキャッシュ済み価格を再利用する
+    cpu_avg_max がない行（または name がない行）は価格のみ返す
+    各行の region（省略時は引数の region）毎に解決する
+    """
+    result = build_price_result(get_batch_prices_by_region(_inventory_price_requests(instances, region), region), region)
+    rec_targets = _inventory_recommendation_targets(instances)
+    result["recommendations"] = get_batch_recommendations(rec_targets, region, cpu_quantum) if rec_targets else []
     
-    return results
+    print(f"[Inventory] {len(instances)} items: {len(result['prices'])} prices, "
+          f"{len(result['recommendations'])} recommendations", file=sys.stderr)
+    return result
+
+
+# ストリーミング応答に対応するツール
+STREAMING_TOOLS = ("get_batch_recommendations", "analyze_inventory")
+
+
+def iter_tool_partials(name: str, arguments: dict):
+    """
+    ストリーミング対応ツールの部分結果を計算済みのものから順に返す
+    部分結果は最終結果と同じ形のdict（リストは連結、dictはマージすると全体の結果になる）
+    """
+    instances = arguments["instances"]
+    region = arguments.get("region", "ap-northeast-1")
+    cpu_quantum = arguments.get("cpu_quantum", RECOMMENDATION_CPU_QUANTUM)
+    
+    if name == "analyze_inventory":
+        yield build_price_result(get_batch_prices_by_region(_inventory_price_requests(instances, region), region), region)
+        instances = _inventory_recommendation_targets(instances)
+    elif name != "get_batch_recommendations":
+        raise ValueError(f"Streaming not supported: {name}")
+    
+    for _, row in iter_batch_recommendations(instances, region, cpu_quantum, RECOMMENDATION_STREAM_CHUNK):
+        yield {"recommendations": [row]}
 
 
 # MCP SDK関連のデコレータは削除（起動高速化のため）
@@ -511,19 +1792,47 @@ def get_tools_list() -> list:
                                 "name": {"type": "string"},
                                 "instance_type": {"type": "string"},
                                 "cpu_avg_max": {"type": "number"},
-                                "service": {"type": "string", "default": "ec2"}
+                                "service": {"type": "string", "default": "ec2"},
+                                "region": {"type": "string", "description": "行毎のリージョン（省略時は region）"}
                             },
                             "required": ["name", "instance_type", "cpu_avg_max"]
                         }
                     },
-                    "region": {"type": "string", "default": "ap-northeast-1"}
+                    "region": {"type": "string", "default": "ap-northeast-1"},
+                    "cpu_quantum": {"type": "number", "description": "同一入力とみなすCPU丸め幅（%）", "default": RECOMMENDATION_CPU_QUANTUM}
+                },
+                "required": ["instances"]
+            }
+        },
+        {
+            "name": "analyze_inventory",
+            "description": "インベントリ全体の価格と一括スケールダウン提案を1回の価格解決でまとめて取得",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "instances": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "name": {"type": "string"},
+                                "instance_type": {"type": "string"},
+                                "cpu_avg_max": {"type": "number", "description": "省略時は価格のみ取得"},
+                                "service": {"type": "string", "default": "ec2"},
+                                "region": {"type": "string", "description": "行毎のリージョン（省略時は region）"}
+                            },
+                            "required": ["instance_type"]
+                        }
+                    },
+                    "region": {"type": "string", "default": "ap-northeast-1"},
+                    "cpu_quantum": {"type": "number", "description": "同一入力とみなすCPU丸め幅（%）", "default": RECOMMENDATION_CPU_QUANTUM}
                 },
                 "required": ["instances"]
             }
         },
         {
             "name": "get_batch_prices",
-            "description": "複数インスタンスタイプの価格を一括取得",
+            "description": "複数インスタンスタイプの価格を一括取得（他リージョンを含む場合は prices_by_region も返す）",
             "inputSchema": {
                 "type": "object",
                 "properties": {
@@ -533,7 +1842,8 @@ def get_tools_list() -> list:
                             "type": "object",
                             "properties": {
                                 "instance_type": {"type": "string"},
-                                "service": {"type": "string", "default": "ec2"}
+                                "service": {"type": "string", "default": "ec2"},
+                                "region": {"type": "string", "description": "行毎のリージョン（省略時は region）"}
                             },
                             "required": ["instance_type"]
                         }
@@ -546,7 +1856,24 @@ def get_tools_list() -> list:
     ]
 
 
+# ツール毎の呼び出し回数・レイテンシ
+_tool_metrics = MetricsRegistry()
+
+
+def record_tool_call(name: str, elapsed_ms: float, error: bool):
+    """ツール呼び出しのメトリクスを記録（未知のツール名は1つにまとめる）"""
+    _tool_metrics.observe(name if name in TOOL_NAMES else "unknown", elapsed_ms, error)
+
+
 def call_tool_sync(name: str, arguments: dict) -> dict:
+    """ツールを同期的に実行し、メトリクスを記録する"""
+    start = time.perf_counter()
+    result = _call_tool_sync(name, arguments)
+    record_tool_call(name, (time.perf_counter() - start) * 1000, "error" in result)
+    return result
+
+
+def _call_tool_sync(name: str, arguments: dict) -> dict:
     """ツールを同期的に実行（AgentCore用）"""
     try:
         print(f"[call_tool_sync] Called with name={name}, args keys={list(arguments.keys())}", file=sys.stderr)
@@ -601,16 +1928,25 @@ def call_tool_sync(name: str, arguments: dict) -> dict:
         elif name == "get_batch_recommendations":
             instances = arguments["instances"]
             region = arguments.get("region", "ap-northeast-1")
+            cpu_quantum = arguments.get("cpu_quantum", RECOMMENDATION_CPU_QUANTUM)
             print(f"[call_tool_sync] get_batch_recommendations: {len(instances)} instances", file=sys.stderr)
             
-            result = {"recommendations": get_batch_recommendations(instances, region)}
+            result = {"recommendations": get_batch_recommendations(instances, region, cpu_quantum)}
         
         elif name == "get_batch_prices":
             instance_types = arguments["instance_types"]
             region = arguments.get("region", "ap-northeast-1")
             print(f"[call_tool_sync] get_batch_prices: {len(instance_types)} types", file=sys.stderr)
             
-            result = {"prices": get_batch_prices(instance_types, region)}
+            result = build_price_result(get_batch_prices_by_region(instance_types, region), region)
+        
+        elif name == "analyze_inventory":
+            instances = arguments["instances"]
+            region = arguments.get("region", "ap-northeast-1")
+            cpu_quantum = arguments.get("cpu_quantum", RECOMMENDATION_CPU_QUANTUM)
+            print(f"[call_tool_sync] analyze_inventory: {len(instances)} instances", file=sys.stderr)
+            
+            result = analyze_inventory(instances, region, cpu_quantum)
         
         else:
             result = {"error": f"Unknown tool: {name}"}
@@ -625,12 +1961,399 @@ def call_tool_sync(name: str, arguments: dict) -> dict:
         return {"error": f"Internal error: {str(e)}"}
 
 
+TOOL_NAMES = frozenset(tool["name"] for tool in get_tools_list())
+
+
+def get_metrics() -> dict:
+    """運用メトリクスを取得（GET /metrics）"""
+    return {
+        "uptime_s": round(time.time() - _started_at, 1),
+        "tools": _tool_metrics.snapshot(),
+        "pricing_api": get_pricing_api_stats(),
+        "price_cache": get_price_cache_stats(),
+        "size_ladder_families": _size_ladder_index.stats(),
+    }
+
+
+# 起動時の価格ウォームアップ
+# PRICE_WARMUP_FAMILIES: 事前取得するファミリー（例: "m5,t3,db.r6g,docdb:db.r5,cache.r6g"）
+#   "service:family" でサービスを明示、省略時はファミリー名から判定
+# PRICE_WARMUP_STATE_FILE: 直近リクエストで参照したファミリーの保存先（次回起動時に事前取得）
+PRICE_WARMUP_FAMILIES = os.environ.get("PRICE_WARMUP_FAMILIES", "")
+PRICE_WARMUP_REGION = os.environ.get("PRICE_WARMUP_REGION", "ap-northeast-1")
+PRICE_WARMUP_STATE_FILE = os.environ.get("PRICE_WARMUP_STATE_FILE", "")
+PRICE_WARMUP_MAX_FAMILIES = int(os.environ.get("PRICE_WARMUP_MAX_FAMILIES", "50"))
+PRICE_WARMUP_WORKERS = int(os.environ.get("PRICE_WARMUP_WORKERS", "4"))
+# 直近ファミリーの書き出し間隔（秒）: 変更があった場合のみ、まとめて書き出す（終了時にも書き出す）
+PRICE_WARMUP_FLUSH_INTERVAL = float(os.environ.get("PRICE_WARMUP_FLUSH_INTERVAL", "30"))
+
+
+def parse_warmup_families(spec: str, region: str) -> list:
+    """PRICE_WARMUP_FAMILIES を [(service, family, region), ...] に変換"""
+    targets = []
+    for token in spec.split(","):
+        token = token.strip()
+        if not token:
+            continue
+        service, _, family = token.rpartition(":")
+        targets.append((service or get_service_from_family(family), family, region))
+    return targets
+
+
+class PriceWarmup:
+    """参照されたファミリーの記録と、起動時のバックグラウンド価格取得"""
+
+    def __init__(self, state_path: str, max_families: int,
+                 flush_interval: float = PRICE_WARMUP_FLUSH_INTERVAL):
+        self.state_path = state_path
+        self.max_families = max_families
+        self.flush_interval = flush_interval
+        self._seen = OrderedDict()  # (service, family, region) -> 最終参照時刻
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flush_lock = threading.Lock()  # 書き出し同士の直列化（記録のロックとは別）
+        self._flusher = None
+        if state_path:
+            atexit.register(self.flush)
+        self.state = "disabled"
+        self.families = 0
+        self.prices = 0
+        self.elapsed_s = None
+
+    def load(self) -> list:
+        """保存済みの直近ファミリーを読み込む（新しい順）"""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return []
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                entries = json.load(f)
+            with self._lock:
+                for service, family, region, seen_at in sorted(entries, key=lambda e: e[3]):
+                    self._seen[(service, family, region)] = seen_at
+            return [key for key, _ in sorted(self._seen.items(), key=lambda item: -item[1])]
+        except Exception as e:
+            print(f"[Warmup] Failed to load {self.state_path}: {e}", file=sys.stderr)
+            return []
+
+    def flush(self):
+        """
+        変更があれば直近ファミリーを書き出す
+        ロック内ではスナップショットの作成のみ行い、ファイル書き込みはロック外で行う
+        """
+        if not self.state_path:
+            return
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = [[*key, seen_at] for key, seen_at in self._seen.items()]
+                self._dirty = False
+            tmp_path = f"{self.state_path}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.state_path)
+            except Exception as e:
+                print(f"[Warmup] Failed to save {self.state_path}: {e}", file=sys.stderr)
+                with self._lock:
+                    self._dirty = True
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def record(self, instance_type: str, service: str, region: str):
+        """価格参照されたファミリーを記録（ディスクへは書き出しスレッドがまとめて保存）"""
+        if not self.state_path:
+            return
+        family, _ = parse_instance_type(instance_type)
+        key = (service, family, region)
+        with self._lock:
+            self._seen[key] = time.time()
+            self._seen.move_to_end(key)
+            while len(self._seen) > self.max_families:
+                self._seen.popitem(last=False)
+            self._dirty = True
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="price-warmup-flush", daemon=True)
+                self._flusher.start()
+
+    def _warm_family(self, target: tuple) -> int:
+        service, family, region = target
+        sizes = get_available_sizes(family, service, region)
+        if sizes is None:
+            min_index = SIZE_INDEX.get(get_family_min_size(family, region, service), 0)
+            sizes = SIZE_ORDER[min_index:]
+        warmed = 0
+        for size in sizes:
+            if get_price(f"{family}.{size}", region, service) is not None:
+                warmed += 1
+        return warmed
+
+    def run(self, targets: list):
+        """ファミリー毎の全サイズの価格を取得してキャッシュに載せる"""
+        start = time.perf_counter()
+        self.state = "running"
+        self.families = len(targets)
+        print(f"[Warmup] Prefetching prices for {len(targets)} families", file=sys.stderr, flush=True)
+        try:
+            with ThreadPoolExecutor(max_workers=PRICE_WARMUP_WORKERS, thread_name_prefix="warmup") as executor:
+                for warmed in executor.map(self._warm_family, targets):
+                    self.prices += warmed
+            self.state = "done"
+        except Exception as e:
+            print(f"[Warmup] Failed: {e}", file=sys.stderr, flush=True)
+            self.state = "failed"
+        self.elapsed_s = round(time.perf_counter() - start, 2)
+        print(f"[Warmup] {self.state}: {self.prices} prices in {self.elapsed_s}s", file=sys.stderr, flush=True)
+
+    def start(self, configured: list):
+        """設定されたファミリーと直近ファミリーのウォームアップを別スレッドで開始"""
+        targets = list(dict.fromkeys(configured + self.load()[:self.max_families]))
+        if not targets:
+            return
+        self.state = "pending"
+        threading.Thread(target=self.run, args=(targets,), name="price-warmup", daemon=True).start()
+
+    @property
+    def ready(self) -> bool:
+        return self.state in ("disabled", "done", "failed")
+
+    def status(self) -> dict:
+        return {"state": self.state, "families": self.families, "prices": self.prices, "elapsed_s": self.elapsed_s}
+
+
+_price_warmup = PriceWarmup(PRICE_WARMUP_STATE_FILE, PRICE_WARMUP_MAX_FAMILIES)
+
+
 # 標準ライブラリのHTTPサーバー（最速起動）
-from http.server import HTTPServer, BaseHTTPRequestHandler
-import threading
+from http.server import HTTPServer, ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 並行処理モデル
+# - pool     : 固定数ワーカーのスレッドプール（デフォルト）
+# - threaded : リクエスト毎にスレッド生成（ThreadingHTTPServer）
+# - single   : 単一スレッド（従来動作）
+MCP_SERVER_MODE = os.environ.get("MCP_SERVER_MODE", "pool")
+MCP_SERVER_WORKERS = int(os.environ.get("MCP_SERVER_WORKERS", "16"))
+MCP_SERVER_BACKLOG = int(os.environ.get("MCP_SERVER_BACKLOG", "64"))
+
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """固定サイズのスレッドプールでリクエストを処理するHTTPサーバー"""
+
+    request_queue_size = MCP_SERVER_BACKLOG
+
+    def __init__(self, server_address, handler_class, max_workers: int):
+        super().__init__(server_address, handler_class)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mcp-http")
+
+    def process_request(self, request, client_address):
+        self._executor.submit(self._process_request_worker, request, client_address)
+
+    def _process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=False)
+
+
+def create_server(port: int, mode: str = MCP_SERVER_MODE) -> HTTPServer:
+    """並行処理モデルに応じたHTTPサーバーを生成"""
+    address = ('0.0.0.0', port)
+    if mode == "single":
+        return HTTPServer(address, MCPHandler)
+    if mode == "threaded":
+        return ThreadingHTTPServer(address, MCPHandler)
+    if mode != "pool":
+        print(f"Unknown MCP_SERVER_MODE={mode}, using pool", file=sys.stderr, flush=True)
+    return ThreadPoolHTTPServer(address, MCPHandler, MCP_SERVER_WORKERS)
+
+# JSON-RPCバッチ内の呼び出しを並行実行するワーカー数
+MCP_BATCH_WORKERS = int(os.environ.get("MCP_BATCH_WORKERS", "8"))
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+
+def get_batch_executor() -> ThreadPoolExecutor:
+    """バッチ実行用スレッドプールを取得（初回のみ生成）"""
+    global _batch_executor
+    if _batch_executor is None:
+        with _batch_executor_lock:
+            if _batch_executor is None:
+                _batch_executor = ThreadPoolExecutor(max_workers=MCP_BATCH_WORKERS, thread_name_prefix="mcp-batch")
+    return _batch_executor
+
+
+# tools/call の結果に JSON文字列の text コンテンツも含めるか（旧クライアント向け）
+# リクエスト毎に params._meta.textContent=true でも指定可能
+MCP_TEXT_CONTENT = os.environ.get("MCP_TEXT_CONTENT", "false").lower() == "true"
+
+# MCPプロトコルバージョン（structuredContent は 2025-06-18 以降で定義）
+# initialize ではクライアントの要求バージョンが対応済みならそれを、それ以外は最新を返す
+MCP_PROTOCOL_VERSION = "2025-06-18"
+MCP_SUPPORTED_PROTOCOL_VERSIONS = ("2025-06-18", "2025-03-26", "2024-11-05")
+
+
+def supports_structured_content(protocol_version: str | None) -> bool:
+    """
+    MCP-Protocol-Version ヘッダーの値が structuredContent を定義するバージョンか
+    ヘッダーなし（2025-03-26 以前のクライアント）は非対応として扱う
+    """
+    return bool(protocol_version) and protocol_version >= MCP_PROTOCOL_VERSION
+
+
+def build_tool_result(tool_result: dict, params: dict, protocol_version: str | None = None) -> dict:
+    """
+    tools/call の結果を structuredContent で返す（text は必要時のみ、二重エンコードを避ける）
+    structuredContent 未定義のバージョンで接続したクライアントには text コンテンツも返す
+    """
+    result = {"content": [], "structuredContent": tool_result}
+    if (MCP_TEXT_CONTENT or (params.get("_meta") or {}).get("textContent")
+            or not supports_structured_content(protocol_version)):
+        result["content"] = [{"type": "text", "text": json.dumps(tool_result, ensure_ascii=False)}]
+    if "error" in tool_result:
+        result["isError"] = True
+    return result
+
+
+def handle_rpc_request(request, protocol_version: str | None = None) -> dict | None:
+    """単一のJSON-RPCリクエストを処理（通知の場合はNoneを返す）"""
+    if not isinstance(request, dict):
+        return {"jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid Request"}, "id": None}
+    
+    method = request.get("method", "")
+    params = request.get("params", {})
+    req_id = request.get("id")
+    # method が文字列でない・params が指定されているのにオブジェクトでない場合はこのリクエストのみエラー
+    if not isinstance(method, str) or not isinstance(params, dict):
+        return {"jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid Request"},
+                "id": req_id if isinstance(req_id, (str, int)) else None}
+    
+    print(f"[RPC] method={method}", file=sys.stderr, flush=True)
+    
+    if method.startswith("notifications/"):
+        return None
+    
+    if method == "initialize":
+        requested = params.get("protocolVersion")
+        result = {
+            "protocolVersion": requested if requested in MCP_SUPPORTED_PROTOCOL_VERSIONS else MCP_PROTOCOL_VERSION,
+            "capabilities": {"tools": {"listChanged": False}},
+            "serverInfo": {"name": "aws-pricing-server", "version": "1.0.0"}
+        }
+    elif method == "tools/list":
+        result = {"tools": get_tools_list()}
+    elif method == "tools/call":
+        tool_name = params.get("name", "")
+        tool_args = params.get("arguments", {})
+        if not isinstance(tool_args, dict):
+            return {"jsonrpc": "2.0", "error": {"code": -32602, "message": "Invalid params"}, "id": req_id}
+        tool_result = call_tool_sync(tool_name, tool_args)
+        result = build_tool_result(tool_result, params, protocol_version)
+    else:
+        return {
+            "jsonrpc": "2.0",
+            "error": {"code": -32601, "message": f"Method not found: {method}"},
+            "id": req_id
+        }
+    
+    return {"jsonrpc": "2.0", "result": result, "id": req_id}
+
+
+def handle_rpc_batch(requests: list, protocol_version: str | None = None):
+    """JSON-RPC 2.0 バッチを並行実行（通知の応答は含めない）"""
+    if not requests:
+        # 空配列はバッチではなく単一のエラーを返す（JSON-RPC 2.0 仕様）
+        return {"jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid Request"}, "id": None}
+    print(f"[RPC] batch of {len(requests)} requests", file=sys.stderr, flush=True)
+    if len(requests) == 1:
+        responses = [handle_rpc_request(requests[0], protocol_version)]
+    else:
+        responses = list(get_batch_executor().map(
+            lambda request: handle_rpc_request(request, protocol_version), requests))
+    return [response for response in responses if response is not None]
+
+
+def wants_stream(request, accept: str) -> bool:
+    """SSEでストリーミング応答するか（text/event-stream を受け付け、progressToken 付きの対応ツール呼び出し）"""
+    if not isinstance(request, dict) or request.get("method") != "tools/call":
+        return False
+    params = request.get("params")
+    if not isinstance(params, dict):
+        return False
+    return ("text/event-stream" in accept
+            and params.get("name") in STREAMING_TOOLS
+            and (params.get("_meta") or {}).get("progressToken") is not None)
+
+
+def iter_rpc_stream(request: dict, protocol_version: str | None = None):
+    """
+    tools/call をJSON-RPCメッセージ列として返す
+    部分結果は notifications/progress の partialResult で送り、最後に件数のみの応答を送る
+    """
+    params = request.get("params", {})
+    name = params.get("name", "")
+    arguments = params.get("arguments", {})
+    token = params["_meta"]["progressToken"]
+    count = 0
+    start = time.perf_counter()
+    
+    print(f"[RPC] streaming tools/call name={name}", file=sys.stderr, flush=True)
+    try:
+        for partial in iter_tool_partials(name, arguments):
+            count += 1
+            yield {
+                "jsonrpc": "2.0",
+                "method": "notifications/progress",
+                "params": {"progressToken": token, "progress": count, "partialResult": partial}
+            }
+        summary = {"streamed": True, "partials": count}
+    except Exception as e:
+        print(f"[RPC] Streaming error: {name} failed with {e}", file=sys.stderr, flush=True)
+        summary = {"error": f"Internal error: {str(e)}"}
+    record_tool_call(name, (time.perf_counter() - start) * 1000, "error" in summary)
+    
+    yield {
+        "jsonrpc": "2.0",
+        "result": build_tool_result(summary, params, protocol_version),
+        "id": request.get("id")
+    }
+
+
+# HTTP/1.1 keep-alive のアイドルタイムアウト（秒）。アイドル接続がワーカーを占有し続けないようにする
+MCP_KEEPALIVE_TIMEOUT = float(os.environ.get("MCP_KEEPALIVE_TIMEOUT", "5"))
+# gzip圧縮するレスポンスの最小サイズ（バイト）と圧縮レベル
+MCP_GZIP_MIN_BYTES = int(os.environ.get("MCP_GZIP_MIN_BYTES", "1024"))
+MCP_GZIP_LEVEL = int(os.environ.get("MCP_GZIP_LEVEL", "6"))
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Accept-Encoding ヘッダーが gzip を受け付けるか（q=0 は拒否扱い）"""
+    for token in accept_encoding.split(","):
+        coding, _, params = token.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "*"):
+            q = params.strip()
+            if q.startswith("q="):
+                try:
+                    return float(q[2:]) > 0
+                except ValueError:
+                    return False
+            return True
+    return False
+
 
 class MCPHandler(BaseHTTPRequestHandler):
-    """軽量HTTPハンドラー"""
+    """軽量HTTPハンドラー（HTTP/1.1 keep-alive 対応）"""
+    
+    protocol_version = "HTTP/1.1"
+    timeout = MCP_KEEPALIVE_TIMEOUT
     
     def log_message(self, format, *args):
         print(f"[HTTP] {args[0]}", file=sys.stderr, flush=True)
@@ -639,55 +2362,94 @@ class MCPHandler(BaseHTTPRequestHandler):
         body = json.dumps(data, ensure_ascii=False).encode('utf-8')
         self.send_response(status)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Vary', 'Accept-Encoding')
+        if len(body) >= MCP_GZIP_MIN_BYTES and accepts_gzip(self.headers.get('Accept-Encoding', '')):
+            body = gzip.compress(body, compresslevel=MCP_GZIP_LEVEL)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', len(body))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def send_no_content(self):
+        self.send_response(204)
+        self.send_header('Content-Length', 0)
+        self.end_headers()
+    
+    def send_length_required(self):
+        """ボディ長が不明なリクエストを拒否して接続を閉じる（読み残しを次のリクエストとして解釈しないため）"""
+        body = b'Content-Length required'
+        self.send_response(411)
+        self.send_header('Content-Type', 'text/plain')
         self.send_header('Content-Length', len(body))
+        self.send_header('Connection', 'close')
         self.end_headers()
         self.wfile.write(body)
+        self.close_connection = True
+    
+    def read_body(self) -> bytes | None:
+        """Content-Length 分のボディを読む（chunked・長さ不正の場合はNone）"""
+        if 'Transfer-Encoding' in self.headers:
+            return None
+        try:
+            content_length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            return None
+        if content_length < 0:
+            return None
+        return self.rfile.read(content_length)
+    
+    def send_event_stream(self, messages):
+        """JSON-RPCメッセージをSSEイベントとして順次送信（送信毎にフラッシュ）"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        # 長さ不定のため接続終了でストリーム終端を示す
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for message in messages:
+            data = json.dumps(message, ensure_ascii=False)
+            self.wfile.write(f"event: message\ndata: {data}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        self.close_connection = True
     
     def do_GET(self):
-        """ヘルスチェック（GET /）"""
-        self.send_json({"status": "healthy", "server": "aws-pricing-mcp"})
+        """ヘルスチェック（GET /）/ 運用メトリクス（GET /metrics）"""
+        if self.path.split('?', 1)[0] == '/metrics':
+            self.send_json(get_metrics())
+            return
+        self.send_json({
+            "status": "healthy",
+            "server": "aws-pricing-mcp",
+            "ready": _price_warmup.ready,
+            "warmup": _price_warmup.status(),
+        })
     
     def do_POST(self):
-        """JSON-RPCリクエスト処理"""
+        """JSON-RPCリクエスト処理（単一オブジェクト / バッチ配列）"""
+        body = self.read_body()
+        if body is None:
+            self.send_length_required()
+            return
         try:
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = self.rfile.read(content_length)
             request = json.loads(body.decode('utf-8'))
+            # initialize 後のリクエストで送られる交渉済みバージョン（旧クライアントは送らない）
+            protocol_version = self.headers.get('MCP-Protocol-Version')
             
-            method = request.get("method", "")
-            params = request.get("params", {})
-            req_id = request.get("id")
-            
-            print(f"[RPC] method={method}", file=sys.stderr, flush=True)
-            
-            if method == "initialize":
-                result = {
-                    "protocolVersion": "2024-11-05",
-                    "capabilities": {"tools": {"listChanged": False}},
-                    "serverInfo": {"name": "aws-pricing-server", "version": "1.0.0"}
-                }
-            elif method == "tools/list":
-                result = {"tools": get_tools_list()}
-            elif method == "tools/call":
-                tool_name = params.get("name", "")
-                tool_args = params.get("arguments", {})
-                tool_result = call_tool_sync(tool_name, tool_args)
-                result = {
-                    "content": [{"type": "text", "text": json.dumps(tool_result, ensure_ascii=False)}]
-                }
-            elif method == "notifications/initialized":
-                self.send_response(204)
-                self.end_headers()
+            if wants_stream(request, self.headers.get('Accept', '')):
+                self.send_event_stream(iter_rpc_stream(request, protocol_version))
                 return
+            
+            if isinstance(request, list):
+                response = handle_rpc_batch(request, protocol_version)
             else:
-                self.send_json({
-                    "jsonrpc": "2.0",
-                    "error": {"code": -32601, "message": f"Method not found: {method}"},
-                    "id": req_id
-                })
+                response = handle_rpc_request(request, protocol_version)
+            
+            if not response:
+                # 通知のみの場合は応答ボディなし
+                self.send_no_content()
                 return
             
-            self.send_json({"jsonrpc": "2.0", "result": result, "id": req_id})
+            self.send_json(response)
             
         except Exception as e:
             print(f"[RPC] Error: {e}", file=sys.stderr, flush=True)
@@ -704,9 +2466,18 @@ def main():
     # 即座にログ出力
     print(f"Starting server on port {port}...", file=sys.stderr, flush=True)
     
-    server = HTTPServer(('0.0.0.0', port), MCPHandler)
-    print(f"Server ready at http://0.0.0.0:{port}/", file=sys.stderr, flush=True)
-    server.serve_forever()
+    server = create_server(port)
+    # 待ち受け開始後にバックグラウンドで価格キャッシュを温める（GET / の ready で完了を確認）
+    _price_warmup.start(parse_warmup_families(PRICE_WARMUP_FAMILIES, PRICE_WARMUP_REGION))
+    print(f"Server ready at http://0.0.0.0:{port}/ (mode={MCP_SERVER_MODE}, workers={MCP_SERVER_WORKERS})",
+          file=sys.stderr, flush=True)
+    # コンテナ停止（SIGTERM）でも終了処理（価格キャッシュの書き出し等）を行う
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    finally:
+        _price_cache.flush()
+        _price_warmup.flush()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+"""MCPサーバーのテスト共通設定（Pricing API は偽クライアントに差し替え、AWSには接続しない）"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import server  # noqa: E402
+
+# サイズ毎の基準単価（ファミリー毎に係数を掛ける）
+SIZE_PRICES = {
+    "nano": 0.0052, "micro": 0.0104, "small": 0.0208, "medium": 0.0416, "large": 0.0832,
+    "xlarge": 0.1664, "2xlarge": 0.3328, "4xlarge": 0.6656, "8xlarge": 1.3312,
+    "12xlarge": 1.9968, "16xlarge": 2.6624, "24xlarge": 3.9936,
+}
+FAMILIES = ("t3", "m5", "c5", "r6g")
+SERVICE_PREFIXES = {"AmazonEC2": "", "AmazonRDS": "db.", "AmazonDocDB": "db.", "AmazonElastiCache": "cache."}
+
+
+def fake_price(instance_type: str) -> float | None:
+    """偽の時間単価（実在しないサイズは None）"""
+    family, _, size = instance_type.rpartition(".")
+    if size not in SIZE_PRICES or family.split(".")[-1] not in FAMILIES:
+        return None
+    if family.split(".")[-1] == "m5" and size in ("nano", "micro", "small", "medium"):
+        return None
+    return round(SIZE_PRICES[size] * (1.0 + sum(map(ord, family)) % 7 / 10), 4)
+
+
+class FakePricingClient:
+    """get_products / get_attribute_values だけを持つ Pricing API クライアント"""
+
+    def __init__(self):
+        self.calls = []
+        self.delay = 0.0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def get_products(self, ServiceCode, Filters, MaxResults):
+        instance_type = next(f["Value"] for f in Filters if f["Field"] == "instanceType")
+        with self._lock:
+            self.calls.append((ServiceCode, instance_type))
+            fail = self.failures > 0
+            if fail:
+                self.failures -= 1
+        if self.delay:
+            time.sleep(self.delay)
+        if fail:
+            raise RuntimeError("Throttling")
+        price = fake_price(instance_type)
+        if price is None:
+            return {"PriceList": []}
+        document = {"terms": {"OnDemand": {"t": {"priceDimensions": {"d": {"pricePerUnit": {"USD": str(price)}}}}}}}
+        return {"PriceList": [json.dumps(document)]}
+
+    def get_attribute_values(self, ServiceCode, AttributeName, NextToken=None, **kwargs):
+        prefix = SERVICE_PREFIXES[ServiceCode]
+        values = [
+            {"Value": f"{prefix}{family}.{size}"}
+            for family in FAMILIES for size in SIZE_PRICES
+            if fake_price(f"{prefix}{family}.{size}") is not None
+        ]
+        return {"AttributeValues": values}
+
+    def product_calls(self) -> int:
+        with self._lock:
+            return len(self.calls)
+
+
+def _boto3_disabled():
+    raise ImportError("boto3 is not used in tests")
+
+
+@pytest.fixture
+def pricing(monkeypatch):
+    """偽の Pricing API と空のキャッシュ・ブレーカー（ヘッジ無効）で server を動かす"""
+    client = FakePricingClient()
+    monkeypatch.setattr(server, "get_pricing_client", lambda: client)
+    # ec2:DescribeInstanceTypes は使わず、Pricing API の属性値でサイズ一覧を作る
+    monkeypatch.setattr(server, "get_boto3", _boto3_disabled)
+    monkeypatch.setattr(server, "_price_cache", server.PriceCache(3600, 300, 4096))
+    monkeypatch.setattr(server, "_price_flight", server.SingleFlight())
+    monkeypatch.setattr(server, "_price_snapshot", server.PriceSnapshot(""))
+    monkeypatch.setattr(server, "_size_ladder_index", server.SizeLadderIndex(3600, 300))
+    monkeypatch.setattr(server, "_pricing_breaker", server.CircuitBreaker("pricing", 20, 10, 0.5, 30))
+    monkeypatch.setattr(server, "_hedge_latency", server.LatencyWindow(200))
+    monkeypatch.setattr(server, "_hedge_stats", {"hedged": 0, "hedge_wins": 0})
+    monkeypatch.setattr(server, "PRICING_HEDGE_DELAY_MS", "off")
+    return client
+
+
+@pytest.fixture
+def mcp_url(pricing):
+    """ポート自動割り当てで MCP サーバーを起動し、URLを返す"""
+    httpd = server.create_server(0, "pool")
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/"
+    httpd.shutdown()
+    httpd.server_close()
@@ -0,0 +1,48 @@
+"""HTTP/1.1 keep-alive とリクエストボディ長のテスト"""
+
+import json
+import socket
+from urllib.parse import urlparse
+
+BODY = json.dumps({"jsonrpc": "2.0", "id": 1, "method": "tools/list"}).encode("utf-8")
+
+
+def exchange(url: str, data: bytes) -> bytes:
+    """生のリクエストを送り、サーバーが接続を閉じるか待ち時間が切れるまで応答を読む"""
+    address = urlparse(url)
+    with socket.create_connection((address.hostname, address.port), timeout=2) as sock:
+        sock.sendall(data)
+        received = b""
+        try:
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                received += chunk
+        except socket.timeout:
+            pass
+    return received
+
+
+def request_with_length(body: bytes) -> bytes:
+    return b"POST / HTTP/1.1\r\nHost: test\r\nContent-Length: %d\r\n\r\n" % len(body) + body
+
+
+def test_keep_alive_serves_several_requests_on_one_connection(mcp_url):
+    received = exchange(mcp_url, request_with_length(BODY) * 3)
+    assert received.count(b"HTTP/1.1 200") == 3
+
+
+def test_chunked_body_is_rejected_and_connection_closed(mcp_url):
+    chunked = (b"POST / HTTP/1.1\r\nHost: test\r\nTransfer-Encoding: chunked\r\n\r\n"
+               + b"%x\r\n" % len(BODY) + BODY + b"\r\n0\r\n\r\n")
+    received = exchange(mcp_url, chunked + request_with_length(BODY))
+    # 読み残したチャンクや後続のリクエストは処理しない
+    assert received.startswith(b"HTTP/1.1 411")
+    assert received.count(b"HTTP/1.1") == 1
+    assert b"Connection: close" in received
+
+
+def test_invalid_content_length_is_rejected(mcp_url):
+    received = exchange(mcp_url, b"POST / HTTP/1.1\r\nHost: test\r\nContent-Length: abc\r\n\r\n")
+    assert received.startswith(b"HTTP/1.1 411")
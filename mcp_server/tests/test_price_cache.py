@@ -0,0 +1,117 @@
+"""価格キャッシュ（TTL・ネガティブキャッシュ・期限切れフォールバック・ディスク層）のテスト"""
+
+import json
+import threading
+import time
+
+import server
+
+
+def test_entries_expire_after_ttl():
+    cache = server.PriceCache(ttl=0.05, negative_ttl=0.05, maxsize=10)
+    cache.set(("ec2", "m5.large", "ap-northeast-1"), 0.124)
+    assert cache.get(("ec2", "m5.large", "ap-northeast-1")) == (True, 0.124)
+    time.sleep(0.06)
+    assert cache.get(("ec2", "m5.large", "ap-northeast-1")) == (False, None)
+    # 期限切れでもフォールバック用に保持している
+    assert cache.get_stale(("ec2", "m5.large", "ap-northeast-1")) == 0.124
+
+
+def test_negative_results_use_their_own_ttl():
+    cache = server.PriceCache(ttl=60, negative_ttl=0.05, maxsize=10)
+    cache.set(("ec2", "m5.nano", "ap-northeast-1"), None)
+    assert cache.get(("ec2", "m5.nano", "ap-northeast-1")) == (True, None)
+    assert cache.stats()["negative_hits"] == 1
+    time.sleep(0.06)
+    assert cache.get(("ec2", "m5.nano", "ap-northeast-1")) == (False, None)
+    assert cache.get_stale(("ec2", "m5.nano", "ap-northeast-1")) is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = server.PriceCache(ttl=60, negative_ttl=60, maxsize=2)
+    cache.set(("ec2", "a", "r"), 1.0)
+    cache.set(("ec2", "b", "r"), 2.0)
+    cache.get(("ec2", "a", "r"))
+    cache.set(("ec2", "c", "r"), 3.0)
+    assert cache.get(("ec2", "b", "r")) == (False, None)
+    assert cache.get(("ec2", "a", "r")) == (True, 1.0)
+
+
+def test_set_only_marks_dirty_and_flush_writes_positive_entries(tmp_path):
+    path = tmp_path / "prices.json"
+    cache = server.PriceCache(ttl=60, negative_ttl=60, maxsize=10, path=str(path), flush_interval=3600)
+    cache.set(("ec2", "m5.large", "ap-northeast-1"), 0.124)
+    cache.set(("ec2", "m5.nano", "ap-northeast-1"), None)
+    assert not path.exists()
+
+    cache.flush()
+    data = json.loads(path.read_text())
+    assert list(data) == ["ec2|m5.large|ap-northeast-1"]
+
+    # 変更がなければ書き出さない
+    path.unlink()
+    cache.flush()
+    assert not path.exists()
+
+
+def test_flush_writes_outside_the_cache_lock(tmp_path, monkeypatch):
+    cache = server.PriceCache(ttl=60, negative_ttl=60, maxsize=10, path=str(tmp_path / "p.json"), flush_interval=3600)
+    cache.set(("ec2", "m5.large", "ap-northeast-1"), 0.124)
+    lock_held = []
+    original_dump = json.dump
+
+    def dump(*args, **kwargs):
+        lock_held.append(cache._lock.locked())
+        return original_dump(*args, **kwargs)
+
+    monkeypatch.setattr(server.json, "dump", dump)
+    cache.flush()
+    assert lock_held == [False]
+
+
+def test_disk_layer_round_trip(tmp_path):
+    path = str(tmp_path / "prices.json")
+    cache = server.PriceCache(ttl=60, negative_ttl=60, maxsize=10, path=path, flush_interval=3600)
+    cache.set(("rds", "db.r6g.large", "ap-northeast-1"), 0.3)
+    cache.flush()
+
+    reloaded = server.PriceCache(ttl=60, negative_ttl=60, maxsize=10, path=path, flush_interval=3600)
+    assert reloaded.get(("rds", "db.r6g.large", "ap-northeast-1")) == (True, 0.3)
+
+
+def test_concurrent_sets_are_all_flushed(tmp_path):
+    path = tmp_path / "prices.json"
+    cache = server.PriceCache(ttl=60, negative_ttl=60, maxsize=1000, path=str(path), flush_interval=3600)
+
+    def fill(worker):
+        for i in range(100):
+            cache.set(("ec2", f"w{worker}.{i}", "r"), float(i))
+
+    threads = [threading.Thread(target=fill, args=(w,)) for w in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cache.flush()
+    assert len(json.loads(path.read_text())) == 400
+
+
+def test_cached_price_serves_hits_without_calling_the_api(pricing):
+    assert server.get_ec2_price("m5.large", "ap-northeast-1") is not None
+    assert server.get_ec2_price("m5.large", "ap-northeast-1") is not None
+    assert pricing.product_calls() == 1
+
+
+def test_cached_price_falls_back_to_stale_value_on_api_failure(pricing):
+    price = server.get_ec2_price("m5.large", "ap-northeast-1")
+    key = ("ec2", "m5.large", "ap-northeast-1")
+    server._price_cache._entries[key] = (price, 0)  # 期限切れにする
+    pricing.failures = 100
+    assert server.get_ec2_price("m5.large", "ap-northeast-1") == price
+    assert server._price_cache.stats()["stale_hits"] == 1
+
+
+def test_cached_price_does_not_cache_failures(pricing):
+    pricing.failures = 1
+    assert server.get_ec2_price("m5.large", "ap-northeast-1") is None
+    assert server.get_ec2_price("m5.large", "ap-northeast-1") is not None
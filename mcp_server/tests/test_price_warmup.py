@@ -0,0 +1,49 @@
+"""参照ファミリーの記録（PriceWarmup の遅延書き出し）のテスト"""
+
+import itertools
+import json
+
+import server
+
+
+def make_warmup(tmp_path, max_families: int = 8) -> server.PriceWarmup:
+    return server.PriceWarmup(str(tmp_path / "warmup.json"), max_families, flush_interval=3600)
+
+
+def test_record_defers_write_until_flush(tmp_path):
+    warmup = make_warmup(tmp_path)
+    warmup.record("m5.large", "ec2", "ap-northeast-1")
+    warmup.record("m5.xlarge", "ec2", "ap-northeast-1")
+    assert not (tmp_path / "warmup.json").exists()
+
+    warmup.flush()
+    entries = json.loads((tmp_path / "warmup.json").read_text())
+    assert [entry[:3] for entry in entries] == [["ec2", "m5", "ap-northeast-1"]]
+    assert warmup._dirty is False
+
+
+def test_flush_writes_outside_the_record_lock(tmp_path, monkeypatch):
+    warmup = make_warmup(tmp_path)
+    warmup.record("c5.large", "ec2", "ap-northeast-1")
+    held = []
+    original = server.json.dump
+
+    def dump(*args, **kwargs):
+        held.append(warmup._lock.locked())
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(server.json, "dump", dump)
+    warmup.flush()
+    warmup.flush()  # 変更がなければ書き出さない
+    assert held == [False]
+
+
+def test_saved_families_are_loaded_newest_first_within_limit(tmp_path, monkeypatch):
+    clock = itertools.count(1000)
+    monkeypatch.setattr(server.time, "time", lambda: next(clock))
+    warmup = make_warmup(tmp_path, max_families=2)
+    for instance_type in ("t3.micro", "m5.large", "r6g.large"):
+        warmup.record(instance_type, "ec2", "ap-northeast-1")
+    warmup.flush()
+
+    assert make_warmup(tmp_path).load() == [("ec2", "r6g", "ap-northeast-1"), ("ec2", "m5", "ap-northeast-1")]
@@ -0,0 +1,134 @@
+"""Pricing API のサーキットブレーカーとヘッジのテスト"""
+
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import server
+
+
+def make_breaker(cooldown: float = 30) -> server.CircuitBreaker:
+    return server.CircuitBreaker("test", window=10, min_calls=4, error_rate=0.5, cooldown=cooldown)
+
+
+def test_breaker_opens_when_error_rate_is_reached():
+    breaker = make_breaker()
+    for success in (True, False, True):
+        breaker.before_call()
+        breaker.record(success)
+    assert breaker.state == "closed"  # 最小件数未満
+    breaker.before_call()
+    breaker.record(False)
+    assert breaker.state == "open"
+    with pytest.raises(server.CircuitOpenError):
+        breaker.before_call()
+    assert breaker.stats() == {"state": "open", "opened": 1, "rejected": 1}
+
+
+def test_half_open_allows_a_single_trial_and_closes_on_success():
+    breaker = make_breaker(cooldown=0.05)
+    for _ in range(4):
+        breaker.record(False)
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(server.CircuitOpenError):
+        breaker.before_call()  # 試行中は他の呼び出しを通さない
+    breaker.record(True)
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = make_breaker(cooldown=0.05)
+    for _ in range(4):
+        breaker.record(False)
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record(False)
+    assert breaker.state == "open"
+    assert breaker.opened == 2
+
+
+def test_open_breaker_skips_the_api_and_uses_the_snapshot(pricing, monkeypatch, tmp_path):
+    snapshot = tmp_path / "snapshot.json"
+    snapshot.write_text(json.dumps({"ec2|c5.xlarge|ap-northeast-1": 0.2}))
+    monkeypatch.setattr(server, "_price_snapshot", server.PriceSnapshot(str(snapshot)))
+    monkeypatch.setattr(server, "_pricing_breaker", make_breaker())
+    pricing.failures = 4
+    for size in ("large", "xlarge", "2xlarge", "4xlarge"):
+        assert server.get_ec2_price(f"m5.{size}", "ap-northeast-1") is None
+    assert server._pricing_breaker.state == "open"
+
+    calls = pricing.product_calls()
+    assert server.get_ec2_price("c5.xlarge", "ap-northeast-1") == 0.2
+    assert server.get_ec2_price("c5.2xlarge", "ap-northeast-1") is None
+    assert pricing.product_calls() == calls
+
+
+def slow_first_call(pricing, delay: float):
+    """1回目の呼び出しだけ遅くする（2回目以降は即時）"""
+    counter = itertools.count()
+    original = pricing.get_products
+
+    def get_products(**kwargs):
+        if next(counter) == 0:
+            time.sleep(delay)
+        return original(**kwargs)
+
+    pricing.get_products = get_products
+
+
+def test_hedge_wins_when_the_primary_is_slow(pricing, monkeypatch):
+    monkeypatch.setattr(server, "PRICING_HEDGE_DELAY_MS", "20")
+    slow_first_call(pricing, 0.5)
+    start = time.perf_counter()
+    assert server.get_ec2_price("m5.large", "ap-northeast-1") is not None
+    assert time.perf_counter() - start < 0.4
+    assert server._hedge_stats == {"hedged": 1, "hedge_wins": 1}
+
+
+def test_fast_primary_is_not_hedged(pricing, monkeypatch):
+    monkeypatch.setattr(server, "PRICING_HEDGE_DELAY_MS", "200")
+    assert server.get_ec2_price("m5.large", "ap-northeast-1") is not None
+    assert server._hedge_stats == {"hedged": 0, "hedge_wins": 0}
+    assert pricing.product_calls() == 1
+
+
+def test_p95_delay_uses_only_the_recent_window(pricing, monkeypatch):
+    monkeypatch.setattr(server, "PRICING_HEDGE_DELAY_MS", "p95")
+    monkeypatch.setattr(server, "PRICING_HEDGE_MIN_SAMPLES", 5)
+    monkeypatch.setattr(server, "PRICING_HEDGE_MIN_DELAY_MS", 1)
+    monkeypatch.setattr(server, "_hedge_latency", server.LatencyWindow(10))
+    assert server.get_hedge_delay() is None  # 計測不足
+    for _ in range(10):
+        server._hedge_latency.observe(500)
+    assert server.get_hedge_delay() == 0.5
+    for _ in range(10):
+        server._hedge_latency.observe(20)
+    assert server.get_hedge_delay() == 0.02
+
+
+def test_hedge_timer_starts_when_the_primary_runs(pricing, monkeypatch):
+    # プールが飽和して1本目が実行待ちの間はヘッジしない
+    monkeypatch.setattr(server, "PRICING_HEDGE_DELAY_MS", "20")
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(server, "get_hedge_executor", lambda: executor)
+    release = threading.Event()
+    executor.submit(release.wait)
+
+    result = []
+    caller = threading.Thread(target=lambda: result.append(server.pricing_get_products(
+        ServiceCode="AmazonEC2", Filters=[{"Field": "instanceType", "Value": "m5.large"}], MaxResults=1)))
+    caller.start()
+    time.sleep(0.2)
+    assert server._hedge_stats["hedged"] == 0
+    release.set()
+    caller.join(2)
+    executor.shutdown()
+    assert result and result[0]["PriceList"]
+    assert server._hedge_stats["hedged"] == 0
@@ -0,0 +1,88 @@
+"""JSON-RPC 2.0 バッチ処理のテスト"""
+
+import json
+import urllib.request
+
+import server
+
+
+def post(url: str, body, headers: dict = None):
+    request = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"),
+                                     headers={"Content-Type": "application/json", **(headers or {})})
+    with urllib.request.urlopen(request) as response:
+        raw = response.read()
+        return response.status, json.loads(raw) if raw else None
+
+
+def price_call(request_id, instance_type: str) -> dict:
+    return {"jsonrpc": "2.0", "id": request_id, "method": "tools/call",
+            "params": {"name": "get_instance_price", "arguments": {"instance_type": instance_type}}}
+
+
+def test_batch_returns_responses_for_each_request_in_order(pricing):
+    responses = server.handle_rpc_batch([
+        price_call(1, "m5.large"),
+        {"jsonrpc": "2.0", "method": "notifications/initialized"},
+        {"jsonrpc": "2.0", "id": 2, "method": "tools/list"},
+        price_call(3, "c5.xlarge"),
+    ])
+    assert [response["id"] for response in responses] == [1, 2, 3]
+    assert responses[0]["result"]["structuredContent"]["instance_type"] == "m5.large"
+    assert responses[2]["result"]["structuredContent"]["instance_type"] == "c5.xlarge"
+
+
+def test_empty_batch_is_a_single_invalid_request_error():
+    response = server.handle_rpc_batch([])
+    assert response["error"]["code"] == -32600
+
+
+def test_notifications_only_batch_has_no_responses():
+    assert server.handle_rpc_batch([{"jsonrpc": "2.0", "method": "notifications/initialized"}]) == []
+
+
+def test_malformed_entries_fail_individually(pricing):
+    responses = server.handle_rpc_batch([
+        {"jsonrpc": "2.0", "id": 1, "method": 5},
+        {"jsonrpc": "2.0", "id": 2, "method": "tools/list", "params": None},
+        {"jsonrpc": "2.0", "id": 3, "method": "tools/call", "params": {"name": "get_batch_prices", "arguments": None}},
+        "not an object",
+        {"jsonrpc": "2.0", "id": 4, "method": "nope"},
+        {"jsonrpc": "2.0", "id": 5, "method": "tools/list"},
+    ])
+    codes = [(response["id"], response.get("error", {}).get("code")) for response in responses]
+    assert codes == [(1, -32600), (2, -32600), (3, -32602), (None, -32600), (4, -32601), (5, None)]
+
+
+def test_batch_over_http(mcp_url):
+    status, responses = post(mcp_url, [price_call(1, "m5.large"), {"jsonrpc": "2.0", "id": 2, "method": 5}])
+    assert status == 200
+    assert [response["id"] for response in responses] == [1, 2]
+    assert responses[1]["error"]["code"] == -32600
+
+
+def test_notification_only_request_gets_no_content(mcp_url):
+    status, body = post(mcp_url, {"jsonrpc": "2.0", "method": "notifications/initialized"})
+    assert status == 204
+    assert body is None
+
+
+
+def test_initialize_negotiates_a_supported_protocol_version():
+    def negotiate(requested):
+        response = server.handle_rpc_request(
+            {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {"protocolVersion": requested}})
+        return response["result"]["protocolVersion"]
+
+    assert negotiate("2024-11-05") == "2024-11-05"
+    assert negotiate(server.MCP_PROTOCOL_VERSION) == server.MCP_PROTOCOL_VERSION
+    assert negotiate("1999-01-01") == server.MCP_PROTOCOL_VERSION
+
+
+def test_text_content_follows_negotiated_protocol_version(mcp_url):
+    _, legacy = post(mcp_url, price_call(1, "m5.large"))
+    _, older = post(mcp_url, price_call(1, "m5.large"), {"MCP-Protocol-Version": "2024-11-05"})
+    _, current = post(mcp_url, price_call(1, "m5.large"), {"MCP-Protocol-Version": server.MCP_PROTOCOL_VERSION})
+    assert json.loads(legacy["result"]["content"][0]["text"]) == legacy["result"]["structuredContent"]
+    assert json.loads(older["result"]["content"][0]["text"]) == older["result"]["structuredContent"]
+    assert current["result"]["content"] == []
+    assert current["result"]["structuredContent"]["instance_type"] == "m5.large"
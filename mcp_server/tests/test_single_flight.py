@@ -0,0 +1,103 @@
+"""同一キーの同時取得を1回にまとめる SingleFlight のテスト"""
+
+import threading
+import time
+
+import server
+
+
+def wait_until(condition, timeout: float = 2.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def run_concurrently(count: int, target) -> list:
+    results = [None] * count
+
+    def worker(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = server.SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        release.wait()
+        return 42
+
+    threads, results = run_concurrently(8, lambda: flight.do("key", load))
+    wait_until(lambda: flight.coalesced == 7)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [42] * 8
+    assert len(calls) == 1
+
+
+def test_error_is_raised_to_every_waiter_and_not_remembered():
+    flight = server.SingleFlight()
+    release = threading.Event()
+
+    def load():
+        release.wait()
+        raise RuntimeError("Throttling")
+
+    threads, results = run_concurrently(4, lambda: flight.do("key", load))
+    wait_until(lambda: flight.coalesced == 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert all(isinstance(result, RuntimeError) for result in results)
+    # 失敗は保持しないため、次の呼び出しは再実行される
+    assert flight.do("key", lambda: "ok") == "ok"
+
+
+def test_different_keys_do_not_wait_for_each_other():
+    flight = server.SingleFlight()
+    release = threading.Event()
+    threads, _ = run_concurrently(1, lambda: flight.do("slow", lambda: release.wait()))
+    wait_until(lambda: "slow" in flight._calls)
+    assert flight.do("fast", lambda: "done") == "done"
+    release.set()
+    threads[0].join()
+
+
+def test_concurrent_price_misses_call_the_api_once(pricing):
+    pricing.delay = 0.2
+    threads, results = run_concurrently(10, lambda: server.get_ec2_price("m5.large", "ap-northeast-1"))
+    for thread in threads:
+        thread.join()
+    assert len(set(results)) == 1 and results[0] is not None
+    assert pricing.calls == [("AmazonEC2", "m5.large")]
+
+
+def test_concurrent_size_ladder_lookups_build_once(pricing, monkeypatch):
+    builds = []
+    original = server.list_instance_types
+
+    def list_types(service, region):
+        builds.append((service, region))
+        time.sleep(0.05)
+        return original(service, region)
+
+    monkeypatch.setattr(server, "list_instance_types", list_types)
+    threads, results = run_concurrently(5, lambda: server.get_available_sizes("m5", "ec2", "ap-northeast-1"))
+    for thread in threads:
+        thread.join()
+    assert builds == [("ec2", "ap-northeast-1")]
+    assert all(result == results[0] for result in results)
+    assert "large" in results[0]
+
@@ -0,0 +1,55 @@
+"""tools/call のSSEストリーミング応答のテスト"""
+
+import json
+import urllib.request
+
+INSTANCES = [
+    {"name": "web-1", "instance_type": "m5.4xlarge", "cpu_avg_max": 10},
+    {"name": "db-1", "instance_type": "db.r6g.2xlarge", "cpu_avg_max": 20, "service": "rds"},
+    {"name": "web-2", "instance_type": "m5.4xlarge", "cpu_avg_max": 10},
+    {"name": "app-1", "instance_type": "t3.large", "cpu_avg_max": 55},
+]
+
+
+def call(url: str, arguments: dict, stream: bool):
+    params = {"name": "get_batch_recommendations", "arguments": arguments}
+    if stream:
+        params["_meta"] = {"progressToken": "token-1"}
+    request = urllib.request.Request(
+        url, data=json.dumps({"jsonrpc": "2.0", "id": 1, "method": "tools/call", "params": params}).encode("utf-8"),
+        headers={"Content-Type": "application/json", "Accept": "application/json, text/event-stream",
+                 "MCP-Protocol-Version": "2025-06-18"})
+    with urllib.request.urlopen(request) as response:
+        return response.headers.get("Content-Type"), response.read().decode("utf-8")
+
+
+def sse_messages(body: str) -> list:
+    return [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+
+
+def test_partial_results_then_final_count(mcp_url):
+    content_type, body = call(mcp_url, {"instances": INSTANCES}, stream=True)
+    assert content_type == "text/event-stream"
+    messages = sse_messages(body)
+    progress, final = messages[:-1], messages[-1]
+
+    assert all(message["method"] == "notifications/progress" for message in progress)
+    assert [message["params"]["progress"] for message in progress] == list(range(1, len(progress) + 1))
+    assert final["id"] == 1
+    assert final["result"]["structuredContent"] == {"streamed": True, "partials": len(progress)}
+
+
+def test_streamed_partials_merge_to_the_plain_result(mcp_url):
+    _, body = call(mcp_url, {"instances": INSTANCES}, stream=True)
+    streamed = [row for message in sse_messages(body)[:-1]
+                for row in message["params"]["partialResult"]["recommendations"]]
+    _, plain = call(mcp_url, {"instances": INSTANCES}, stream=False)
+    expected = json.loads(plain)["result"]["structuredContent"]["recommendations"]
+    assert sorted(streamed, key=lambda row: row["name"]) == sorted(expected, key=lambda row: row["name"])
+
+
+def test_tool_failure_is_reported_in_the_final_response(mcp_url):
+    _, body = call(mcp_url, {}, stream=True)
+    final = sse_messages(body)[-1]
+    assert final["result"]["isError"] is True
+    assert "error" in final["result"]["structuredContent"]
@@ -0,0 +1,68 @@
+"""ベクトル化推奨エンジンとスカラー版の同値性のテスト"""
+
+import random
+
+import pytest
+
+import server
+
+pytest.importorskip("numpy")
+
+REGION = "ap-northeast-1"
+FAMILIES = ["t3", "m5", "c5", "r6g", "db.t3", "db.r6g", "cache.t3", "cache.r6g", "x9z"]
+SIZES = server.SIZE_ORDER + ["bogus", "metal"]
+
+
+def _service(family: str) -> str:
+    if family.startswith("db."):
+        return "rds"
+    if family.startswith("cache."):
+        return "elasticache"
+    return "ec2"
+
+
+def _rows(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        family = rng.choice(FAMILIES)
+        cpu = rng.choice([None, round(rng.uniform(0, 100), 2), round(rng.uniform(0, 40), 2), 39.996, 10.0, 5.0])
+        rows.append((f"{family}.{rng.choice(SIZES)}", cpu, _service(family)))
+    return rows
+
+
+def _scalar(rows: list) -> list:
+    return [server.calculate_scale_down_recommendation(t, cpu, REGION, service) for t, cpu, service in rows]
+
+
+def test_vectorized_matches_scalar(pricing):
+    rows = _rows(1500, seed=1)
+    assert server.calculate_scale_down_recommendations_vectorized(rows, REGION) == _scalar(rows)
+
+
+def test_vectorized_matches_scalar_for_burstable_credit_limits(pricing):
+    # T系は全サイズ2vCPUが多く、ベースライン（CPUクレジット）で候補が決まる
+    rows = [(f"t3.{size}", cpu, "ec2") for size in ("large", "xlarge", "2xlarge") for cpu in (3, 9, 15, 25, 35)]
+    assert server.calculate_scale_down_recommendations_vectorized(rows, REGION) == _scalar(rows)
+
+
+def test_vectorized_does_not_price_more_sizes_than_scalar(pricing):
+    rows = [(f"{family}.{size}", cpu, "ec2")
+            for family in ("m5", "c5", "r6g") for size in ("24xlarge", "16xlarge", "8xlarge") for cpu in (12, 25, 38)]
+    server.calculate_scale_down_recommendations_vectorized(rows, REGION)
+    vectorized_calls = {call for call in pricing.calls}
+
+    server._price_cache.clear()
+    pricing.calls.clear()
+    _scalar(rows)
+    scalar_calls = {call for call in pricing.calls}
+    assert vectorized_calls <= scalar_calls
+
+
+def test_batch_results_do_not_depend_on_engine(pricing, monkeypatch):
+    instances = [{"name": f"n{i}", "instance_type": t, "cpu_avg_max": cpu, "service": service}
+                 for i, (t, cpu, service) in enumerate(_rows(300, seed=2))]
+    monkeypatch.setattr(server, "VECTORIZE_MIN_BATCH", 10 ** 9)
+    scalar = server.get_batch_recommendations(instances)
+    monkeypatch.setattr(server, "VECTORIZE_MIN_BATCH", 1)
+    assert server.get_batch_recommendations(instances) == scalar
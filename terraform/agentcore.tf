@@ -60,7 +60,9 @@ resource "aws_iam_role_policy" "agentcore_policy" {
           # AWS Pricing API
           "pricing:GetProducts",
           "pricing:DescribeServices",
-          "pricing:GetAttributeValues"
+          "pricing:GetAttributeValues",
+          # 実在するインスタンスサイズの索引作成
+          "ec2:DescribeInstanceTypes"
         ]
         Resource = "*"
       },
@@ -83,12 +83,34 @@ resource "aws_iam_role_policy" "lambda_resources" {
       {
         Effect = "Allow"
         Action = [
-          # AWS Pricing API（Lambda内で直接呼び出す場合のフォールバック）
+          # AWS Pricing API（PRICING_ENGINE=local で Lambda内から直接呼び出す場合）
           "pricing:GetProducts",
           "pricing:DescribeServices",
-          "pricing:GetAttributeValues"
+          "pricing:GetAttributeValues",
+          # サイズ候補の取得（PRICING_ENGINE=local）
+          "ec2:DescribeInstanceTypes"
         ]
         Resource = "*"
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          # 非同期分析ジョブ（ワーカーの自己呼び出し）
+          "lambda:InvokeFunction"
+        ]
+        Resource = "arn:aws:lambda:${var.aws_region}:${data.aws_caller_identity.current.account_id}:function:${var.project_name}"
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          # 非同期分析ジョブの状態・分析結果キャッシュの保存
+          "s3:GetObject",
+          "s3:PutObject"
+        ]
+        Resource = [
+          "${aws_s3_bucket.jobs.arn}/jobs/*",
+          "${aws_s3_bucket.jobs.arn}/results/*"
+        ]
       }
     ]
   })
@@ -5,10 +5,63 @@ resource "aws_cloudwatch_log_group" "lambda" {
 }
 
 # Lambda関数のZIPファイルを作成
+# MCPサーバーの価格エンジン（server.py）も pricing_engine.py として同梱（PRICING_ENGINE=local で使用）
 data "archive_file" "lambda" {
   type        = "zip"
-  source_dir  = "${path.module}/../lambda_function"
   output_path = "${path.module}/lambda_function.zip"
+
+  source {
+    content  = file("${path.module}/../lambda_function/handler.py")
+    filename = "handler.py"
+  }
+
+  source {
+    content  = file("${path.module}/../mcp_server/server.py")
+    filename = "pricing_engine.py"
+  }
+}
+
+# 非同期分析ジョブの状態・分析結果キャッシュの保存用バケット（1日で削除）
+resource "aws_s3_bucket" "jobs" {
+  bucket = "${var.project_name}-jobs-${data.aws_caller_identity.current.account_id}"
+}
+
+resource "aws_s3_bucket_public_access_block" "jobs" {
+  bucket                  = aws_s3_bucket.jobs.id
+  block_public_acls       = true
+  block_public_policy     = true
+  ignore_public_acls      = true
+  restrict_public_buckets = true
+}
+
+resource "aws_s3_bucket_lifecycle_configuration" "jobs" {
+  bucket = aws_s3_bucket.jobs.id
+
+  rule {
+    id     = "expire-jobs"
+    status = "Enabled"
+
+    filter {
+      prefix = "jobs/"
+    }
+
+    expiration {
+      days = 1
+    }
+  }
+
+  rule {
+    id     = "expire-results"
+    status = "Enabled"
+
+    filter {
+      prefix = "results/"
+    }
+
+    expiration {
+      days = 1
+    }
+  }
 }
 
 # Lambda関数
@@ -27,6 +80,8 @@ resource "aws_lambda_function" "main" {
       AWS_REGION_NAME   = var.aws_region
       BEDROCK_MODEL_ID  = var.bedrock_model_id
       MCP_RUNTIME_ARN   = "arn:aws:bedrock-agentcore:${var.aws_region}:${data.aws_caller_identity.current.account_id}:runtime/infra_cost_reduction_pricing_mcp-M4Abq6BZRK"
+      PRICING_ENGINE    = var.pricing_engine
+      JOB_BUCKET        = aws_s3_bucket.jobs.bucket
     }
   }
 
@@ -36,6 +91,14 @@ resource "aws_lambda_function" "main" {
   ]
 }
 
+# 非同期呼び出し（分析ジョブのワーカー）は再試行しない
+# 再試行すると同じジョブが再実行されイベントが重複するため。失敗・タイムアウトは get_job でエラー扱い
+resource "aws_lambda_function_event_invoke_config" "main" {
+  function_name                = aws_lambda_function.main.function_name
+  maximum_retry_attempts       = 0
+  maximum_event_age_in_seconds = 60
+}
+
 # Lambda Function URL（API Gatewayの代わりにシンプルな構成）
 resource "aws_lambda_function_url" "main" {
   function_name      = aws_lambda_function.main.function_name
@@ -16,3 +16,8 @@ variable "bedrock_model_id" {
   default     = "amazon.nova-lite-v1:0"
 }
 
+variable "pricing_engine" {
+  description = "Where the Lambda runs the pricing engine: agentcore (MCP server) or local (in-process)"
+  type        = string
+  default     = "agentcore"
+}